@@ -0,0 +1,67 @@
+import bisect
+
+
+# Движок достижений. Определения из game_config.json собраны в индекс
+# порогов по статистике, от которой зависит достижение (поле stat):
+# {статистика: (отсортированные пороги, id достижений)}. При изменении
+# статистики проверяются только пороги между старым и новым значением —
+# два бинарных поиска вместо обхода всех достижений.
+
+# Статистики по снимку игрока (player_cache.load_snapshot) или по уровням покупок (app.load_levels)
+STATS = {
+    'total_clicks': lambda state: state.get('total_clicks') or 0,
+    'total_earned': lambda state: state.get('total_earned') or 0,
+    'current_grade': lambda state: state.get('current_grade') or 0,
+    'upgrades': lambda state: sum((state.get('upgrades') or {}).values()),
+    'autoclickers': lambda state: sum(item['quantity'] for item in (state.get('autoclickers') or {}).values()),
+    'daily_streak': lambda state: state.get('daily_streak') or 0
+}
+
+# Статистики, которые совпадают с колонками players и меняются сохранениями
+FIELD_STATS = ('total_clicks', 'total_earned', 'current_grade')
+
+
+class AchievementIndex:
+    def __init__(self, definitions):
+        self.definitions = {definition['id']: definition for definition in definitions}
+        self._thresholds = {}
+        for definition in sorted(definitions, key=lambda d: d['target']):
+            if definition['stat'] not in STATS:
+                raise ValueError(f"Неизвестная статистика достижения {definition['id']}: {definition['stat']}")
+            targets, ids = self._thresholds.setdefault(definition['stat'], ([], []))
+            targets.append(definition['target'])
+            ids.append(definition['id'])
+
+    def stats(self, state):
+        return {stat: STATS[stat](state) for stat in self._thresholds}
+
+    # id достижений, чей порог пройден при переходе before -> after ({статистика: значение});
+    # статистики, которых нет в before, считаются нулевыми
+    def crossed(self, before, after):
+        result = []
+        for stat, value in after.items():
+            entry = self._thresholds.get(stat)
+            old = before.get(stat, 0)
+            if entry is None or value <= old:
+                continue
+            targets, ids = entry
+            result.extend(ids[bisect.bisect_right(targets, old):bisect.bisect_right(targets, value)])
+        return result
+
+    # Прогресс всех достижений для ответа клиенту: achievements — строки из снимка
+    def progress(self, state, achievements):
+        values = self.stats(state)
+        result = {}
+        for ach_id, definition in self.definitions.items():
+            completed = (achievements.get(ach_id) or {}).get('completed') or 0
+            result[ach_id] = {
+                'progress': definition['target'] if completed else min(values[definition['stat']], definition['target']),
+                'completed': completed
+            }
+        return result
+
+    def metrics(self):
+        return {
+            'achievements': len(self.definitions),
+            'stats': len(self._thresholds)
+        }
@@ -1,134 +1,543 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory, g, has_app_context
+import gzip
 import os
+import sys
+import signal
+import threading
+import time
 import sqlite3
 import random
 import math
-from datetime import datetime, timedelta
+from werkzeug.middleware.proxy_fix import ProxyFix
+from save_buffer import SaveBuffer
+from db_pool import ConnectionPool
+from player_cache import PlayerCache, load_snapshot
+from leaderboard import CATEGORIES, RankedLeaderboard, total_score
+import achievements
+import assets
+import backup
+import boosts
+import economy
+import clicks
+import daily
+import images
+import metrics
+import migrations
+import player_dump
+import push
+import ratelimit
+import registry
+import shards
 
-app = Flask(__name__)
+# Встроенный маршрут /static выключен: статику отдает serve_static через конвейер assets.py
+app = Flask(__name__, static_folder=None)
+# За обратным прокси (Render) remote_addr — адрес прокси: адрес клиента берется
+# из X-Forwarded-For, которому доверяем на PROXY_HOPS прокси
+PROXY_HOPS = int(os.environ.get('PROXY_HOPS', 0))
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
 
 # Настройка путей
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, 'static')
-DB_FILE = os.path.join(BASE_DIR, 'coin_clicker.db')
+# В шардированном режиме (launcher.py) воркер открывает только файл своего шарда
+DB_FILE = shards.shard_path(os.environ.get('DB_FILE', os.path.join(BASE_DIR, 'coin_clicker.db')))
 
 os.makedirs(os.path.join(STATIC_DIR, 'css'), exist_ok=True)
 os.makedirs(os.path.join(STATIC_DIR, 'js'), exist_ok=True)
 os.makedirs(os.path.join(STATIC_DIR, 'images'), exist_ok=True)
 
-# Инициализация базы данных
+# Пул долгоживущих соединений (WAL, настраиваемый synchronous)
+db_pool = ConnectionPool(
+    DB_FILE,
+    size=int(os.environ.get('DB_POOL_SIZE', 8)),
+    synchronous=os.environ.get('DB_SYNCHRONOUS', 'NORMAL'),
+    mmap_size=int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024)),
+    cache_size=int(os.environ.get('DB_CACHE_SIZE', -16000)),
+    busy_timeout=int(os.environ.get('DB_BUSY_TIMEOUT', 5000))
+)
+
+def get_db():
+    conn = db_pool.checkout()
+    # Запоминаем соединение, чтобы вернуть его в пул даже при исключении в обработчике
+    if has_app_context():
+        g.setdefault('db_connections', []).append(conn)
+    return conn
+
+@app.teardown_appcontext
+def release_db(exc):
+    for conn in g.pop('db_connections', []):
+        conn.close()
+
+# Все записи в базу идут через run_write(fn): fn(conn) выполняет запросы без commit,
+# транзакцией управляет исполнитель. По умолчанию — соединение из пула,
+# в ASGI-режиме (asgi.py) — единый писатель с групповыми коммитами.
+def pooled_write(fn):
+    conn = db_pool.checkout()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        result = fn(conn)
+        conn.commit()
+        return result
+    finally:
+        conn.close()
+
+write_executor = pooled_write
+# AsyncWriter из db_writer.py, если приложение запущено через asgi.py
+db_writer = None
+
+# Длительность записей идет в планировщик снимков: задержки сохранений во время снимка
+def run_write(fn):
+    started = time.perf_counter()
+    try:
+        return write_executor(fn)
+    finally:
+        backup_scheduler.observe_write(time.perf_counter() - started)
+
+# Снимки базы (backup.py) в BACKUP_DIR раз в BACKUP_INTERVAL секунд (0 — только
+# по /admin/backup). BACKUP_RESTORE=latest или путь к снимку — восстановить
+# отсутствующую базу при старте, до миграций.
+BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join(BASE_DIR, 'backups'))
+BACKUP_INTERVAL = float(os.environ.get('BACKUP_INTERVAL', 3600))
+if os.environ.get('BACKUP_RESTORE'):
+    backup.restore_at_startup(DB_FILE, os.environ['BACKUP_RESTORE'], BACKUP_DIR)
+
+backup_scheduler = backup.BackupScheduler(
+    DB_FILE,
+    BACKUP_DIR,
+    keep=int(os.environ.get('BACKUP_KEEP', backup.KEEP)),
+    step_pages=int(os.environ.get('BACKUP_STEP_PAGES', backup.STEP_PAGES)),
+    step_sleep=float(os.environ.get('BACKUP_STEP_SLEEP', backup.STEP_SLEEP))
+)
+
+# Инициализация базы данных: схема создается и обновляется миграциями (migrations.py)
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Игроки
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS players (
-        player_id TEXT PRIMARY KEY,
-        username TEXT,
-        coins REAL DEFAULT 0,
-        gems INTEGER DEFAULT 10,
-        tokens INTEGER DEFAULT 0,
-        total_clicks INTEGER DEFAULT 0,
-        total_earned REAL DEFAULT 0,
-        current_grade INTEGER DEFAULT 0,
-        grade_progress REAL DEFAULT 0,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Улучшения
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS upgrades (
-        player_id TEXT,
-        upgrade_id TEXT,
-        level INTEGER DEFAULT 0,
-        purchased_at TIMESTAMP,
-        PRIMARY KEY (player_id, upgrade_id)
-    )
-    ''')
-    
-    # Автокликеры
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS autoclickers (
-        player_id TEXT,
-        clicker_id TEXT,
-        quantity INTEGER DEFAULT 0,
-        level INTEGER DEFAULT 1,
-        purchased_at TIMESTAMP,
-        PRIMARY KEY (player_id, clicker_id)
-    )
-    ''')
-    
-    # Здания
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS buildings (
-        player_id TEXT,
-        building_id TEXT,
-        quantity INTEGER DEFAULT 0,
-        level INTEGER DEFAULT 1,
-        purchased_at TIMESTAMP,
-        PRIMARY KEY (player_id, building_id)
-    )
-    ''')
-    
-    # Достижения
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS achievements (
-        player_id TEXT,
-        achievement_id TEXT,
-        progress REAL DEFAULT 0,
-        completed BOOLEAN DEFAULT 0,
-        completed_at TIMESTAMP,
-        PRIMARY KEY (player_id, achievement_id)
-    )
-    ''')
-    
-    # Ежедневные награды
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS daily_rewards (
-        player_id TEXT,
-        day INTEGER DEFAULT 1,
-        claimed_at TIMESTAMP,
-        streak INTEGER DEFAULT 1,
-        PRIMARY KEY (player_id, day)
-    )
-    ''')
-    
-    # Лидерборд
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS leaderboard (
-        player_id TEXT PRIMARY KEY,
-        username TEXT,
-        total_score REAL DEFAULT 0,
-        coins_score REAL DEFAULT 0,
-        grade_score INTEGER DEFAULT 0,
-        achievements_score INTEGER DEFAULT 0,
-        last_update TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )
-    ''')
-    
-    # Активные бусты
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS active_boosts (
-        player_id TEXT,
-        boost_id TEXT,
-        multiplier REAL DEFAULT 1.0,
-        ends_at TIMESTAMP,
-        PRIMARY KEY (player_id, boost_id)
-    )
-    ''')
+    migrations.migrate(DB_FILE)
+
+init_db()
+
+if BACKUP_INTERVAL > 0:
+    backup_scheduler.start(BACKUP_INTERVAL)
+
+def utc_timestamp():
+    # Время в базе хранится целыми epoch-секундами (миграция compact_layout)
+    return int(time.time())
+
+# Поля сохранения от клиента. Баланс и статистику ведет сервер: клики — только
+# через /api/clicks (или окна clicks в сохранении), пассивный доход — досчет
+# с last_active, покупки и награды — маршруты через write_balance; счетчик
+# достижений для лидерборда (achievements_completed) — движок достижений в commit_save
+SAVE_FIELDS = ('username',)
+# Баланс и статистика в ответах сохранения и кликов
+BALANCE_FIELDS = ('coins', 'gems', 'tokens', 'total_clicks', 'total_earned', 'current_grade', 'grade_progress')
+PLAYER_COLUMNS = ('username', 'coins', 'gems', 'tokens', 'total_clicks', 'total_earned',
+                  'current_grade', 'grade_progress', 'revision', 'clicks_until')
+# Поля, от которых зависит лидерборд
+SCORE_FIELDS = ('username', 'coins', 'current_grade', 'achievements_completed', 'total_clicks')
+
+# Запись накопленных сохранений одной транзакцией.
+# Пишутся только затронутые колонки и строки достижений.
+def write_saves(batch):
+    players_rows = {}
+    leaderboard_rows = []
+    achievement_rows = []
     
-    conn.commit()
+    for player_id, save in batch.items():
+        columns = tuple(column for column in PLAYER_COLUMNS if column in save['fields'])
+        row = tuple(save['fields'][column] for column in columns) + (save['saved_at'], player_id)
+        players_rows.setdefault(columns, []).append(row)
+        
+        if save['leaderboard']:
+            leaderboard_rows.append((player_id,) + save['leaderboard'])
+        
+        for ach_id, ach_data in save['achievements'].items():
+            achievement_rows.append((player_id, ach_id, ach_data['progress'], ach_data['completed'], ach_data['completed_at']))
+    
+    def write(conn):
+        cursor = conn.cursor()
+        # Одно UPDATE на каждый набор изменившихся колонок
+        for columns, rows in players_rows.items():
+            assignments = ''.join(f'{column} = ?, ' for column in columns)
+            cursor.executemany(f'UPDATE players SET {assignments}last_active = ? WHERE player_id = ?', rows)
+        
+        cursor.executemany('''
+            INSERT OR REPLACE INTO leaderboard 
+            (player_id, username, total_score, coins_score, grade_score, achievements_score)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', leaderboard_rows)
+        
+        # Только разблокировки: прогресс не пишется, он считается из статистик
+        cursor.executemany('''
+            INSERT INTO achievements (player_id, achievement_id, progress, completed, completed_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (player_id, achievement_id) DO UPDATE SET
+                progress = excluded.progress,
+                completed = excluded.completed,
+                completed_at = COALESCE(completed_at, excluded.completed_at)
+        ''', achievement_rows)
+    
+    run_write(write)
+
+# Слияние двух несброшенных сохранений одного игрока: более новые поля побеждают
+def merge_saves(old, new):
+    return {
+        'fields': {**old['fields'], **new['fields']},
+        'achievements': {**old['achievements'], **new['achievements']},
+        'leaderboard': new['leaderboard'] or old['leaderboard'],
+        'saved_at': new['saved_at']
+    }
+
+# Буфер отложенной записи для /api/save
+save_buffer = SaveBuffer(
+    write_saves,
+    interval=float(os.environ.get('SAVE_FLUSH_INTERVAL', 1.0)),
+    max_dirty=int(os.environ.get('SAVE_FLUSH_MAX_DIRTY', 500)),
+    merge_fn=merge_saves
+)
+save_buffer.start()
+
+# Лидерборд в памяти: загружается из таблицы и обновляется при каждом сохранении
+leaderboard = RankedLeaderboard()
+with db_pool.connection() as conn:
+    leaderboard.load(conn)
+leaderboard.start_persist(run_write, interval=float(os.environ.get('LEADERBOARD_PERSIST_INTERVAL', 60)))
+
+# Push-канал (/api/events): события игроков, диффы топа и число игроков онлайн.
+# В шардированном режиме топ сливает launcher, поэтому диффы топа выключены.
+push_hub = push.PushHub(
+    top=(lambda category: leaderboard.top(category, 100)) if shards.SHARD_COUNT <= 1 else None,
+    categories=CATEGORIES,
+    leaderboard_interval=float(os.environ.get('PUSH_LEADERBOARD_INTERVAL', 2))
+)
+
+# Активные бусты в памяти: множитель игрока без запроса к базе. Фоновый поток
+# публикует окончания бустов и раз в BOOST_SWEEP_INTERVAL удаляет истекшие строки.
+boost_timeline = boosts.BoostTimeline()
+with db_pool.connection() as conn:
+    boost_timeline.load(conn)
+boost_timeline.start(
+    run_write,
+    on_expire=lambda player_id, boost_id, ends_at: push_hub.publish(
+        player_id, 'boost', {'boost_id': boost_id, 'ends_at': ends_at, 'active': False}
+    ),
+    sweep_interval=float(os.environ.get('BOOST_SWEEP_INTERVAL', 60)),
+    batch=int(os.environ.get('BOOST_SWEEP_BATCH', 500))
+)
+
+# Определения игры (game_config.json) с таблицами цен; клиенту — через /api/config
+game_registry = registry.Registry(economy.CONFIG)
+# Индекс порогов достижений по статистикам
+achievement_index = achievements.AchievementIndex(economy.CONFIG['achievements'])
+
+# Кэш состояния игроков
+player_cache = PlayerCache(
+    max_size=int(os.environ.get('PLAYER_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('PLAYER_CACHE_TTL', 30))
+)
+
+# Токен служебных маршрутов (/metrics/profile, /admin/*); без него они закрыты
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Инструментирование маршрутов и SQLite, экспорт в /metrics (METRICS_ENABLED=0 — выключить)
+if os.environ.get('METRICS_ENABLED', '1') != '0':
+    metrics.init_app(app, collectors=[
+        lambda: metrics.numeric_gauges('coin_db_pool', db_pool.metrics()),
+        lambda: metrics.numeric_gauges('coin_save_buffer', dict(save_buffer.stats, dirty=save_buffer.dirty_count())),
+        lambda: metrics.numeric_gauges('coin_player_cache', player_cache.metrics()),
+        lambda: metrics.numeric_gauges('coin_clicks', click_counters.metrics()),
+        lambda: metrics.numeric_gauges('coin_push', push_hub.metrics()),
+        lambda: metrics.numeric_gauges('coin_boosts', boost_timeline.metrics()),
+        lambda: metrics.numeric_gauges('coin_backup', backup_scheduler.metrics()),
+        lambda: metrics.numeric_gauges('coin_rate_limit', rate_limiter.metrics()),
+        lambda: metrics.numeric_gauges('coin_db_admission', db_admission.metrics()),
+        lambda: metrics.numeric_gauges('coin_db_writer', db_writer.metrics()) if db_writer else [],
+        lambda: [('coin_leaderboard_players', (), len(leaderboard))]
+    ], admin_token=ADMIN_TOKEN)
+
+# Допуск запросов (ratelimit.py): корзины токенов по игроку для групп маршрутов
+# и общий лимит одновременных запросов к базе — лишние запросы получают 429/503
+# с Retry-After, а не встают в очередь. RATE_LIMITS="save=2:20,clicks=1:10"
+# переопределяет лимиты групп (токенов в секунду:емкость), RATE_LIMIT_ENABLED=0 — выключить.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+RATE_GROUPS = {
+    'get_player': 'session',
+    'start_session': 'session',
+    'save_game': 'save',
+    'ingest_click_batch': 'clicks',
+    'buy_upgrade': 'purchase',
+    'buy_batch': 'purchase',
+    'activate_boost': 'purchase',
+    'claim_daily': 'purchase',
+    'get_leaderboard': 'leaderboard',
+    'get_leaderboard_rank': 'leaderboard'
+}
+# Группы, которые загружают игрока из базы и пишут в нее. Лимит по умолчанию —
+# 4 соединения пула на запрос: на нормальной нагрузке (и при 32 потоках asgi.py)
+# запросы не сбрасываются, а очередь ожидания соединения остается короткой
+DB_GROUPS = {'session', 'save', 'clicks', 'purchase'}
+rate_limiter = ratelimit.TokenBuckets(
+    ratelimit.parse_limits(os.environ.get('RATE_LIMITS')),
+    max_keys=int(os.environ.get('RATE_LIMIT_KEYS', ratelimit.MAX_KEYS))
+)
+db_admission = ratelimit.ConcurrencyLimit(int(os.environ.get('DB_MAX_CONCURRENCY', 4 * db_pool.size)))
+
+def request_player_id():
+    if request.view_args and 'player_id' in request.view_args:
+        return request.view_args['player_id']
+    if request.args.get('player_id'):
+        return request.args['player_id']
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        return data.get('player_id')
+    return None
+
+@app.before_request
+def admit_request():
+    group = RATE_GROUPS.get(request.endpoint)
+    if group is None or not RATE_LIMIT_ENABLED:
+        return None
+    # В шардированном режиме лидерборд у воркера запрашивает launcher (слияние
+    # топов всех шардов) — частоту клиентов ограничивает он сам
+    if group == 'leaderboard' and shards.SHARD_COUNT > 1:
+        return None
+    
+    # Лидерборд не привязан к игроку: player_id в запросе задает сам клиент,
+    # и ключ по нему обходился бы сменой параметра — ограничиваем по адресу
+    key = request.remote_addr if group == 'leaderboard' else request_player_id() or request.remote_addr
+    retry_after = rate_limiter.take(group, key)
+    if retry_after:
+        return ratelimit.rejection(retry_after)
+    if group in DB_GROUPS:
+        if not db_admission.acquire():
+            return ratelimit.rejection(1, 503, 'Сервер перегружен, повторите позже')
+        g.db_admitted = True
+    return None
+
+@app.teardown_request
+def release_admission(exc):
+    if g.pop('db_admitted', False):
+        db_admission.release()
+
+# Меньшие перерывы в игре не пересчитываем на сервере
+OFFLINE_MIN_SECONDS = float(os.environ.get('OFFLINE_MIN_SECONDS', 5))
+
+# Блокировки сохранений по игрокам (проверка ревизии + применение атомарны)
+save_locks = [threading.Lock() for _ in range(64)]
+
+def save_lock(player_id):
+    return save_locks[hash(player_id) % len(save_locks)]
+
+# Накладывает сохранение на снимок игрока, не изменяя исходный снимок
+def apply_save(snapshot, save):
+    data = dict(snapshot)
+    data.update(save['fields'])
+    data['last_active'] = save['saved_at']
+    
+    if save['achievements']:
+        achievements = dict(data['achievements'])
+        for ach_id, ach_data in save['achievements'].items():
+            achievements[ach_id] = {'progress': ach_data['progress'], 'completed': ach_data['completed']}
+        data['achievements'] = achievements
+    return data
+
+def load_player(player_id):
+    # Несброшенное сохранение берем до чтения базы: сброс между ними уже
+    # записал бы его, а get после сброса вернул бы пустоту
+    pending = save_buffer.get(player_id)
+    conn = get_db()
+    snapshot = load_snapshot(conn, player_id)
     conn.close()
+    
+    if snapshot is None:
+        return None
+    
+    # Накладываем еще не сброшенное сохранение
+    if pending:
+        snapshot = apply_save(snapshot, pending)
+    return snapshot
 
-init_db()
+# Строки разблокировки для достижений из ach_ids, которых у игрока еще нет
+def unlock_entries(snapshot, ach_ids, now):
+    return {
+        ach_id: {'progress': achievement_index.definitions[ach_id]['target'], 'completed': 1, 'completed_at': now}
+        for ach_id in ach_ids
+        if not (snapshot['achievements'].get(ach_id) or {}).get('completed')
+    }
 
-def get_db():
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Применяет изменения к снимку: буфер записи, кэш и лидерборд.
+# Разблокировки достижений по статистикам из fields уходят в ту же запись.
+# Вызывается под save_lock(player_id).
+def commit_save(player_id, snapshot, fields, unlocked=()):
+    now = utc_timestamp()
+    before = {stat: snapshot.get(stat) or 0 for stat in achievements.FIELD_STATS if stat in fields}
+    after = {stat: fields[stat] or 0 for stat in before}
+    unlocked = unlock_entries(snapshot, list(unlocked) + achievement_index.crossed(before, after), now)
+    if unlocked:
+        # Награда за достижения — монетами в той же записи
+        reward = sum(achievement_index.definitions[ach_id].get('reward', 0) for ach_id in unlocked)
+        fields = dict(
+            fields,
+            coins=fields.get('coins', snapshot['coins']) + reward,
+            achievements_completed=(snapshot['achievements_completed'] or 0) + len(unlocked)
+        )
+    
+    save = {'fields': fields, 'achievements': unlocked, 'leaderboard': None, 'saved_at': now}
+    updated = apply_save(snapshot, save)
+    if any(key in fields for key in SCORE_FIELDS):
+        save['leaderboard'] = (
+            updated['username'],
+            total_score(updated['coins'], updated['current_grade'], updated['achievements_completed'] or 0),
+            updated['coins'],
+            updated['current_grade'],
+            updated['achievements_completed'] or 0
+        )
+    
+    # Кладем в буфер: запись в SQLite произойдет пачкой при следующем сбросе
+    save_buffer.put(player_id, save)
+    player_cache.put(player_id, updated)
+    
+    if save['leaderboard']:
+        username, score, coins, grade, achievements_completed = save['leaderboard']
+        leaderboard.update(
+            player_id,
+            username=username,
+            total_score=score,
+            coins_score=coins,
+            grade_score=grade,
+            achievements_score=achievements_completed,
+            total_clicks=updated['total_clicks'],
+            last_update=save['saved_at']
+        )
+    if unlocked:
+        push_hub.publish(player_id, 'achievement', {'unlocked': list(unlocked)})
+    return updated
+
+# Разблокировка по статистикам, изменившимся вне сохранений (покупки, ежедневная
+# награда): ach_ids — из achievement_index.crossed. Вызывается под save_lock(player_id).
+def unlock_achievements(player_id, ach_ids):
+    if not ach_ids:
+        return
+    snapshot = player_cache.load(player_id, load_player)
+    if snapshot is not None and unlock_entries(snapshot, ach_ids, 0):
+        commit_save(player_id, snapshot, {}, ach_ids)
+
+# Максимальный темп кликов (в секунду), который принимает /api/clicks
+CLICKS_MAX_RATE = float(os.environ.get('CLICKS_MAX_RATE', 25))
+click_counters = clicks.ClickStats()
+
+# Проверка и начисление пачки кликов. Вызывается под save_lock(player_id);
+# изменения уходят в буфер сохранений и пишутся в базу общей пачкой при сбросе.
+def ingest_clicks(player_id, snapshot, windows):
+    now = time.time()
+    _, crit_chance, _ = economy.click_stats(snapshot['upgrades'])
+    accepted, rejected, clicks_until = clicks.validate_windows(
+        windows, snapshot.get('clicks_until'), int(now * 1000), crit_chance, CLICKS_MAX_RATE
+    )
+    result = {'accepted': len(accepted), 'rejected': rejected, 'clicks': 0, 'gain': 0}
+    
+    if accepted:
+        fields, click_count, gain = clicks.apply_clicks(snapshot, accepted, clicks_until, boost_timeline.active(player_id, now), now)
+        snapshot = commit_save(player_id, snapshot, fields)
+        result.update(clicks=click_count, gain=gain)
+    
+    click_counters.record(len(accepted), rejected, result['clicks'])
+    return snapshot, result
+
+# Пассивный доход с last_active до now: поля для commit_save и сводка начисления
+# (None, если доходить нечему)
+def passive_income(snapshot, now):
+    since = economy.parse_timestamp(snapshot['last_active'])
+    cps = economy.base_cps(snapshot['autoclickers'], snapshot['buildings'], snapshot['upgrades'])
+    if cps <= 0 or now <= since:
+        return {}, None
+    
+    boosts = [
+        (boost['multiplier'], boost.get('started_at'), economy.parse_timestamp(boost['ends_at']))
+        for boost in snapshot['boosts'].values() if boost['ends_at']
+    ]
+    settled = economy.settle_income(snapshot, cps, boosts, since, now)
+    # gems тоже: повышение грейда за время отсутствия дает награду самоцветами
+    fields = {key: settled[key] for key in ('coins', 'gems', 'total_earned', 'current_grade', 'grade_progress')}
+    return fields, {'coins': settled['earned'], 'seconds': round(now - since)}
+
+# Офлайн-доход: начисляем пассивный доход с last_active до текущего момента
+def settle_offline(player_id):
+    with save_lock(player_id):
+        snapshot = player_cache.load(player_id, load_player)
+        now = utc_timestamp()
+        if now - economy.parse_timestamp(snapshot['last_active']) < OFFLINE_MIN_SECONDS:
+            return snapshot, None
+        
+        fields, offline = passive_income(snapshot, now)
+        if offline is None:
+            return snapshot, None
+        fields['revision'] = (snapshot['revision'] or 0) + 1
+        return commit_save(player_id, snapshot, fields), offline
+
+# Досчет пассивного дохода перед изменением из маршрута: любая запись через
+# commit_save сдвигает last_active, и доход до этого момента иначе потерялся бы.
+# last_active сдвигается и без дохода — купленные следом автокликеры не должны
+# задним числом приносить доход за время до покупки. Вызывается под save_lock(player_id).
+def settle_passive(player_id, snapshot):
+    fields, _ = passive_income(snapshot, utc_timestamp())
+    return commit_save(player_id, snapshot, fields)
+
+def balance(snapshot):
+    return {key: snapshot[key] for key in BALANCE_FIELDS}
+
+# Прямое изменение coins/gems в базе (покупки, бусты, ежедневная награда).
+# Вызывается под save_lock(player_id): офлайн-досчет и сохранения кладут в буфер
+# абсолютные coins/gems из снимка, и отложенное сохранение, попавшее между
+# сбросом буфера и записью, при следующем сбросе вернуло бы баланс до нее.
+# Перед записью досчитывается пассивный доход с last_active: без досчета цены
+# сверялись бы с балансом на момент последнего обращения игрока.
+def write_balance(player_id, fn):
+    snapshot = player_cache.load(player_id, load_player)
+    if snapshot is not None:
+        settle_passive(player_id, snapshot)
+    save_buffer.flush(player_id)
+    result = run_write(fn)
+    player_cache.invalidate(player_id)
+    return result
+
+def player_response(snapshot):
+    data = dict(snapshot)
+    # В снимке остаются и истекшие, еще не удаленные бусты (нужны для офлайн-дохода)
+    data.pop('boosts')
+    data['achievements'] = achievement_index.progress(snapshot, snapshot['achievements'])
+    data['active_boosts'] = {
+        boost_id: boost['multiplier']
+        for boost_id, boost in boost_timeline.active(snapshot['player_id']).items()
+    }
+    return data
+
+# История получений ежедневных наград (daily_log); DAILY_LOG=0 — только состояние
+DAILY_LOG = os.environ.get('DAILY_LOG', '1') != '0'
+
+def schedule_daily(player_id, status):
+    if not status['available']:
+        push_hub.schedule(status['next_at'], player_id, 'daily', {'available': True, 'next_at': status['next_at']})
+
+# Подписка на push-канал: первым событием уходит текущее состояние игрока,
+# дальше — изменения. notify будит поток (Flask) или event loop (asgi.py) соединения.
+def open_stream(player_id, client_id, notify):
+    snapshot = player_cache.load(player_id, load_player)
+    if snapshot is None:
+        return None
+
+    conn = get_db()
+    try:
+        daily_status = daily.status(conn, player_id)
+    finally:
+        conn.close()
+
+    boosts = boost_timeline.active(player_id)
+
+    subscriber = push_hub.subscribe(player_id, client_id, notify)
+    subscriber.send(push.encode('state', {'boosts': boosts, 'daily': daily_status}))
+    subscriber.send(push.encode('online', {'players': push_hub.online()}))
+    schedule_daily(player_id, daily_status)
+    return subscriber
 
 # HTML страница
 HTML_GAME = '''
@@ -402,69 +811,63 @@ HTML_GAME = '''
                     game.updateLeaderboard(this.dataset.filter);
                 });
             });
-            
-            // Инициализация игры
-            game.init();
+            // Игра инициализируется один раз — в конструкторе CoinClickerGame
         });
     </script>
 </body>
 </html>
 '''
 
+# Конвейер статики (assets.py): минифицированные, заранее сжатые файлы с хешем
+# в имени и страница со ссылками на них. ASSETS_PIPELINE=0 — отдавать static/ как есть
+# Версия определений игры в странице: клиент берет их из localStorage или /api/config?v=<версия>
+GAME_PAGE = HTML_GAME.replace('<head>', f'<head>\n    <meta name="config-version" content="{game_registry.version}">', 1)
+
+asset_pipeline = None
+index_page = None
+if os.environ.get('ASSETS_PIPELINE', '1') != '0':
+    asset_pipeline = assets.AssetPipeline(STATIC_DIR)
+    asset_pipeline.build()
+    index_page = asset_pipeline.page(GAME_PAGE)
+
+# Адаптивные варианты картинок (python images.py build): выбор по Accept и ширине
+image_variants = images.VariantSelector(images.load_manifest(STATIC_DIR))
+
 @app.route('/')
 def index():
-    return HTML_GAME
+    if index_page is None:
+        response = app.make_response(GAME_PAGE)
+    else:
+        response = assets.respond(index_page, assets.REVALIDATE_CACHE)
+    # Просим браузер присылать ширину картинки (Sec-CH-Width) — по ней выбирается вариант
+    response.headers['Accept-CH'] = 'Sec-CH-Width, Width'
+    return response
 
-@app.route('/api/player/<player_id>')
-def get_player(player_id):
-    conn = get_db()
-    player = conn.execute('SELECT * FROM players WHERE player_id = ?', (player_id,)).fetchone()
-    
-    if player:
-        data = dict(player)
-        
-        # Получаем улучшения
-        upgrades = conn.execute('SELECT upgrade_id, level FROM upgrades WHERE player_id = ?', (player_id,)).fetchall()
-        data['upgrades'] = {u['upgrade_id']: u['level'] for u in upgrades}
-        
-        # Получаем автокликеры
-        autoclickers = conn.execute('SELECT clicker_id, quantity, level FROM autoclickers WHERE player_id = ?', (player_id,)).fetchall()
-        data['autoclickers'] = {a['clicker_id']: {'quantity': a['quantity'], 'level': a['level']} for a in autoclickers}
-        
-        # Получаем здания
-        buildings = conn.execute('SELECT building_id, quantity, level FROM buildings WHERE player_id = ?', (player_id,)).fetchall()
-        data['buildings'] = {b['building_id']: {'quantity': b['quantity'], 'level': b['level']} for b in buildings}
-        
-        # Получаем достижения
-        achievements = conn.execute('SELECT achievement_id, progress, completed FROM achievements WHERE player_id = ?', (player_id,)).fetchall()
-        data['achievements'] = {a['achievement_id']: {'progress': a['progress'], 'completed': a['completed']} for a in achievements}
-        
-        # Получаем активные бусты
-        boosts = conn.execute('SELECT boost_id, multiplier FROM active_boosts WHERE player_id = ? AND ends_at > CURRENT_TIMESTAMP', (player_id,)).fetchall()
-        data['active_boosts'] = {b['boost_id']: b['multiplier'] for b in boosts}
-        
-        conn.close()
-        return jsonify(data)
+@app.route('/api/config')
+def game_config():
+    return game_registry.respond(request.args.get('v'))
+
+# Состояние игрока для /api/player и /api/session. Новый игрок создается
+# одной вставкой: строки достижений появляются только при разблокировке
+def session_player(player_id, username='Игрок'):
+    if player_cache.load(player_id, load_player):
+        snapshot, offline = settle_offline(player_id)
+        # Пороги, пройденные до движка достижений или без сохранения, — при входе
+        with save_lock(player_id):
+            unlock_achievements(player_id, achievement_index.crossed({}, achievement_index.stats(snapshot)))
+            snapshot = player_cache.load(player_id, load_player)
+        data = player_response(snapshot)
+        if offline:
+            data['offline_earnings'] = offline
+        return data
     
-    # Создаем нового игрока
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO players (player_id, username, coins, gems, tokens)
+    run_write(lambda conn: conn.execute('''
+        INSERT OR IGNORE INTO players (player_id, username, coins, gems, tokens)
         VALUES (?, ?, 0, 10, 0)
-    ''', (player_id, 'Игрок'))
-    
-    # Создаем базовые достижения
-    base_achievements = [
-        'first_click', 'first_100_coins', 'first_upgrade',
-        'first_autoclicker', 'grade_1', 'daily_streak_3'
-    ]
-    for ach_id in base_achievements:
-        cursor.execute('INSERT OR IGNORE INTO achievements (player_id, achievement_id) VALUES (?, ?)', (player_id, ach_id))
-    
-    conn.commit()
-    conn.close()
+    ''', (player_id, username)))
     
-    return jsonify({
+    return {
+        'username': username,
         'coins': 0,
         'gems': 10,
         'tokens': 0,
@@ -472,317 +875,507 @@ def get_player(player_id):
         'total_earned': 0,
         'current_grade': 0,
         'grade_progress': 0,
+        'revision': 0,
         'upgrades': {},
         'autoclickers': {},
         'buildings': {},
-        'achievements': {},
+        'achievements': achievement_index.progress({}, {}),
         'active_boosts': {}
+    }
+
+@app.route('/api/player/<player_id>')
+def get_player(player_id):
+    return jsonify(session_player(player_id))
+
+# Размер топа в ответе /api/session
+SESSION_TOP = int(os.environ.get('SESSION_TOP', 100))
+
+# Старт сессии одним запросом: состояние игрока, топ лидерборда и место игрока,
+# статус ежедневной награды и время сервера (по нему клиент выравнивает окна кликов)
+@app.route('/api/session/<player_id>')
+def start_session(player_id):
+    category = request.args.get('category', 'total')
+    if category not in CATEGORIES:
+        category = 'total'
+    player = session_player(player_id, request.args.get('username') or 'Игрок')
+    
+    # Как в /api/leaderboard: пока идут диффы топа — опубликованная версия
+    published = push_hub.board(category)
+    version, top = published if published is not None else (None, leaderboard.top(category, SESSION_TOP))
+    key = leaderboard.key(category, player_id)
+    
+    conn = get_db()
+    try:
+        daily_status = daily.status(conn, player_id)
+    finally:
+        conn.close()
+    
+    return jsonify({
+        'player': player,
+        'leaderboard': {'category': category, 'version': version, 'players': top[:SESSION_TOP]},
+        'rank': {
+            'rank': leaderboard.rank(category, player_id),
+            'total': len(leaderboard),
+            'key': list(key) if key else None
+        },
+        'daily': daily_status,
+        'server_time': time.time()
     })
 
 @app.route('/api/save', methods=['POST'])
 def save_game():
     data = request.json
     player_id = data['player_id']
-    username = data.get('username', 'Игрок')
+    is_delta = 'patch' in data
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Обновляем данные игрока
-    cursor.execute('''
-        UPDATE players SET
-            username = ?,
-            coins = ?,
-            gems = ?,
-            tokens = ?,
-            total_clicks = ?,
-            total_earned = ?,
-            current_grade = ?,
-            grade_progress = ?,
-            last_active = CURRENT_TIMESTAMP
-        WHERE player_id = ?
-    ''', (
-        username,
-        data['coins'],
-        data['gems'],
-        data['tokens'],
-        data['total_clicks'],
-        data['total_earned'],
-        data['current_grade'],
-        data['grade_progress'],
-        player_id
-    ))
-    
-    # Обновляем лидерборд
-    total_score = (
-        data['coins'] / 1000 + 
-        data['current_grade'] * 1000 + 
-        data.get('achievements_completed', 0) * 100
-    )
+    if is_delta:
+        # Дельта: только поля, изменившиеся с подтвержденной ревизии
+        fields = {key: value for key, value in data['patch'].items() if key in SAVE_FIELDS}
+    else:
+        # Полное сохранение (совместимость со старыми клиентами)
+        fields = {key: data[key] for key in SAVE_FIELDS if key in data}
+        fields.setdefault('username', 'Игрок')
     
-    cursor.execute('''
-        INSERT OR REPLACE INTO leaderboard 
-        (player_id, username, total_score, coins_score, grade_score, achievements_score)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (
-        player_id,
-        username,
-        total_score,
-        data['coins'],
-        data['current_grade'],
-        data.get('achievements_completed', 0)
-    ))
-    
-    # Обновляем достижения
-    for ach_id, ach_data in data.get('achievements', {}).items():
-        cursor.execute('''
-            UPDATE achievements SET 
-                progress = ?,
-                completed = ?
-            WHERE player_id = ? AND achievement_id = ?
-        ''', (ach_data.get('progress', 0), ach_data.get('completed', 0), player_id, ach_id))
+    if data.get('clicks'):
+        try:
+            clicks.check_shape(data['clicks'])
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
     
-    conn.commit()
-    conn.close()
+    with save_lock(player_id):
+        snapshot = player_cache.load(player_id, load_player)
+        if snapshot is None:
+            return jsonify({'success': False, 'error': 'Игрок не найден'})
+        
+        # Доход до этого момента и клики, накопленные с прошлой отправки
+        snapshot = settle_passive(player_id, snapshot)
+        click_result = None
+        if data.get('clicks'):
+            snapshot, click_result = ingest_clicks(player_id, snapshot, data['clicks'])
+        
+        revision = snapshot['revision'] or 0
+        if is_delta and (data.get('base_revision') != revision or data.get('revision', 0) <= revision):
+            return jsonify({
+                'success': False,
+                'error': 'stale_revision',
+                'revision': revision,
+                'clicks': click_result,
+                'balance': balance(snapshot)
+            }), 409
+        
+        # Отбрасываем то, что уже совпадает с сохраненным состоянием
+        fields = {key: value for key, value in fields.items() if snapshot.get(key) != value}
+        fields['revision'] = data['revision'] if is_delta else revision + 1
+        # Достижения от клиента не принимаются: их разблокирует commit_save по статистикам
+        snapshot = commit_save(player_id, snapshot, fields)
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'revision': fields['revision'], 'clicks': click_result, 'balance': balance(snapshot)})
 
-@app.route('/api/buy_upgrade', methods=['POST'])
-def buy_upgrade():
+@app.route('/api/clicks', methods=['POST'])
+def ingest_click_batch():
     data = request.json
     player_id = data['player_id']
-    upgrade_id = data['upgrade_id']
-    cost = data['cost']
-    upgrade_type = data.get('type', 'click')
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Проверяем баланс
-    player = cursor.execute('SELECT coins, gems, tokens FROM players WHERE player_id = ?', (player_id,)).fetchone()
+    windows = data.get('windows', [])
+    try:
+        clicks.check_shape(windows)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
-    if not player:
-        conn.close()
-        return jsonify({'success': False, 'error': 'Игрок не найден'})
+    with save_lock(player_id):
+        snapshot = player_cache.load(player_id, load_player)
+        if snapshot is None:
+            return jsonify({'success': False, 'error': 'Игрок не найден'})
+        snapshot = settle_passive(player_id, snapshot)
+        snapshot, result = ingest_clicks(player_id, snapshot, windows)
     
-    # Проверяем валюту
-    currency_needed = {'coins': player['coins'], 'gems': player['gems'], 'tokens': player['tokens']}
+    return jsonify({'success': True, **result, 'balance': balance(snapshot)})
+
+@app.route('/api/buy_upgrade', methods=['POST'])
+def buy_upgrade():
+    data = request.json
+    player_id = data['player_id']
+    # Цена — из реестра по текущему уровню; cost_* из запроса не используются
+    kind = 'upgrade' if data.get('type', 'click') == 'click' else data.get('type')
+    if kind not in PURCHASE_TABLES:
+        return jsonify({'success': False, 'error': 'Неверная покупка'})
     
-    if 'cost_coins' in data and currency_needed['coins'] < data['cost_coins']:
-        conn.close()
-        return jsonify({'success': False, 'error': 'Недостаточно монет'})
+    return jsonify(run_purchases(player_id, {(kind, data['upgrade_id']): 1}, data.get('client_id')))
+
+# Таблицы покупок: (таблица, колонка id, колонка количества)
+PURCHASE_TABLES = {
+    'upgrade': ('upgrades', 'upgrade_id', 'level'),
+    'autoclicker': ('autoclickers', 'clicker_id', 'quantity'),
+    'building': ('buildings', 'building_id', 'quantity')
+}
+MAX_BATCH_PURCHASES = 50
+MAX_PURCHASE_QUANTITY = 1000
+
+def load_levels(conn, player_id):
+    return {
+        'upgrades': {
+            row['upgrade_id']: row['level']
+            for row in conn.execute('SELECT upgrade_id, level FROM upgrades WHERE player_id = ?', (player_id,))
+        },
+        'autoclickers': {
+            row['clicker_id']: {'quantity': row['quantity'], 'level': row['level']}
+            for row in conn.execute('SELECT clicker_id, quantity, level FROM autoclickers WHERE player_id = ?', (player_id,))
+        },
+        'buildings': {
+            row['building_id']: {'quantity': row['quantity'], 'level': row['level']}
+            for row in conn.execute('SELECT building_id, quantity, level FROM buildings WHERE player_id = ?', (player_id,))
+        }
+    }
+
+def owned_count(levels, kind, item_id):
+    if kind == 'upgrade':
+        return levels['upgrades'].get(item_id, 0)
+    item = levels[PURCHASE_TABLES[kind][0]].get(item_id)
+    return item['quantity'] if item else 0
+
+@app.route('/api/buy_batch', methods=['POST'])
+def buy_batch():
+    data = request.json
+    player_id = data['player_id']
+    purchases = data.get('purchases', [])
     
-    if 'cost_gems' in data and currency_needed['gems'] < data['cost_gems']:
-        conn.close()
-        return jsonify({'success': False, 'error': 'Недостаточно самоцветов'})
+    if not purchases or len(purchases) > MAX_BATCH_PURCHASES:
+        return jsonify({'success': False, 'error': 'Неверный список покупок'})
     
-    if 'cost_tokens' in data and currency_needed['tokens'] < data['cost_tokens']:
-        conn.close()
-        return jsonify({'success': False, 'error': 'Недостаточно жетонов'})
+    # Складываем одинаковые покупки
+    wanted = {}
+    for purchase in purchases:
+        kind = 'upgrade' if purchase.get('type') == 'click' else purchase.get('type')
+        quantity = purchase.get('quantity', 1)
+        if kind not in PURCHASE_TABLES or not isinstance(quantity, int) or not 1 <= quantity <= MAX_PURCHASE_QUANTITY:
+            return jsonify({'success': False, 'error': 'Неверная покупка'})
+        key = (kind, purchase['id'])
+        wanted[key] = wanted.get(key, 0) + quantity
     
-    # Списание валюты
-    if 'cost_coins' in data:
-        cursor.execute('UPDATE players SET coins = coins - ? WHERE player_id = ?', (data['cost_coins'], player_id))
+    return jsonify(run_purchases(player_id, wanted, data.get('client_id')))
+
+def run_purchases(player_id, wanted, client_id=None):
+    with save_lock(player_id):
+        result = write_balance(player_id, lambda conn: apply_purchases(conn, player_id, wanted))
+        if result['success']:
+            unlock_achievements(player_id, result['unlocked'])
     
-    if 'cost_gems' in data:
-        cursor.execute('UPDATE players SET gems = gems - ? WHERE player_id = ?', (data['cost_gems'], player_id))
+    if result['success']:
+        push_hub.publish(player_id, 'balance', result['new_balance'], exclude=client_id)
+    return result
+
+def apply_purchases(conn, player_id, wanted):
+    player = conn.execute('SELECT coins, gems, tokens FROM players WHERE player_id = ?', (player_id,)).fetchone()
+    if not player:
+        return {'success': False, 'error': 'Игрок не найден'}
     
-    if 'cost_tokens' in data:
-        cursor.execute('UPDATE players SET tokens = tokens - ? WHERE player_id = ?', (data['cost_tokens'], player_id))
+    levels = load_levels(conn, player_id)
+    balance = {'coins': player['coins'], 'gems': player['gems'], 'tokens': player['tokens']}
     
-    # Добавляем/обновляем улучшение
-    if upgrade_type == 'click':
-        cursor.execute('''
-            INSERT OR REPLACE INTO upgrades (player_id, upgrade_id, level, purchased_at)
-            VALUES (?, ?, COALESCE((SELECT level + 1 FROM upgrades WHERE player_id = ? AND upgrade_id = ?), 1), CURRENT_TIMESTAMP)
-        ''', (player_id, upgrade_id, player_id, upgrade_id))
+    # Цены считаем на сервере, одна проверка баланса на всю пачку
+    total_cost = 0
+    for (kind, item_id), quantity in wanted.items():
+        cost = game_registry.purchase_cost(kind, item_id, owned_count(levels, kind, item_id), quantity)
+        if cost is None:
+            return {'success': False, 'error': f'Неизвестный предмет: {item_id}'}
+        total_cost += cost
     
-    elif upgrade_type == 'autoclicker':
-        cursor.execute('''
-            INSERT OR REPLACE INTO autoclickers (player_id, clicker_id, quantity, purchased_at)
-            VALUES (?, ?, COALESCE((SELECT quantity + 1 FROM autoclickers WHERE player_id = ? AND clicker_id = ?), 1), CURRENT_TIMESTAMP)
-        ''', (player_id, upgrade_id, player_id, upgrade_id))
+    if total_cost - balance['coins'] > 1e-6:
+        return {
+            'success': False,
+            'error': 'Недостаточно монет',
+            'cost': total_cost,
+            'new_balance': balance,
+            'levels': levels
+        }
     
-    elif upgrade_type == 'building':
-        cursor.execute('''
-            INSERT OR REPLACE INTO buildings (player_id, building_id, quantity, purchased_at)
-            VALUES (?, ?, COALESCE((SELECT quantity + 1 FROM buildings WHERE player_id = ? AND building_id = ?), 1), CURRENT_TIMESTAMP)
-        ''', (player_id, upgrade_id, player_id, upgrade_id))
+    conn.execute('UPDATE players SET coins = coins - ? WHERE player_id = ?', (total_cost, player_id))
+    before = achievement_index.stats(levels)
     
-    conn.commit()
+    # Один upsert на таблицу для всех купленных позиций
+    now = utc_timestamp()
+    for kind, (table, id_column, count_column) in PURCHASE_TABLES.items():
+        rows = [(player_id, item_id, quantity, now) for (k, item_id), quantity in wanted.items() if k == kind]
+        if rows:
+            conn.executemany(f'''
+                INSERT INTO {table} (player_id, {id_column}, {count_column}, purchased_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (player_id, {id_column}) DO UPDATE SET
+                    {count_column} = {count_column} + excluded.{count_column},
+                    purchased_at = excluded.purchased_at
+            ''', rows)
     
-    # Получаем обновленные данные
-    player = cursor.execute('SELECT coins, gems, tokens FROM players WHERE player_id = ?', (player_id,)).fetchone()
-    conn.close()
+    for (kind, item_id), quantity in wanted.items():
+        if kind == 'upgrade':
+            levels['upgrades'][item_id] = levels['upgrades'].get(item_id, 0) + quantity
+        else:
+            items = levels[PURCHASE_TABLES[kind][0]]
+            item = items.setdefault(item_id, {'quantity': 0, 'level': 1})
+            item['quantity'] += quantity
     
-    return jsonify({
+    balance['coins'] -= total_cost
+    return {
         'success': True,
-        'new_balance': {
-            'coins': player['coins'],
-            'gems': player['gems'],
-            'tokens': player['tokens']
-        }
-    })
+        'cost': total_cost,
+        'new_balance': balance,
+        'levels': levels,
+        'unlocked': achievement_index.crossed(before, achievement_index.stats(levels))
+    }
 
 @app.route('/api/activate_boost', methods=['POST'])
 def activate_boost():
     data = request.json
     player_id = data['player_id']
     boost_id = data['boost_id']
-    duration = data.get('duration', 300)  # 5 минут по умолчанию
-    multiplier = data.get('multiplier', 2.0)
-    
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Проверяем баланс
-    if data.get('cost_gems'):
-        player = cursor.execute('SELECT gems FROM players WHERE player_id = ?', (player_id,)).fetchone()
-        if player and player['gems'] >= data['cost_gems']:
-            cursor.execute('UPDATE players SET gems = gems - ? WHERE player_id = ?', (data['cost_gems'], player_id))
-        else:
-            conn.close()
-            return jsonify({'success': False, 'error': 'Недостаточно самоцветов'})
+    # Цена, множитель и длительность — из определений, не из запроса
+    boost = game_registry.boosts.get(boost_id)
+    if boost is None:
+        return jsonify({'success': False, 'error': 'Неизвестный буст'})
+    duration = boost['duration']
+    multiplier = boost['multiplier']
+    cost_gems = boost['gems']
     
-    # Добавляем буст
-    ends_at = datetime.now() + timedelta(seconds=duration)
-    cursor.execute('''
-        INSERT OR REPLACE INTO active_boosts (player_id, boost_id, multiplier, ends_at)
-        VALUES (?, ?, ?, ?)
-    ''', (player_id, boost_id, multiplier, ends_at.isoformat()))
-    
-    conn.commit()
-    conn.close()
+    def activate(conn):
+        cursor = conn.cursor()
+        
+        # Проверяем баланс
+        if cost_gems:
+            player = cursor.execute('SELECT gems FROM players WHERE player_id = ?', (player_id,)).fetchone()
+            if player and player['gems'] >= cost_gems:
+                cursor.execute('UPDATE players SET gems = gems - ? WHERE player_id = ?', (cost_gems, player_id))
+            else:
+                return {'success': False, 'error': 'Недостаточно самоцветов'}
+        
+        # Добавляем буст. Заменяемый буст того же вида уже учтен: write_balance
+        # досчитал доход до текущего момента
+        started_at = utc_timestamp()
+        ends_at = started_at + duration
+        cursor.execute('''
+            INSERT OR REPLACE INTO active_boosts (player_id, boost_id, multiplier, started_at, ends_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (player_id, boost_id, multiplier, started_at, ends_at))
+        
+        player = cursor.execute('SELECT coins, gems, tokens FROM players WHERE player_id = ?', (player_id,)).fetchone()
+        return {
+            'success': True,
+            'ends_at': ends_at,
+            'new_balance': {'coins': player['coins'], 'gems': player['gems'], 'tokens': player['tokens']}
+        }
     
-    return jsonify({'success': True, 'ends_at': ends_at.isoformat()})
+    with save_lock(player_id):
+        result = write_balance(player_id, activate)
+        if result['success']:
+            boost_timeline.activate(player_id, boost_id, multiplier, result['ends_at'])
+    if result['success']:
+        push_hub.publish(player_id, 'balance', result['new_balance'], exclude=data.get('client_id'))
+        push_hub.publish(player_id, 'boost', {
+            'boost_id': boost_id, 'multiplier': multiplier, 'ends_at': result['ends_at'], 'active': True
+        })
+    return jsonify(result)
 
 @app.route('/api/claim_daily', methods=['POST'])
 def claim_daily():
     data = request.json
     player_id = data['player_id']
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    # Получаем информацию о ежедневных наградах
-    daily = cursor.execute('SELECT * FROM daily_rewards WHERE player_id = ? ORDER BY day DESC LIMIT 1', (player_id,)).fetchone()
+    def claim(conn):
+        claimed = daily.claim(conn, player_id, utc_timestamp(), log=DAILY_LOG)
+        if claimed is None:
+            return {'success': False, 'error': 'Уже получали сегодня'}
+        
+        # Начисляем награду
+        reward = claimed['reward']
+        cursor = conn.cursor()
+        cursor.execute('UPDATE players SET coins = coins + ?, gems = gems + ?, tokens = tokens + ? WHERE player_id = ?',
+                      (reward['coins'], reward.get('gems', 0), reward.get('tokens', 0), player_id))
+        
+        player = cursor.execute('SELECT coins, gems, tokens FROM players WHERE player_id = ?', (player_id,)).fetchone()
+        return {
+            'success': True,
+            'reward': reward,
+            'day': claimed['day'],
+            'streak': claimed['streak'],
+            'next_at': claimed['next_at'],
+            'unlocked': achievement_index.crossed({'daily_streak': claimed['streak'] - 1}, {'daily_streak': claimed['streak']}),
+            'new_balance': {'coins': player['coins'], 'gems': player['gems'], 'tokens': player['tokens']}
+        }
     
-    now = datetime.now()
-    day_reward = 1
-    streak = 1
+    with save_lock(player_id):
+        result = write_balance(player_id, claim)
+        if result['success']:
+            unlock_achievements(player_id, result['unlocked'])
+    if result['success']:
+        daily_status = {'available': False, 'next_at': result['next_at']}
+        push_hub.publish(player_id, 'balance', result['new_balance'], exclude=data.get('client_id'))
+        push_hub.publish(player_id, 'daily', daily_status)
+        schedule_daily(player_id, daily_status)
+    return jsonify(result)
+
+@app.route('/api/leaderboard/<category>')
+def get_leaderboard(category):
+    # Пока идут диффы топа, отдаем опубликованную версию: клиент держит ее
+    # в кэше и дальше только накладывает диффы из /api/events
+    published = push_hub.board(category)
+    if published is None:
+        return jsonify(leaderboard.top(category, 100))
+    version, entries = published
+    response = jsonify(entries)
+    response.headers['X-Leaderboard-Version'] = str(version)
+    return response
+
+@app.route('/api/leaderboard/<category>/rank/<player_id>')
+def get_leaderboard_rank(category, player_id):
+    key = leaderboard.key(category, player_id)
+    return jsonify({
+        'player_id': player_id,
+        'rank': leaderboard.rank(category, player_id),
+        'total': len(leaderboard),
+        'key': list(key) if key else None
+    })
+
+# Сколько игроков шарда выше ключа — launcher складывает это в сквозное место
+@app.route('/api/leaderboard/<category>/before', methods=['POST'])
+def get_leaderboard_before(category):
+    return jsonify({
+        'before': leaderboard.count_before(category, request.json['key']),
+        'total': len(leaderboard)
+    })
+
+def admin_authorized():
+    return ADMIN_TOKEN and request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+
+# Выгрузка и загрузка игроков (player_dump.py), нужен заголовок X-Admin-Token:
+#   GET  /admin/export?format=columnar  — поток NDJSON из согласованного снимка базы
+#   POST /admin/import                  — тело — выгрузка (Content-Encoding: gzip — сжатая)
+@app.route('/admin/export')
+def admin_export():
+    if not admin_authorized():
+        return jsonify({'success': False, 'error': 'Нет доступа'}), 403
+    fmt = request.args.get('format', 'players')
+    if fmt not in player_dump.FORMATS:
+        return jsonify({'success': False, 'error': 'Неизвестный формат'}), 400
     
-    if daily:
-        last_claim = datetime.fromisoformat(daily['claimed_at'])
-        # Проверяем, прошел ли день
-        if (now - last_claim).days >= 1:
-            if (now - last_claim).days == 1:
-                streak = daily['streak'] + 1
-            else:
-                streak = 1
-            day_reward = daily['day'] + 1 if daily['day'] < 7 else 1
-        else:
+    def stream():
+        # Отдельное соединение: читающая транзакция держится, пока клиент читает поток
+        conn = sqlite3.connect(DB_FILE, isolation_level=None, check_same_thread=False)
+        try:
+            yield from player_dump.export_lines(conn, fmt)
+        finally:
             conn.close()
-            return jsonify({'success': False, 'error': 'Уже получали сегодня'})
-    else:
-        day_reward = 1
-    
-    # Выдаем награду
-    rewards = [
-        {'coins': 100, 'gems': 1},
-        {'coins': 250, 'gems': 2},
-        {'coins': 500, 'gems': 3},
-        {'coins': 1000, 'gems': 5},
-        {'coins': 2500, 'gems': 8},
-        {'coins': 5000, 'gems': 13},
-        {'coins': 10000, 'gems': 21, 'tokens': 1}
-    ]
-    
-    reward = rewards[min(day_reward - 1, 6)]
     
-    # Умножаем за серию
-    if streak > 1:
-        reward['coins'] = int(reward['coins'] * (1 + streak * 0.1))
-        reward['gems'] = int(reward['gems'] * (1 + streak * 0.1))
+    return Response(stream(), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': f'attachment; filename=players-{fmt}.ndjson'
+    })
+
+@app.route('/admin/import', methods=['POST'])
+def admin_import():
+    if not admin_authorized():
+        return jsonify({'success': False, 'error': 'Нет доступа'}), 403
     
-    # Начисляем награду
-    cursor.execute('UPDATE players SET coins = coins + ?, gems = gems + ?, tokens = tokens + ? WHERE player_id = ?',
-                  (reward['coins'], reward.get('gems', 0), reward.get('tokens', 0), player_id))
+    # Отложенные сохранения не должны перезаписать загруженные данные
+    save_buffer.flush()
+    with db_pool.connection() as conn:
+        target = {table: set(player_dump.table_columns(conn, table)) for table in player_dump.TABLES}
     
-    # Записываем факт получения
-    cursor.execute('''
-        INSERT INTO daily_rewards (player_id, day, claimed_at, streak)
-        VALUES (?, ?, ?, ?)
-    ''', (player_id, day_reward, now.isoformat(), streak))
+    def forget(player_ids):
+        for player_id in player_ids:
+            player_cache.invalidate(player_id)
     
-    conn.commit()
-    conn.close()
+    source = request.stream
+    if request.headers.get('Content-Encoding') == 'gzip':
+        source = gzip.GzipFile(fileobj=source)
+    # Пачки меньше, чем в CLI: каждая — транзакция на общем писателе работающего сервера
+    try:
+        stats = player_dump.import_lines(source, run_write, target,
+                                         batch=int(request.args.get('batch', 20000)), on_commit=forget)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
-    return jsonify({
-        'success': True,
-        'reward': reward,
-        'day': day_reward,
-        'streak': streak
-    })
+    # Лидерборд и бусты в памяти перечитываются из базы
+    with db_pool.connection() as conn:
+        leaderboard.load(conn)
+        boost_timeline.load(conn)
+    return jsonify({'success': True, **stats})
 
-@app.route('/api/leaderboard/<category>')
-def get_leaderboard(category):
-    conn = get_db()
+# Внеочередной снимок базы (backup.py), нужен заголовок X-Admin-Token
+@app.route('/admin/backup', methods=['POST'])
+def admin_backup():
+    if not admin_authorized():
+        return jsonify({'success': False, 'error': 'Нет доступа'}), 403
+    try:
+        info = backup_scheduler.snapshot()
+    except (OSError, sqlite3.Error) as e:
+        return jsonify({'success': False, 'error': f'Снимок не создан: {e}'}), 500
+    return jsonify({'success': True, **info})
+
+# Push-канал (Server-Sent Events). В asgi.py этот путь обслуживается
+# в event loop без занятого потока на соединение.
+@app.route('/api/events')
+def push_events():
+    wake = threading.Event()
+    subscriber = open_stream(request.args.get('player_id', ''), request.args.get('client_id'), wake.set)
+    if subscriber is None:
+        return jsonify({'success': False, 'error': 'Игрок не найден'}), 404
     
-    if category == 'total':
-        query = '''
-            SELECT l.*, p.total_clicks 
-            FROM leaderboard l
-            LEFT JOIN players p ON l.player_id = p.player_id
-            ORDER BY l.total_score DESC 
-            LIMIT 100
-        '''
-    elif category == 'coins':
-        query = '''
-            SELECT l.*, p.total_clicks 
-            FROM leaderboard l
-            LEFT JOIN players p ON l.player_id = p.player_id
-            ORDER BY l.coins_score DESC 
-            LIMIT 100
-        '''
-    elif category == 'grade':
-        query = '''
-            SELECT l.*, p.total_clicks 
-            FROM leaderboard l
-            LEFT JOIN players p ON l.player_id = p.player_id
-            ORDER BY l.grade_score DESC, l.total_score DESC 
-            LIMIT 100
-        '''
-    elif category == 'clicks':
-        query = '''
-            SELECT l.*, p.total_clicks 
-            FROM leaderboard l
-            LEFT JOIN players p ON l.player_id = p.player_id
-            ORDER BY p.total_clicks DESC 
-            LIMIT 100
-        '''
-    else:
-        query = '''
-            SELECT l.*, p.total_clicks 
-            FROM leaderboard l
-            LEFT JOIN players p ON l.player_id = p.player_id
-            ORDER BY l.total_score DESC 
-            LIMIT 100
-        '''
-    
-    players = conn.execute(query).fetchall()
-    conn.close()
+    def stream():
+        try:
+            while True:
+                wake.clear()
+                chunk = subscriber.drain()
+                if chunk:
+                    yield chunk
+                if subscriber.closed:
+                    break
+                if not wake.wait(push.KEEPALIVE_SECONDS):
+                    yield push.KEEPALIVE
+        finally:
+            push_hub.unsubscribe(subscriber)
     
-    return jsonify([dict(p) for p in players])
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @app.route('/static/<path:filename>')
 def serve_static(filename):
-    return send_from_directory(STATIC_DIR, filename)
+    vary = ()
+    variant = image_variants.choose(filename, request.headers.get('Accept'), images.width_hint(request))
+    if variant is not None:
+        filename, vary = variant, images.VARY
+    
+    if asset_pipeline is not None:
+        response = asset_pipeline.serve(filename, vary)
+        if response is not None:
+            return response
+    response = send_from_directory(STATIC_DIR, filename)
+    if vary:
+        response.headers['Vary'] = ', '.join(vary)
+    return response
 
 @app.route('/health')
 def health():
-    return jsonify({'status': 'ok'})
+    return jsonify({
+        'status': 'ok',
+        'shard': {'index': shards.SHARD_INDEX, 'count': shards.SHARD_COUNT},
+        'db_pool': db_pool.metrics(),
+        'save_buffer': dict(save_buffer.stats),
+        'player_cache': player_cache.metrics(),
+        'clicks': click_counters.metrics(),
+        'push': push_hub.metrics(),
+        'boosts': boost_timeline.metrics(),
+        'config': game_registry.metrics(),
+        'achievements': achievement_index.metrics(),
+        'backup': backup_scheduler.metrics(),
+        'rate_limit': rate_limiter.metrics(),
+        'db_admission': db_admission.metrics(),
+        'assets': asset_pipeline.stats if asset_pipeline else None,
+        'images': image_variants.metrics(),
+        'db_writer': db_writer.metrics() if db_writer else None
+    })
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 10000))
+    # SIGTERM -> обычный выход, чтобы atexit успел сбросить буфер сохранений
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     print(f"💰 Coin Clicker Master запущен на порту {port}")
-    app.run(host='0.0.0.0', port=port)
+    app.run(host=os.environ.get('HOST', '0.0.0.0'), port=port)
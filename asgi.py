@@ -0,0 +1,229 @@
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import app as app_module
+import push
+from db_pool import ConnectionPool
+from db_writer import AsyncWriter
+
+
+# Асинхронный режим: uvicorn принимает соединения в event loop,
+# обработчики Flask выполняются в пуле потоков, а все записи в базу
+# идут через единственного писателя с групповыми коммитами (db_writer.AsyncWriter).
+#
+#   python asgi.py            или   uvicorn asgi:application --port 10000
+REQUEST_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+WRITER_MAX_BATCH = int(os.environ.get('DB_WRITER_MAX_BATCH', 256))
+# Сколько ждать закрытия соединений при остановке: потоки /api/events сами не завершаются
+SHUTDOWN_TIMEOUT = int(os.environ.get('ASGI_SHUTDOWN_TIMEOUT', 5))
+
+request_executor = ThreadPoolExecutor(max_workers=REQUEST_THREADS, thread_name_prefix='asgi-request')
+
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(len(body))
+    }
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def handle_http(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    environ = build_environ(scope, await read_body(receive))
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    result = await loop.run_in_executor(request_executor, app_module.app, environ, start_response)
+    chunks = iter(result)
+    try:
+        await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+        # Тело отдаем по частям: потоковые ответы не блокируют event loop
+        while True:
+            chunk = await loop.run_in_executor(request_executor, next, chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            await loop.run_in_executor(request_executor, result.close)
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+# /api/events в event loop: соединение ждет событий на asyncio.Event,
+# поток из пула занят только на время подписки
+async def handle_events(scope, receive, send):
+    loop = asyncio.get_running_loop()
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    wake = asyncio.Event()
+    subscriber = await loop.run_in_executor(
+        request_executor, app_module.open_stream,
+        query.get('player_id', [''])[0], query.get('client_id', [None])[0],
+        lambda: loop.call_soon_threadsafe(wake.set)
+    )
+    if subscriber is None:
+        await send({'type': 'http.response.start', 'status': 404,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': json.dumps({'success': False, 'error': 'Игрок не найден'}).encode('utf-8')})
+        return
+
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no')
+        ]})
+        while True:
+            wake.clear()
+            chunk = subscriber.drain()
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if subscriber.closed:
+                break
+            waiter = asyncio.ensure_future(wake.wait())
+            done, _ = await asyncio.wait({waiter, disconnected}, timeout=push.KEEPALIVE_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if disconnected in done:
+                return
+            if not done:
+                await send({'type': 'http.response.body', 'body': push.KEEPALIVE, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    except asyncio.CancelledError:
+        # Остановка сервера по ASGI_SHUTDOWN_TIMEOUT: завершаем поток, клиент переподключится
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        app_module.push_hub.unsubscribe(subscriber)
+
+
+class Lifespan:
+    def __init__(self):
+        self.writer = None
+        self.writable_pool = None
+
+    async def startup(self):
+        self.writer = AsyncWriter(
+            app_module.DB_FILE,
+            max_batch=WRITER_MAX_BATCH,
+            synchronous=os.environ.get('DB_SYNCHRONOUS', 'NORMAL'),
+            busy_timeout=int(os.environ.get('DB_BUSY_TIMEOUT', 5000))
+        )
+        await self.writer.start()
+
+        # Обработчики только читают из пула, запись — через писателя
+        self.writable_pool = app_module.db_pool
+        app_module.db_pool = ConnectionPool(
+            app_module.DB_FILE,
+            size=self.writable_pool.size,
+            synchronous=self.writable_pool.synchronous,
+            mmap_size=self.writable_pool.mmap_size,
+            cache_size=self.writable_pool.cache_size,
+            busy_timeout=self.writable_pool.busy_timeout,
+            read_only=True
+        )
+        app_module.write_executor = self.writer.submit_threadsafe
+        app_module.db_writer = self.writer
+
+    async def shutdown(self):
+        loop = asyncio.get_running_loop()
+        app_module.push_hub.stop()
+        # Остаток буфера сохранений и топ лидерборда — через писателя, пока он работает
+        try:
+            await loop.run_in_executor(request_executor, app_module.save_buffer.flush)
+            await self.writer.submit(lambda conn: app_module.leaderboard.persist_top(conn))
+        except Exception as e:
+            print(f"Ошибка при остановке: {e}")
+
+        app_module.write_executor = app_module.pooled_write
+        app_module.db_writer = None
+        app_module.db_pool.close_all()
+        app_module.db_pool = self.writable_pool
+        await self.writer.stop()
+
+
+lifespan = Lifespan()
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http':
+        if scope['path'] == '/api/events':
+            await handle_events(scope, receive, send)
+        else:
+            await handle_http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await lifespan.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await lifespan.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('Для асинхронного режима нужен uvicorn: pip install uvicorn')
+
+    port = int(os.environ.get('PORT', 10000))
+    print(f"💰 Coin Clicker Master (ASGI) запущен на порту {port}")
+    uvicorn.run(application, host=os.environ.get('HOST', '0.0.0.0'), port=port, log_level='warning',
+                timeout_graceful_shutdown=SHUTDOWN_TIMEOUT)
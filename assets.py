@@ -0,0 +1,353 @@
+import argparse
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Конвейер статики: при старте файлы из static/ минифицируются, сжимаются
+# заранее (gzip и brotli, если установлен) и получают имена с хешем
+# содержимого — такие ответы кэшируются клиентом навсегда. Ссылки в HTML
+# переписываются на эти имена. Ответ отдается готовыми байтами без
+# сжатия на каждый запрос.
+#
+#   python assets.py --out dist     — собрать в каталог (для CDN/nginx)
+HASH_LENGTH = 10
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+# Старые имена без хеша и HTML: всегда с проверкой по ETag
+REVALIDATE_CACHE = 'no-cache'
+
+COMPRESSIBLE = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# Сжатый вариант хранится, только если он заметно меньше исходного
+MIN_COMPRESSION_GAIN = 0.9
+
+JS_PUNCT = set('{}()[];,:=<>?!&|+-')
+# После этих символов и ключевых слов '/' начинает регулярное выражение, а не деление
+REGEX_PREFIX = set('(,=:[!&|?{};+-*%<>~^')
+REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete',
+                  'void', 'throw', 'yield', 'await'}
+
+
+# Минификация JS без разбора синтаксиса: убираются комментарии, отступы и
+# лишние пробелы вне строк, шаблонов и регулярных выражений. Переводы строк
+# остаются везде, где от них может зависеть автоматическая вставка ';'.
+def minify_js(source):
+    out = []
+    pending = None
+    braces = []
+    in_template = False
+    i = 0
+    n = len(source)
+
+    def separate(c):
+        nonlocal pending
+        if pending and out:
+            last = out[-1][-1]
+            if pending == '\n':
+                if last not in '{;,([:' and c not in '})],.;:?':
+                    out.append('\n')
+            elif not (last in JS_PUNCT or c in JS_PUNCT) or (last in '+-' and c in '+-'):
+                out.append(' ')
+        pending = None
+
+    def regex_allowed():
+        tail = ''.join(out[-16:]).rstrip()
+        if not tail or tail[-1] in REGEX_PREFIX:
+            return True
+        word = re.search(r'[A-Za-z_$]+$', tail)
+        return word is not None and word.group() in REGEX_KEYWORDS
+
+    while i < n:
+        c = source[i]
+
+        if in_template:
+            if c == '\\':
+                out.append(source[i:i + 2])
+                i += 2
+            elif c == '`':
+                out.append(c)
+                in_template = False
+                i += 1
+            elif source.startswith('${', i):
+                out.append('${')
+                braces.append(0)
+                in_template = False
+                i += 2
+            else:
+                out.append(c)
+                i += 1
+            continue
+
+        if c in ' \t\r\n':
+            if c == '\n':
+                pending = '\n'
+            elif pending is None:
+                pending = ' '
+            i += 1
+            continue
+        if source.startswith('//', i):
+            end = source.find('\n', i)
+            i = n if end < 0 else end
+            continue
+        if source.startswith('/*', i):
+            i = source.index('*/', i + 2) + 2
+            if pending is None:
+                pending = ' '
+            continue
+
+        separate(c)
+        if c in '\'"':
+            j = i + 1
+            while source[j] != c:
+                j += 2 if source[j] == '\\' else 1
+            out.append(source[i:j + 1])
+            i = j + 1
+        elif c == '`':
+            out.append(c)
+            in_template = True
+            i += 1
+        elif c == '/' and regex_allowed():
+            j = i + 1
+            in_class = False
+            while True:
+                ch = source[j]
+                if ch == '\\':
+                    j += 2
+                    continue
+                if ch == '[':
+                    in_class = True
+                elif ch == ']':
+                    in_class = False
+                elif ch == '/' and not in_class:
+                    break
+                j += 1
+            j += 1
+            while j < n and source[j].isalpha():
+                j += 1
+            out.append(source[i:j])
+            i = j
+        else:
+            if c == '{' and braces:
+                braces[-1] += 1
+            elif c == '}' and braces:
+                if braces[-1] == 0:
+                    # Конец выражения ${...} — дальше снова текст шаблона
+                    braces.pop()
+                    in_template = True
+                else:
+                    braces[-1] -= 1
+            out.append(c)
+            i += 1
+
+    return ''.join(out)
+
+
+def minify_css(source):
+    out = []
+    i = 0
+    n = len(source)
+    while i < n:
+        c = source[i]
+        if c in '\'"':
+            j = i + 1
+            while source[j] != c:
+                j += 2 if source[j] == '\\' else 1
+            out.append(source[i:j + 1])
+            i = j + 1
+        elif source.startswith('/*', i):
+            i = source.index('*/', i + 2) + 2
+        elif c.isspace():
+            while i < n and source[i].isspace():
+                i += 1
+            # Пробел нужен только между словами: вокруг скобок, ';' ',' '>' и после ':' — нет
+            if out and out[-1][-1] not in '{};,>:' and i < n and source[i] not in '{};,>':
+                out.append(' ')
+        elif c == '}' and out and out[-1] == ';':
+            out[-1] = '}'
+            i += 1
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out).strip()
+
+
+def minify_html(source):
+    source = re.sub(r'<!--.*?-->', '', source, flags=re.DOTALL)
+    return '\n'.join(line.strip() for line in source.splitlines() if line.strip())
+
+
+MINIFIERS = {
+    '.js': minify_js,
+    '.css': minify_css
+}
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def fingerprint(path, digest):
+    root, ext = os.path.splitext(path)
+    return f'{root}.{digest}{ext}'
+
+
+class Asset:
+    __slots__ = ('name', 'mimetype', 'digest', 'bodies')
+
+    def __init__(self, name, data, mimetype):
+        self.name = name
+        self.mimetype = mimetype
+        self.digest = content_hash(data)
+        # Варианты по Content-Encoding; identity есть всегда
+        self.bodies = {'identity': data}
+        if mimetype.startswith(COMPRESSIBLE):
+            self._add('gzip', gzip.compress(data, 9, mtime=0))
+            if brotli is not None:
+                self._add('br', brotli.compress(data, quality=11))
+
+    def _add(self, encoding, body):
+        if len(body) < len(self.bodies['identity']) * MIN_COMPRESSION_GAIN:
+            self.bodies[encoding] = body
+
+    def etag(self, encoding):
+        return self.digest if encoding == 'identity' else f'{self.digest}-{encoding}'
+
+
+# Значения с q из Accept / Accept-Encoding: {'gzip': 1.0, 'br': 0.0, ...}
+def quality_values(header):
+    accepted = {}
+    for part in (header or '').split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def choose_encoding(asset, header):
+    accepted = quality_values(header)
+    for encoding in ('br', 'gzip'):
+        if encoding in asset.bodies and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+# Ответ с готовыми байтами: выбор кодировки, ETag и 304.
+# vary — заголовки запроса, от которых еще зависел выбор файла
+def respond(asset, cache_control, vary=()):
+    encoding = choose_encoding(asset, request.headers.get('Accept-Encoding'))
+    etag = asset.etag(encoding)
+    headers = {'Cache-Control': cache_control, 'Vary': ', '.join(('Accept-Encoding',) + tuple(vary)), 'ETag': f'"{etag}"'}
+
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(asset.bodies[encoding], mimetype=asset.mimetype, headers=headers)
+
+
+class AssetPipeline:
+    def __init__(self, static_dir, url_prefix='/static/'):
+        self.static_dir = static_dir
+        self.url_prefix = url_prefix
+        # Относительный путь -> Asset и имя с хешем -> Asset
+        self.assets = {}
+        self.fingerprinted = {}
+        self.stats = {}
+
+    def build(self):
+        assets = {}
+        for root, _, files in os.walk(self.static_dir):
+            for filename in sorted(files):
+                full_path = os.path.join(root, filename)
+                path = os.path.relpath(full_path, self.static_dir).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    data = f.read()
+
+                ext = os.path.splitext(filename)[1].lower()
+                if ext in MINIFIERS:
+                    data = MINIFIERS[ext](data.decode('utf-8')).encode('utf-8')
+                mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                assets[path] = Asset(path, data, mimetype)
+
+        self.assets = assets
+        self.fingerprinted = {fingerprint(path, asset.digest): asset for path, asset in assets.items()}
+        self.stats = {
+            'files': len(assets),
+            'bytes': sum(len(asset.bodies['identity']) for asset in assets.values()),
+            'gzip_bytes': sum(len(asset.bodies.get('gzip', asset.bodies['identity'])) for asset in assets.values()),
+            'brotli': brotli is not None
+        }
+        return self.stats
+
+    def url(self, path):
+        asset = self.assets.get(path)
+        if asset is None:
+            return self.url_prefix + path
+        return self.url_prefix + fingerprint(path, asset.digest)
+
+    # Ссылки /static/<путь> в HTML -> имена с хешем; страница тоже становится
+    # Asset (без хеша в имени, отдается с проверкой по ETag)
+    def page(self, html, name='index.html'):
+        pattern = re.compile(re.escape(self.url_prefix) + r'([\w./-]+)')
+        html = pattern.sub(lambda m: self.url(m.group(1)), html)
+        return Asset(name, minify_html(html).encode('utf-8'), 'text/html')
+
+    # (Asset, неизменяемый ли адрес) или None
+    def lookup(self, filename):
+        asset = self.fingerprinted.get(filename)
+        if asset is not None:
+            return asset, True
+        asset = self.assets.get(filename)
+        if asset is not None:
+            return asset, False
+        return None
+
+    def serve(self, filename, vary=()):
+        found = self.lookup(filename)
+        if found is None:
+            return None
+        asset, immutable = found
+        return respond(asset, IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE, vary)
+
+    def write(self, out_dir):
+        for path, asset in self.assets.items():
+            target = os.path.join(out_dir, fingerprint(path, asset.digest))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            for encoding, body in asset.bodies.items():
+                suffix = {'identity': '', 'gzip': '.gz', 'br': '.br'}[encoding]
+                with open(target + suffix, 'wb') as f:
+                    f.write(body)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сборка статики: минификация, сжатие, хеши в именах')
+    parser.add_argument('--static', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    parser.add_argument('--out', help='каталог для собранных файлов (.gz/.br рядом с исходными)')
+    args = parser.parse_args()
+
+    pipeline = AssetPipeline(args.static)
+    pipeline.build()
+    for path, asset in sorted(pipeline.assets.items()):
+        sizes = ' '.join(f'{encoding}={len(body)}' for encoding, body in asset.bodies.items())
+        print(f'{fingerprint(path, asset.digest)}: {sizes}')
+    if args.out:
+        pipeline.write(args.out)
+        print(f'Собрано в {args.out}')
@@ -0,0 +1,294 @@
+import argparse
+import glob
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+
+# Снимки базы через online backup API SQLite. Копия идет шагами по step_pages
+# страниц с паузой между шагами, но внутри одной читающей транзакции источника:
+# без нее любая запись с другого соединения перезапускает копирование с начала,
+# и на живом сервере (сброс сохранений раз в секунду) снимок не завершается.
+# В WAL читающая транзакция писателей не блокирует — она только не дает
+# чекпоинту перенести кадры новее снимка, поэтому после копии запускается
+# PASSIVE-чекпоинт. Снимок проверяется quick_check, переводится в обычный
+# журнал (один самодостаточный файл) и атомарно переименовывается из .tmp;
+# хранятся keep последних.
+#
+#   python backup.py snapshot coin_clicker.db backups
+#   python backup.py restore backups/coin_clicker-20260101-120000.db coin_clicker.db --force
+STEP_PAGES = 1024
+STEP_SLEEP = 0.001
+KEEP = 24
+
+TIME_FORMAT = '%Y%m%d-%H%M%S'
+
+
+def fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+# Имя снимка — имя базы (у шардов свое) и время UTC: сортировка по имени = по времени
+def snapshot_prefix(db_file):
+    return os.path.splitext(os.path.basename(db_file))
+
+
+def snapshots(directory, db_file):
+    root, ext = snapshot_prefix(db_file)
+    pattern = os.path.join(glob.escape(directory), f'{glob.escape(root)}-{"[0-9]" * 8}-{"[0-9]" * 6}{ext}')
+    return sorted(glob.glob(pattern))
+
+
+def latest(directory, db_file):
+    found = snapshots(directory, db_file)
+    return found[-1] if found else None
+
+
+def check(conn):
+    result = conn.execute('PRAGMA quick_check').fetchone()[0]
+    if result != 'ok':
+        raise sqlite3.DatabaseError(f'Снимок поврежден: {result}')
+
+
+# Восстановление тоже через backup API, а не копией файла: страницы пишутся
+# через соединение с базой, и старые -wal/-shm не смешиваются с новым содержимым
+def restore(snapshot, db_file):
+    src = sqlite3.connect(f'file:{quote(snapshot)}?mode=ro', uri=True)
+    dst = sqlite3.connect(db_file)
+    try:
+        check(src)
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+# source — 'latest' (последний снимок базы в directory) или путь к файлу снимка.
+# Восстанавливается только отсутствующая или пустая база: существующая не трогается
+def restore_at_startup(db_file, source, directory):
+    if file_size(db_file) > 0:
+        print(f"База {db_file} уже есть, восстановление из снимка пропущено")
+        return None
+    snapshot = latest(directory, db_file) if source == 'latest' else source
+    if snapshot is None:
+        print(f"Снимков базы {db_file} в {directory} нет, база будет создана заново")
+        return None
+    # -wal и -shm без файла базы остались от прежней базы
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+    restore(snapshot, db_file)
+    print(f"База {db_file} восстановлена из снимка {snapshot}")
+    return snapshot
+
+
+class BackupScheduler:
+    def __init__(self, db_file, directory, keep=KEEP, step_pages=STEP_PAGES, step_sleep=STEP_SLEEP):
+        self.db_file = db_file
+        self.directory = directory
+        self.keep = keep
+        self.step_pages = step_pages
+        self.step_sleep = step_sleep
+
+        self._snapshot_lock = threading.Lock()
+        self._lock = threading.Lock()
+        # Замер записей во время текущего снимка (observe_write)
+        self._writes = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+        self.stats = {
+            'snapshots': 0,
+            'failures': 0,
+            'restarts': 0,
+            'pruned': 0
+        }
+        self.last = None
+
+    # Длительность каждой записи через app.run_write: задержки сохранений во время снимка
+    def observe_write(self, seconds):
+        if self._writes is None:
+            return
+        with self._lock:
+            writes = self._writes
+            if writes is not None:
+                writes['count'] += 1
+                writes['total'] += seconds
+                writes['max'] = max(writes['max'], seconds)
+
+    def snapshot(self):
+        with self._snapshot_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            root, ext = snapshot_prefix(self.db_file)
+            path = os.path.join(self.directory, f'{root}-{time.strftime(TIME_FORMAT, time.gmtime())}{ext}')
+            temp = path + '.tmp'
+            if os.path.exists(temp):
+                os.remove(temp)
+
+            progress = {'remaining': None, 'restarts': 0, 'pages': 0}
+
+            def step(status, remaining, pagecount):
+                # remaining растет, только если копирование началось заново
+                if progress['remaining'] is not None and remaining > progress['remaining']:
+                    progress['restarts'] += 1
+                progress['remaining'] = remaining
+                progress['pages'] = pagecount
+                if remaining and self.step_sleep:
+                    time.sleep(self.step_sleep)
+
+            started = time.perf_counter()
+            with self._lock:
+                self._writes = {'count': 0, 'total': 0.0, 'max': 0.0}
+            src = sqlite3.connect(self.db_file, isolation_level=None)
+            dst = sqlite3.connect(temp, isolation_level=None)
+            try:
+                # Файл снимка до переименования не нужен: fsync один раз в конце
+                dst.execute('PRAGMA journal_mode = OFF')
+                dst.execute('PRAGMA synchronous = OFF')
+                src.execute('BEGIN')
+                src.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                try:
+                    src.backup(dst, pages=self.step_pages, progress=step)
+                    wal_bytes = file_size(self.db_file + '-wal')
+                finally:
+                    src.execute('COMMIT')
+                copied = time.perf_counter()
+
+                dst.execute('PRAGMA journal_mode = DELETE')
+                check(dst)
+                dst.close()
+                fsync_path(temp)
+                os.replace(temp, path)
+                if hasattr(os, 'O_DIRECTORY'):
+                    fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+
+                busy, log, checkpointed = src.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+            except Exception:
+                with self._lock:
+                    self.stats['failures'] += 1
+                dst.close()
+                if os.path.exists(temp):
+                    os.remove(temp)
+                raise
+            finally:
+                src.close()
+                with self._lock:
+                    writes, self._writes = self._writes, None
+
+            info = {
+                'path': path,
+                'created_at': int(time.time()),
+                'bytes': file_size(path),
+                'pages': progress['pages'],
+                'restarts': progress['restarts'],
+                'copy_ms': round((copied - started) * 1000, 3),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                'writes': writes['count'],
+                'write_ms_max': round(writes['max'] * 1000, 3),
+                'write_ms_avg': round(writes['total'] / writes['count'] * 1000, 3) if writes['count'] else 0.0,
+                'wal_bytes': wal_bytes,
+                'checkpoint': {'busy': busy, 'log': log, 'checkpointed': checkpointed}
+            }
+            with self._lock:
+                self.stats['snapshots'] += 1
+                self.stats['restarts'] += progress['restarts']
+                self.last = info
+            self.prune()
+            return info
+
+    # Оставляет keep последних снимков; .tmp вне снимка — остатки прерванных копий
+    def prune(self):
+        removed = 0
+        found = snapshots(self.directory, self.db_file)
+        stale = found[:-self.keep] if self.keep > 0 else []
+        root, ext = snapshot_prefix(self.db_file)
+        stale += glob.glob(os.path.join(glob.escape(self.directory), f'{glob.escape(root)}-*{ext}.tmp'))
+        for path in stale:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                print(f"Не удалось удалить старый снимок {path}: {e}")
+        with self._lock:
+            self.stats['pruned'] += removed
+        return removed
+
+    def start(self, interval):
+        def run():
+            while not self._stopped.wait(interval):
+                try:
+                    self.snapshot()
+                except Exception as e:
+                    print(f"Ошибка снимка базы: {e}")
+
+        if self._thread is None:
+            with self._snapshot_lock:
+                self.prune()
+            self._thread = threading.Thread(target=run, name='db-backup', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self.stats)
+            last = self.last
+        data['kept'] = len(snapshots(self.directory, self.db_file))
+        if last:
+            for key in ('created_at', 'bytes', 'pages', 'copy_ms', 'duration_ms', 'writes',
+                        'write_ms_max', 'write_ms_avg', 'wal_bytes'):
+                data[f'last_{key}'] = last[key]
+        return data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Снимки базы через online backup API SQLite')
+    sub = parser.add_subparsers(dest='command', required=True)
+    take = sub.add_parser('snapshot', help='снять снимок работающей базы')
+    take.add_argument('db')
+    take.add_argument('directory')
+    take.add_argument('--keep', type=int, default=KEEP)
+    take.add_argument('--step-pages', type=int, default=STEP_PAGES)
+    listing = sub.add_parser('list', help='снимки базы в каталоге')
+    listing.add_argument('db')
+    listing.add_argument('directory')
+    back = sub.add_parser('restore', help='восстановить базу из снимка (сервер должен быть остановлен)')
+    back.add_argument('snapshot', help="файл снимка или latest")
+    back.add_argument('db')
+    back.add_argument('--directory', default='backups', help='каталог снимков для latest')
+    back.add_argument('--force', action='store_true', help='перезаписать существующую базу')
+    args = parser.parse_args()
+
+    if args.command == 'snapshot':
+        info = BackupScheduler(args.db, args.directory, args.keep, args.step_pages).snapshot()
+        print(f"Снимок {info['path']}: {info['bytes']} байт за {info['duration_ms'] / 1000:.1f} с, "
+              f"перезапусков копирования: {info['restarts']}")
+    elif args.command == 'list':
+        for path in snapshots(args.directory, args.db):
+            print(f'{path}\t{file_size(path)}')
+    else:
+        snapshot = latest(args.directory, args.db) if args.snapshot == 'latest' else args.snapshot
+        if snapshot is None:
+            raise SystemExit('Снимков нет')
+        if file_size(args.db) > 0 and not args.force:
+            raise SystemExit('База уже существует: добавьте --force')
+        restore(snapshot, args.db)
+        print(f"База {args.db} восстановлена из снимка {snapshot}")
@@ -0,0 +1,110 @@
+# Микробенчмарк: старый путь (sqlite3.connect на каждый запрос, прагмы по умолчанию)
+# против пула соединений на get_player и записи save_game.
+#
+#   python benchmarks/db_pool_bench.py --players 200 --iterations 2000
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = tempfile.mkdtemp(prefix='coin_clicker_bench_')
+os.environ['DB_FILE'] = os.path.join(BENCH_DIR, 'pool.db')
+os.environ['SAVE_FLUSH_INTERVAL'] = '3600'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as game_app
+
+LEGACY_DB_FILE = os.path.join(BENCH_DIR, 'legacy.db')
+
+
+def legacy_get_db():
+    conn = sqlite3.connect(LEGACY_DB_FILE)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def pooled_get_db():
+    return game_app.db_pool.checkout()
+
+
+def legacy_write(fn):
+    conn = legacy_get_db()
+    try:
+        result = fn(conn)
+        conn.commit()
+        return result
+    finally:
+        conn.close()
+
+
+def make_save(i):
+    coins = 100.0 + i
+    return {
+        'fields': {
+            'username': 'bench',
+            'coins': coins,
+            'gems': 10,
+            'tokens': 0,
+            'total_clicks': i,
+            'total_earned': coins,
+            'current_grade': 0,
+            'grade_progress': i / 1000,
+            'revision': i
+        },
+        'achievements': {'first_click': {'progress': i, 'completed': 0}},
+        'leaderboard': ('bench', game_app.total_score(coins, 0, 0), coins, 0, 0),
+        'saved_at': game_app.utc_timestamp()
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_case(name, fn, iterations):
+    samples = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t) * 1000)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<28} {iterations / elapsed:>10.0f} op/s   "
+          f"p50 {statistics.median(samples):.3f} ms   p99 {percentile(samples, 99):.3f} ms")
+
+
+def bench(path_name, get_db_fn, write_fn, players, iterations):
+    game_app.get_db = get_db_fn
+    game_app.write_executor = write_fn
+    game_app.init_db()
+    client = game_app.app.test_client()
+    player_ids = [f'bench_{n}' for n in range(players)]
+    for player_id in player_ids:
+        client.get(f'/api/player/{player_id}')
+
+    run_case(f'{path_name} get_player', lambda i: client.get(f'/api/player/{random.choice(player_ids)}'), iterations)
+    # Запись одного сохранения за транзакцию — как делал save_game до буфера
+    run_case(f'{path_name} save_game', lambda i: game_app.write_saves({random.choice(player_ids): make_save(i)}), iterations)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    original_get_db, original_write = game_app.get_db, game_app.write_executor
+    print(f"SQLite {sqlite3.sqlite_version}, каталог {BENCH_DIR}")
+    bench('legacy', legacy_get_db, legacy_write, args.players, args.iterations)
+    bench('pool', pooled_get_db, game_app.pooled_write, args.players, args.iterations)
+    game_app.get_db, game_app.write_executor = original_get_db, original_write
+    print('pool metrics:', game_app.db_pool.metrics())
+
+
+if __name__ == '__main__':
+    main()
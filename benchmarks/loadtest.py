@@ -0,0 +1,367 @@
+# Нагрузочный тест: виртуальные игроки с тем же ритмом запросов, что и game.js.
+# Вход: GET /api/player и сразу полное сохранение; дальше дельта-сохранение
+# раз в --save-interval секунд и изредка покупки, бусты, ежедневная награда
+# и лидерборд. Результат — JSON для сравнения между коммитами.
+#
+#   python benchmarks/loadtest.py --players 2000 --duration 60
+#   python benchmarks/loadtest.py --url http://127.0.0.1:10000 --db coin_clicker.db
+#   python benchmarks/loadtest.py --compare benchmarks/results/old.json benchmarks/results/new.json
+import argparse
+import heapq
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, 'benchmarks', 'results')
+
+# Вероятность действия на каждом тике сохранения
+ACTIONS = {
+    'buy': 0.05,
+    'activate_boost': 0.005,
+    'claim_daily': 0.002,
+    'leaderboard': 0.01
+}
+PURCHASES = [('click', 'click_power'), ('autoclicker', 'basic'), ('building', 'lemonade')]
+LEADERBOARD_CATEGORIES = ('total', 'coins', 'grade', 'clicks')
+
+
+# Транспорт через тестовый клиент Flask (без сети, в этом же процессе)
+class TestClientTransport:
+    def __init__(self):
+        import app as game_app
+        self.app = game_app
+        self.db_file = game_app.DB_FILE
+        self._local = threading.local()
+
+    def request(self, method, path, payload=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.app.test_client()
+        response = client.open(path, method=method, json=payload)
+        return response.status_code, response.get_data()
+
+
+# Транспорт к запущенному серверу: keep-alive соединение на поток
+class HttpTransport:
+    def __init__(self, url, db_file=None):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.db_file = db_file
+        self._local = threading.local()
+
+    def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+
+class Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.statuses = {}
+        self.lock_errors = 0
+
+    def record(self, endpoint, ms, status, body):
+        locked = b'database is locked' in body or b'database is busy' in body
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(ms)
+            self.statuses.setdefault(endpoint, {}).setdefault(status, 0)
+            self.statuses[endpoint][status] += 1
+            if status >= 500 or status == 0:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            if locked:
+                self.lock_errors += 1
+
+
+def percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+# Виртуальный игрок: локальное состояние как у game.js и протокол ревизий
+class VirtualPlayer:
+    def __init__(self, player_id, rng):
+        self.player_id = player_id
+        self.rng = rng
+        self.revision = 0
+        self.synced = False
+        self.state = {}
+
+    def call(self, transport, stats, endpoint, method, path, payload=None):
+        started = time.perf_counter()
+        try:
+            status, body = transport.request(method, path, payload)
+        except Exception as e:
+            status, body = 0, str(e).encode('utf-8')
+        stats.record(endpoint, (time.perf_counter() - started) * 1000, status, body)
+        try:
+            return status, json.loads(body)
+        except ValueError:
+            return status, None
+
+    def load(self, transport, stats):
+        status, data = self.call(transport, stats, 'get_player', 'GET', f'/api/player/{self.player_id}')
+        data = data or {}
+        self.state = {
+            'username': self.player_id,
+            'coins': data.get('coins', 0),
+            'gems': data.get('gems', 10),
+            'tokens': data.get('tokens', 0),
+            'total_clicks': data.get('total_clicks', 0),
+            'total_earned': data.get('total_earned', 0),
+            'current_grade': data.get('current_grade', 0),
+            'grade_progress': data.get('grade_progress', 0)
+        }
+        self.revision = data.get('revision') or 0
+        self.synced = False
+        self.save(transport, stats)
+
+    def play(self):
+        clicks = self.rng.randint(0, 8)
+        self.state['total_clicks'] += clicks
+        self.state['coins'] += clicks
+        self.state['total_earned'] += clicks
+        self.state['grade_progress'] = min(self.state['grade_progress'] + clicks * 0.01, 99)
+
+    def save(self, transport, stats):
+        if not self.synced:
+            payload = {'player_id': self.player_id, **self.state, 'achievements': {}}
+        else:
+            payload = {
+                'player_id': self.player_id,
+                'base_revision': self.revision,
+                'revision': self.revision + 1,
+                'patch': dict(self.state),
+                'achievements': {}
+            }
+        status, data = self.call(transport, stats, 'save', 'POST', '/api/save', payload)
+        if data and data.get('success'):
+            self.revision = data['revision']
+            self.synced = True
+        elif status == 409 and data:
+            self.revision = data['revision']
+            self.synced = False
+
+    def act(self, transport, stats):
+        if self.rng.random() < ACTIONS['buy']:
+            kind, item_id = self.rng.choice(PURCHASES)
+            status, data = self.call(transport, stats, 'buy_batch', 'POST', '/api/buy_batch', {
+                'player_id': self.player_id,
+                'purchases': [{'type': kind, 'id': item_id, 'quantity': 1}]
+            })
+            if data and data.get('new_balance'):
+                self.state.update(data['new_balance'])
+        if self.rng.random() < ACTIONS['activate_boost']:
+            self.call(transport, stats, 'activate_boost', 'POST', '/api/activate_boost', {
+                'player_id': self.player_id, 'boost_id': 'x2', 'duration': 60, 'multiplier': 2
+            })
+        if self.rng.random() < ACTIONS['claim_daily']:
+            status, data = self.call(transport, stats, 'claim_daily', 'POST', '/api/claim_daily', {'player_id': self.player_id})
+            # Как game.js: награда добавляется к локальному состоянию и уходит со следующим сохранением
+            if data and data.get('success'):
+                for key in ('coins', 'gems', 'tokens'):
+                    self.state[key] += data['reward'].get(key, 0)
+        if self.rng.random() < ACTIONS['leaderboard']:
+            category = self.rng.choice(LEADERBOARD_CATEGORIES)
+            self.call(transport, stats, 'leaderboard', 'GET', f'/api/leaderboard/{category}')
+
+
+def run_worker(transport, stats, players, save_interval, deadline, ramp_up):
+    # Очередь событий по времени: (момент следующего тика, номер, игрок)
+    now = time.monotonic()
+    events = [(now + ramp_up * i / max(len(players), 1), i, player) for i, player in enumerate(players)]
+    heapq.heapify(events)
+    loaded = set()
+
+    while events:
+        at, i, player = heapq.heappop(events)
+        if at >= deadline:
+            break
+        delay = at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        if i not in loaded:
+            player.load(transport, stats)
+            loaded.add(i)
+        else:
+            player.play()
+            player.save(transport, stats)
+            player.act(transport, stats)
+        heapq.heappush(events, (at + save_interval, i, player))
+
+
+def db_size(path):
+    if not path:
+        return None
+    return sum(os.path.getsize(p) for p in (path, f'{path}-wal', f'{path}-shm') if os.path.exists(p))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    if args.url:
+        transport = HttpTransport(args.url, args.db)
+        mode = 'http'
+    else:
+        if not os.environ.get('DB_FILE'):
+            os.environ['DB_FILE'] = os.path.join(tempfile.mkdtemp(prefix='coin_clicker_load_'), 'load.db')
+        sys.path.insert(0, ROOT_DIR)
+        transport = TestClientTransport()
+        mode = 'test_client'
+
+    stats = Stats()
+    rng = random.Random(args.seed)
+    prefix = args.prefix or f'load_{int(time.time())}'
+    players = [VirtualPlayer(f'{prefix}_{n}', random.Random(rng.random())) for n in range(args.players)]
+    size_before = db_size(transport.db_file)
+
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(target=run_worker, args=(
+            transport, stats, players[w::args.workers], args.save_interval, deadline, args.ramp_up
+        ))
+        for w in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    _, health = transport.request('GET', '/health')
+    try:
+        health = json.loads(health)
+    except ValueError:
+        health = None
+
+    endpoints = {}
+    for endpoint, samples in sorted(stats.latencies.items()):
+        ordered = sorted(samples)
+        endpoints[endpoint] = {
+            'count': len(samples),
+            'errors': stats.errors.get(endpoint, 0),
+            'statuses': {str(k): v for k, v in sorted(stats.statuses[endpoint].items())},
+            'rps': round(len(samples) / elapsed, 1),
+            'p50_ms': round(percentile(ordered, 50), 3),
+            'p95_ms': round(percentile(ordered, 95), 3),
+            'p99_ms': round(percentile(ordered, 99), 3),
+            'max_ms': round(ordered[-1], 3)
+        }
+
+    size_after = db_size(transport.db_file)
+    pool = (health or {}).get('db_pool') or {}
+    return {
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'mode': mode,
+        'config': {
+            'players': args.players,
+            'workers': args.workers,
+            'duration': args.duration,
+            'save_interval': args.save_interval,
+            'seed': args.seed
+        },
+        'elapsed_s': round(elapsed, 3),
+        'total_rps': round(sum(e['count'] for e in endpoints.values()) / elapsed, 1),
+        'endpoints': endpoints,
+        'sqlite': {
+            'lock_errors': stats.lock_errors,
+            'lock_retries': pool.get('lock_retries'),
+            'lock_failures': pool.get('lock_failures'),
+            'db_bytes_before': size_before,
+            'db_bytes_after': size_after,
+            'db_growth_bytes': size_after - size_before if size_before is not None and size_after is not None else None
+        },
+        'health': health
+    }
+
+
+def print_report(result):
+    print(f"{result['mode']} @ {result['commit']}: {result['config']['players']} игроков, "
+          f"{result['elapsed_s']} s, {result['total_rps']} req/s")
+    print(f"{'endpoint':<16}{'count':>8}{'err':>6}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, e in result['endpoints'].items():
+        print(f"{name:<16}{e['count']:>8}{e['errors']:>6}{e['rps']:>9}"
+              f"{e['p50_ms']:>10.3f}{e['p95_ms']:>10.3f}{e['p99_ms']:>10.3f}")
+    print('sqlite:', {k: v for k, v in result['sqlite'].items()})
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['commit']} -> {new['commit']}")
+    print(f"{'endpoint':<16}{'rps':>20}{'p95 ms':>24}{'p99 ms':>24}")
+    for name in sorted(set(old['endpoints']) | set(new['endpoints'])):
+        a, b = old['endpoints'].get(name), new['endpoints'].get(name)
+        if not a or not b:
+            print(f"{name:<16} только в {'новом' if b else 'старом'} прогоне")
+            continue
+        print(f"{name:<16}{a['rps']:>9} -> {b['rps']:<9}"
+              f"{a['p95_ms']:>11.3f} -> {b['p95_ms']:<9.3f}{a['p99_ms']:>11.3f} -> {b['p99_ms']:<9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест Coin Clicker')
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=32, help='потоки-генераторы нагрузки')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--save-interval', type=float, default=1.0, help='секунд между сохранениями игрока')
+    parser.add_argument('--ramp-up', type=float, default=5.0, help='за сколько секунд входят все игроки')
+    parser.add_argument('--url', help='адрес запущенного сервера; без него — тестовый клиент Flask')
+    parser.add_argument('--db', help='файл базы сервера (для замера роста при --url)')
+    parser.add_argument('--prefix', help='префикс player_id (по умолчанию уникальный на прогон)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='куда сохранить JSON (по умолчанию benchmarks/results/)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='сравнить два JSON-результата')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    result = run(args)
+    print_report(result)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"loadtest-{result['mode']}-{result['commit'] or 'nogit'}-{result['timestamp']}.json")
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f'Результат: {output}')
+
+
+if __name__ == '__main__':
+    main()
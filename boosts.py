@@ -0,0 +1,140 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+# Бусты в памяти процесса: активные бусты по игрокам и min-куча окончаний.
+# "Какой множитель у игрока сейчас" — поиск в словаре без запроса к базе;
+# фоновый поток снимает истекшие бусты и пачками удаляет их строки из active_boosts.
+
+# Строки удаляются только после того, как last_active игрока ушел за конец буста:
+# до этого буст еще нужен для досчета офлайн-дохода (economy.settle_income)
+SWEEP_QUERY = '''
+    DELETE FROM active_boosts
+    WHERE (player_id, boost_id) IN (
+        SELECT b.player_id, b.boost_id
+        FROM active_boosts b
+        JOIN players p ON p.player_id = b.player_id
+        WHERE b.ends_at <= ? AND b.ends_at <= p.last_active
+        LIMIT ?
+    )
+'''
+
+
+class BoostTimeline:
+    def __init__(self):
+        self._active = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+        self.stats = {
+            'activated': 0,
+            'expired': 0,
+            'rows_deleted': 0,
+            'sweeps': 0
+        }
+
+    # Загрузка еще не истекших бустов (диапазон по idx_active_boosts_ends)
+    def load(self, conn, now=None):
+        now = time.time() if now is None else now
+        rows = conn.execute(
+            'SELECT player_id, boost_id, multiplier, ends_at FROM active_boosts WHERE ends_at > ?', (now,)
+        ).fetchall()
+        with self._lock:
+            self._active = {}
+            self._heap = []
+            for row in rows:
+                self._put(row['player_id'], row['boost_id'], row['multiplier'], row['ends_at'])
+            heapq.heapify(self._heap)
+        return len(rows)
+
+    def _put(self, player_id, boost_id, multiplier, ends_at):
+        self._active.setdefault(player_id, {})[boost_id] = {'multiplier': multiplier, 'ends_at': ends_at}
+        self._heap.append((ends_at, next(self._sequence), player_id, boost_id))
+
+    def activate(self, player_id, boost_id, multiplier, ends_at):
+        with self._lock:
+            self._active.setdefault(player_id, {})[boost_id] = {'multiplier': multiplier, 'ends_at': ends_at}
+            heapq.heappush(self._heap, (ends_at, next(self._sequence), player_id, boost_id))
+            self.stats['activated'] += 1
+
+    # {boost_id: {'multiplier', 'ends_at'}} бустов, действующих в момент now
+    def active(self, player_id, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            boosts = self._active.get(player_id)
+            if not boosts:
+                return {}
+            return {boost_id: dict(boost) for boost_id, boost in boosts.items() if boost['ends_at'] > now}
+
+    def multiplier(self, player_id, now=None):
+        result = 1.0
+        for boost in self.active(player_id, now).values():
+            result *= boost['multiplier']
+        return result
+
+    # Снимает истекшие бусты с вершины кучи; возвращает [(player_id, boost_id, ends_at)]
+    def expire(self, now=None):
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                ends_at, _, player_id, boost_id = heapq.heappop(self._heap)
+                boosts = self._active.get(player_id)
+                # Буст могли продлить: в куче остается запись о старом окончании
+                if not boosts or boost_id not in boosts or boosts[boost_id]['ends_at'] != ends_at:
+                    continue
+                del boosts[boost_id]
+                if not boosts:
+                    del self._active[player_id]
+                expired.append((player_id, boost_id, ends_at))
+            self.stats['expired'] += len(expired)
+        return expired
+
+    # Удаление истекших строк пачками: каждая пачка — отдельная короткая транзакция
+    def sweep(self, run_write, batch=500, now=None):
+        now = time.time() if now is None else now
+        deleted = 0
+        while True:
+            count = run_write(lambda conn: conn.execute(SWEEP_QUERY, (now, batch)).rowcount)
+            deleted += count
+            if count < batch:
+                break
+        with self._lock:
+            self.stats['rows_deleted'] += deleted
+            self.stats['sweeps'] += 1
+        return deleted
+
+    # on_expire(player_id, boost_id, ends_at) вызывается для каждого истекшего буста
+    def start(self, run_write, on_expire=None, tick=1.0, sweep_interval=60.0, batch=500):
+        def run():
+            next_sweep = time.monotonic() + sweep_interval
+            while not self._stopped.wait(tick):
+                try:
+                    for player_id, boost_id, ends_at in self.expire():
+                        if on_expire:
+                            on_expire(player_id, boost_id, ends_at)
+                    if time.monotonic() >= next_sweep:
+                        next_sweep = time.monotonic() + sweep_interval
+                        self.sweep(run_write, batch)
+                except Exception as e:
+                    print(f"Ошибка обработки истекших бустов: {e}")
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=run, name='boost-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                **self.stats,
+                'players': len(self._active),
+                'active': sum(len(boosts) for boosts in self._active.values()),
+                'heap': len(self._heap)
+            }
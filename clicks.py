@@ -0,0 +1,103 @@
+import math
+import threading
+
+import economy
+
+
+# Прием кликов пачками: клиент присылает окна [начало_мс, длительность_мс, клики, криты],
+# сервер проверяет темп и долю критов по улучшениям игрока и сам считает доход.
+# Окна идут строго по времени: начало окна не раньше конца последнего принятого
+# (players.clicks_until), поэтому повторная отправка той же пачки ничего не начислит.
+
+MAX_WINDOWS = 120
+MAX_WINDOW_MS = 60000
+# Допустимое опережение часов клиента
+CLOCK_SKEW_MS = 5000
+
+
+def crit_limit(clicks, crit_chance):
+    # Верхняя граница числа критов: среднее + 4 сигмы биномиального распределения
+    mean = clicks * crit_chance
+    return mean + 4 * math.sqrt(mean * (1 - crit_chance)) + 2
+
+
+# Форма пачки: список окон из четырех целых. Неверная форма — ошибка запроса
+# (ValueError, маршрут отвечает 400), а не отклоненные окна
+def check_shape(windows):
+    if not isinstance(windows, list):
+        raise ValueError('Окна кликов должны быть списком')
+    for window in windows[:MAX_WINDOWS]:
+        if not (isinstance(window, list) and len(window) == 4 and
+                all(isinstance(value, int) and not isinstance(value, bool) for value in window)):
+            raise ValueError('Окно кликов — список [начало_мс, длительность_мс, клики, криты] из целых')
+
+
+def validate_windows(windows, clicks_until, now_ms, crit_chance, max_rate):
+    check_shape(windows)
+    accepted = []
+    rejected = 0
+    cursor = clicks_until or 0
+
+    for start, duration, clicks, crits in windows[:MAX_WINDOWS]:
+        end = start + duration
+        valid = (
+            0 < duration <= MAX_WINDOW_MS and
+            start >= cursor and
+            end <= now_ms + CLOCK_SKEW_MS and
+            0 <= crits <= clicks and
+            # Окна короче секунды считаются секундными — короткая серия кликов укладывается в темп
+            clicks <= max_rate * max(duration, 1000) / 1000 and
+            crits <= crit_limit(clicks, crit_chance)
+        )
+        if valid:
+            accepted.append((start, duration, clicks, crits))
+            cursor = end
+        else:
+            rejected += 1
+
+    rejected += max(len(windows) - MAX_WINDOWS, 0)
+    return accepted, rejected, cursor
+
+
+# Начисление принятых кликов на снимок игрока; возвращает измененные поля
+def apply_clicks(snapshot, accepted, clicks_until, boosts, now):
+    upgrades = snapshot['upgrades']
+    power, _, crit_multiplier = economy.click_stats(upgrades)
+    boost_multipliers = [boost['multiplier'] for boost in boosts.values() if boost['ends_at'] and boost['ends_at'] > now]
+
+    state = {key: snapshot[key] for key in ('coins', 'gems', 'total_earned', 'current_grade', 'grade_progress')}
+    clicks = 0
+    gain_total = 0.0
+    for _, _, window_clicks, window_crits in accepted:
+        base_gain = power * economy.click_multiplier(upgrades, state['current_grade'], boost_multipliers)
+        gain = base_gain * (window_clicks + window_crits * (crit_multiplier - 1))
+        state = economy.add_earnings(state, gain)
+        clicks += window_clicks
+        gain_total += gain
+
+    fields = dict(state)
+    fields['total_clicks'] = (snapshot['total_clicks'] or 0) + clicks
+    fields['clicks_until'] = clicks_until
+    return fields, clicks, gain_total
+
+
+class ClickStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {
+            'batches': 0,
+            'windows_accepted': 0,
+            'windows_rejected': 0,
+            'clicks': 0
+        }
+
+    def record(self, accepted, rejected, clicks):
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['windows_accepted'] += accepted
+            self.stats['windows_rejected'] += rejected
+            self.stats['clicks'] += clicks
+
+    def metrics(self):
+        with self._lock:
+            return dict(self.stats)
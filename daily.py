@@ -0,0 +1,156 @@
+import argparse
+import sqlite3
+import time
+
+import economy
+
+
+# Ежедневные награды: одна строка состояния на игрока (daily_state: день цикла,
+# серия, время последнего получения), поэтому получение награды — чтение и
+# запись одной строки. История получений пишется в daily_log (можно выключить)
+# и сворачивается в итоги по игрокам (daily_totals).
+#
+#   python daily.py claimable coin_clicker.db --since 1700000000 — кому награда доступна
+#   python daily.py compact coin_clicker.db --days 90            — свернуть старую историю
+COOLDOWN = economy.CONFIG['daily']['cooldown']
+# Серия продолжается, если следующую награду забрали до конца вторых суток
+STREAK_WINDOW = economy.CONFIG['daily']['streak_window']
+STREAK_BONUS = economy.CONFIG['daily']['streak_bonus']
+REWARDS = tuple(economy.CONFIG['daily']['rewards'])
+CYCLE_DAYS = len(REWARDS)
+
+
+def reward_for(day, streak):
+    reward = dict(REWARDS[min(day, CYCLE_DAYS) - 1])
+    # Умножаем за серию
+    if streak > 1:
+        reward['coins'] = int(reward['coins'] * (1 + streak * STREAK_BONUS))
+        reward['gems'] = int(reward['gems'] * (1 + streak * STREAK_BONUS))
+    return reward
+
+
+def load_state(conn, player_id):
+    return conn.execute('SELECT day, streak, claimed_at FROM daily_state WHERE player_id = ?', (player_id,)).fetchone()
+
+
+def status(conn, player_id, now=None):
+    now = time.time() if now is None else now
+    state = load_state(conn, player_id)
+    next_at = state['claimed_at'] + COOLDOWN if state is not None else 0
+    return {'available': next_at <= now, 'next_at': next_at}
+
+
+# Получение награды внутри транзакции записи. None — награду уже получали
+# меньше суток назад; иначе день, серия, награда и время следующей.
+# Начисление на баланс игрока делает вызывающий код.
+def claim(conn, player_id, now=None, log=True):
+    now = int(time.time() if now is None else now)
+    state = load_state(conn, player_id)
+
+    day = 1
+    streak = 1
+    if state is not None:
+        elapsed = now - state['claimed_at']
+        if elapsed < COOLDOWN:
+            return None
+        if elapsed < STREAK_WINDOW:
+            streak = state['streak'] + 1
+        day = state['day'] % CYCLE_DAYS + 1
+
+    reward = reward_for(day, streak)
+    conn.execute('''
+        INSERT OR REPLACE INTO daily_state (player_id, day, streak, claimed_at)
+        VALUES (?, ?, ?, ?)
+    ''', (player_id, day, streak, now))
+    if log:
+        conn.execute('''
+            INSERT OR IGNORE INTO daily_log (player_id, claimed_at, day, streak, coins, gems, tokens)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (player_id, now, day, streak, reward['coins'], reward.get('gems', 0), reward.get('tokens', 0)))
+
+    return {'day': day, 'streak': streak, 'reward': reward, 'claimed_at': now, 'next_at': now + COOLDOWN}
+
+
+# Игроки, которым награда стала доступна в (since, now] — для уведомлений.
+# Диапазон по idx_daily_state_claimed; after — (claimed_at, player_id)
+# последней строки прошлой страницы.
+def claimable(conn, now=None, since=None, limit=1000, after=None):
+    now = time.time() if now is None else now
+    lower = (since - COOLDOWN, '') if since is not None else (float('-inf'), '')
+    if after is not None and tuple(after) > lower:
+        lower = tuple(after)
+    rows = conn.execute('''
+        SELECT player_id, streak, claimed_at FROM daily_state
+        WHERE claimed_at <= ? AND (claimed_at, player_id) > (?, ?)
+        ORDER BY claimed_at, player_id
+        LIMIT ?
+    ''', (now - COOLDOWN, lower[0], lower[1], limit)).fetchall()
+    return [
+        {
+            'player_id': row['player_id'],
+            'claimed_at': row['claimed_at'],
+            'next_at': row['claimed_at'] + COOLDOWN,
+            # Серия сохранится, если забрать до этого момента
+            'streak_until': row['claimed_at'] + STREAK_WINDOW,
+            'streak': row['streak']
+        }
+        for row in rows
+    ]
+
+
+# Сворачивает записи daily_log старше before в daily_totals; возвращает число удаленных
+def compact_log(conn, before):
+    conn.execute('''
+        INSERT INTO daily_totals (player_id, claims, coins, gems, tokens, first_at, last_at, best_streak)
+        SELECT player_id, COUNT(*), COALESCE(SUM(coins), 0), COALESCE(SUM(gems), 0), COALESCE(SUM(tokens), 0),
+            MIN(claimed_at), MAX(claimed_at), COALESCE(MAX(streak), 0)
+        FROM daily_log
+        WHERE claimed_at < ?
+        GROUP BY player_id
+        ON CONFLICT (player_id) DO UPDATE SET
+            claims = claims + excluded.claims,
+            coins = coins + excluded.coins,
+            gems = gems + excluded.gems,
+            tokens = tokens + excluded.tokens,
+            first_at = MIN(first_at, excluded.first_at),
+            last_at = MAX(last_at, excluded.last_at),
+            best_streak = MAX(best_streak, excluded.best_streak)
+    ''', (before,))
+    return conn.execute('DELETE FROM daily_log WHERE claimed_at < ?', (before,)).rowcount
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ежедневные награды: доступные награды и свертка истории')
+    sub = parser.add_subparsers(dest='command', required=True)
+    ready = sub.add_parser('claimable', help='игроки, которым награда доступна')
+    ready.add_argument('db')
+    ready.add_argument('--since', type=float, help='только ставшие доступными после этого момента (epoch)')
+    ready.add_argument('--limit', type=int, default=1000)
+    compact = sub.add_parser('compact', help='свернуть историю старше N дней в итоги')
+    compact.add_argument('db')
+    compact.add_argument('--days', type=int, default=90)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        if args.command == 'claimable':
+            after = None
+            while True:
+                page = claimable(conn, since=args.since, limit=args.limit, after=after)
+                for entry in page:
+                    print(entry['player_id'])
+                if len(page) < args.limit:
+                    break
+                after = (page[-1]['claimed_at'], page[-1]['player_id'])
+        else:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                deleted = compact_log(conn, int(time.time()) - args.days * 24 * 3600)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            print(f'Свернуто записей истории: {deleted}')
+    finally:
+        conn.close()
@@ -0,0 +1,238 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA', '0', '1', '2', '3')
+
+# Наблюдатель запросов (metrics.py): observer(op, sql, seconds, rows).
+# None — замеров нет, вызовы идут напрямую
+observer = None
+
+
+def is_locked_error(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+# Курсор с повтором запроса при блокировке базы
+class PooledCursor:
+    def __init__(self, pool, cursor):
+        self._pool = pool
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        return self._pool.run('execute', sql, self._cursor.execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._pool.run('executemany', sql, self._cursor.executemany, sql, seq_of_params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+# Долгоживущее соединение из пула: close() возвращает его обратно в пул
+class PooledConnection:
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+        self._checked_out = time.perf_counter()
+
+    @property
+    def raw(self):
+        return self._conn
+
+    def execute(self, sql, params=()):
+        return self._pool.run('execute', sql, self._conn.execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._pool.run('executemany', sql, self._conn.executemany, sql, seq_of_params)
+
+    def cursor(self):
+        return PooledCursor(self._pool, self._conn.cursor())
+
+    def commit(self):
+        self._pool.run('commit', None, self._conn.commit)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            if observer is not None:
+                observer('connection', None, time.perf_counter() - self._checked_out, None)
+            self._pool.release(self._conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        self.close()
+
+
+class ConnectionPool:
+    def __init__(self, path, size=8, timeout=30.0, synchronous='NORMAL',
+                 mmap_size=256 * 1024 * 1024, cache_size=-16000, busy_timeout=5000,
+                 statement_cache=256, lock_retries=5, read_only=False):
+        if str(synchronous).upper() not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f'Недопустимый уровень synchronous: {synchronous}')
+
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.synchronous = synchronous
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.busy_timeout = busy_timeout
+        self.statement_cache = statement_cache
+        self.lock_retries = lock_retries
+        self.read_only = read_only
+
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'connections': 0,
+            'checkouts': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+            'lock_retries': 0,
+            'lock_failures': 0
+        }
+
+    def _connect(self):
+        if self.read_only:
+            # Только чтение: WAL уже включен пишущими соединениями
+            database, uri = f'file:{quote(self.path)}?mode=ro', True
+        else:
+            database, uri = self.path, False
+
+        conn = sqlite3.connect(
+            database,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False,
+            cached_statements=self.statement_cache,
+            uri=uri
+        )
+        conn.row_factory = sqlite3.Row
+        if not self.read_only:
+            conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size = {int(self.cache_size)}')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def checkout(self):
+        started = time.perf_counter()
+        conn = None
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    self.stats['connections'] = self._created
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                        self.stats['connections'] = self._created
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError('connection pool exhausted')
+
+        waited = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.stats['checkouts'] += 1
+            self.stats['wait_ms_total'] += waited
+            self.stats['wait_ms_max'] = max(self.stats['wait_ms_max'], waited)
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Соединение сломано — закрываем и освобождаем место в пуле
+            conn.close()
+            with self._lock:
+                self._created -= 1
+                self.stats['connections'] = self._created
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.checkout()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # retry() с замером для наблюдателя; sql — метка запроса (None для commit)
+    def run(self, op, sql, fn, *args):
+        if observer is None:
+            return self.retry(fn, *args)
+        started = time.perf_counter()
+        result = self.retry(fn, *args)
+        observer(op, sql, time.perf_counter() - started, getattr(result, 'rowcount', None))
+        return result
+
+    def retry(self, fn, *args):
+        attempt = 0
+        while True:
+            try:
+                return fn(*args)
+            except sqlite3.OperationalError as e:
+                if not is_locked_error(e) or attempt >= self.lock_retries:
+                    if is_locked_error(e):
+                        with self._lock:
+                            self.stats['lock_failures'] += 1
+                    raise
+                attempt += 1
+                with self._lock:
+                    self.stats['lock_retries'] += 1
+                time.sleep(min(0.005 * 2 ** attempt, 0.2))
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self.stats)
+        data['idle'] = self._idle.qsize()
+        data['size'] = self.size
+        data['wait_ms_avg'] = round(data['wait_ms_total'] / data['checkouts'], 3) if data['checkouts'] else 0.0
+        data['wait_ms_total'] = round(data['wait_ms_total'], 3)
+        data['wait_ms_max'] = round(data['wait_ms_max'], 3)
+        return data
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+                self.stats['connections'] = self._created
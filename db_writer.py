@@ -0,0 +1,143 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db_pool
+
+
+# Единственный писатель SQLite для асинхронного режима.
+# Задания fn(conn) копятся в asyncio.Queue; писатель забирает все накопившиеся
+# и выполняет их одной транзакцией (каждое — в своем SAVEPOINT), один commit на группу.
+class AsyncWriter:
+    def __init__(self, path, max_batch=256, synchronous='NORMAL', busy_timeout=5000):
+        self.path = path
+        self.max_batch = max_batch
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+
+        self.loop = None
+        self._queue = None
+        self._task = None
+        self._conn = None
+        self._executor = None
+        self._thread_ident = None
+
+        self.stats = {
+            'jobs': 0,
+            'failed_jobs': 0,
+            'groups': 0,
+            'max_group': 0,
+            'commit_ms_total': 0.0
+        }
+
+    def _connect(self):
+        self._thread_ident = threading.get_ident()
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout)}')
+        self._conn = conn
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        await self.loop.run_in_executor(self._executor, self._connect)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        await self.loop.run_in_executor(self._executor, self._conn.close)
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, fn):
+        future = self.loop.create_future()
+        await self._queue.put((fn, future))
+        return await future
+
+    # Для синхронного кода из других потоков (обработчики Flask, буфер сохранений)
+    def submit_threadsafe(self, fn):
+        if threading.get_ident() == self._thread_ident:
+            raise RuntimeError('Вложенная запись из потока писателя')
+        return asyncio.run_coroutine_threadsafe(self.submit(fn), self.loop).result()
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            job = await self._queue.get()
+            if job is None:
+                break
+
+            batch = [job]
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+
+            results = await self.loop.run_in_executor(self._executor, self._apply, [fn for fn, _ in batch])
+
+            for (_, future), (ok, value) in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _apply(self, fns):
+        conn = self._conn
+        results = []
+        started = time.perf_counter()
+
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for fn in fns:
+                # Ошибка одного задания откатывает только его SAVEPOINT
+                conn.execute('SAVEPOINT job')
+                job_started, changes = time.perf_counter(), conn.total_changes
+                try:
+                    results.append((True, fn(conn)))
+                    conn.execute('RELEASE SAVEPOINT job')
+                    # Запросы внутри задания не оборачиваются — замеряется задание целиком
+                    if db_pool.observer is not None:
+                        db_pool.observer('job', getattr(fn, '__qualname__', 'job'), time.perf_counter() - job_started,
+                                         conn.total_changes - changes)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO SAVEPOINT job')
+                    conn.execute('RELEASE SAVEPOINT job')
+                    results.append((False, e))
+            commit_started = time.perf_counter()
+            conn.execute('COMMIT')
+            if db_pool.observer is not None:
+                db_pool.observer('commit', None, time.perf_counter() - commit_started, None)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            results = [(False, e)] * len(fns)
+
+        elapsed = (time.perf_counter() - started) * 1000
+        self.stats['jobs'] += len(fns)
+        self.stats['failed_jobs'] += sum(1 for ok, _ in results if not ok)
+        self.stats['groups'] += 1
+        self.stats['max_group'] = max(self.stats['max_group'], len(fns))
+        self.stats['commit_ms_total'] += elapsed
+        return results
+
+    def metrics(self):
+        data = dict(self.stats)
+        data['queue_depth'] = self._queue.qsize() if self._queue else 0
+        data['avg_group'] = round(data['jobs'] / data['groups'], 2) if data['groups'] else 0.0
+        data['commit_ms_total'] = round(data['commit_ms_total'], 3)
+        return data
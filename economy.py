@@ -0,0 +1,190 @@
+import json
+import os
+from datetime import datetime, timezone
+
+
+# Определения экономики — общий файл game_config.json (его же читают
+# симулятор simulate.py и клиент), здесь — производные константы
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'game_config.json')
+
+
+def load_config(path=CONFIG_FILE):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+CONFIG = load_config()
+
+GRADE_BONUSES = [grade['bonus'] for grade in CONFIG['grades']]
+
+AUTOCLICKER_TYPES = {
+    clicker['id']: {'base_cps': clicker['base_cps'], 'base_cost': clicker['base_cost']}
+    for clicker in CONFIG['autoclickers']
+}
+
+BUILDING_TYPES = {
+    building['id']: {'base_cps': building['base_cps'], 'base_cost': building['base_cost']}
+    for building in CONFIG['buildings']
+}
+
+AUTOCLICKER_COST_GROWTH = CONFIG['autoclicker_cost_growth']
+BUILDING_COST_GROWTH = CONFIG['building_cost_growth']
+
+# Улучшения: (базовая цена, рост цены за уровень)
+UPGRADE_COSTS = {
+    upgrade['id']: (upgrade['base_cost'], upgrade['cost_growth'])
+    for upgrade in CONFIG['upgrades']
+}
+
+MULTIPLIER_UPGRADE_BONUS = CONFIG['click']['multiplier_upgrade_bonus']
+MAX_GRADE = len(GRADE_BONUSES) - 1
+
+# Клик: рост силы за уровень click_power, базовый крит и прибавки за уровни
+CLICK_POWER_GROWTH = CONFIG['click']['power_growth']
+BASE_CRIT_CHANCE = CONFIG['click']['base_crit_chance']
+CRIT_CHANCE_PER_LEVEL = CONFIG['click']['crit_chance_per_level']
+MAX_CRIT_CHANCE = CONFIG['click']['max_crit_chance']
+BASE_CRIT_MULTIPLIER = CONFIG['click']['base_crit_multiplier']
+CRIT_MULTIPLIER_PER_LEVEL = CONFIG['click']['crit_multiplier_per_level']
+
+GRADE_PROGRESS = CONFIG['grade_progress']
+GRADE_REWARD = CONFIG['grade_reward']
+
+
+def parse_timestamp(value):
+    # В базе — epoch-секунды; строки остались от схемы до миграций:
+    # CURRENT_TIMESTAMP в SQLite — UTC без зоны, ISO-строки бустов — локальное время
+    if isinstance(value, (int, float)):
+        return float(value)
+    if 'T' in value:
+        return datetime.fromisoformat(value).timestamp()
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+
+
+def grade_progress_per_coin(grade):
+    return 100 / (GRADE_PROGRESS['growth'] ** grade * GRADE_PROGRESS['base_coins'])
+
+
+def grade_up_reward(new_grade):
+    return {
+        'coins': GRADE_REWARD['base_coins'] * GRADE_REWARD['coins_growth'] ** new_grade,
+        'gems': GRADE_REWARD['gems_per_grade'] * new_grade
+    }
+
+
+# Доход в секунду без бонуса грейда и бустов
+def base_cps(autoclickers, buildings, upgrades):
+    cps = 0
+    for clicker_id, data in autoclickers.items():
+        clicker = AUTOCLICKER_TYPES.get(clicker_id)
+        if clicker:
+            cps += clicker['base_cps'] * data['quantity'] * data['level']
+    for building_id, data in buildings.items():
+        building = BUILDING_TYPES.get(building_id)
+        if building:
+            cps += building['base_cps'] * data['quantity'] * data['level']
+    return cps * MULTIPLIER_UPGRADE_BONUS ** upgrades.get('multiplier', 0)
+
+
+# Сила клика, шанс и множитель крита — как calculateStats() в game.js
+def click_stats(upgrades):
+    power = CLICK_POWER_GROWTH ** upgrades.get('click_power', 0)
+    crit_chance = min(BASE_CRIT_CHANCE + upgrades.get('crit_chance', 0) * CRIT_CHANCE_PER_LEVEL, MAX_CRIT_CHANCE)
+    crit_multiplier = BASE_CRIT_MULTIPLIER + upgrades.get('crit_power', 0) * CRIT_MULTIPLIER_PER_LEVEL
+    return power, crit_chance, crit_multiplier
+
+
+def click_multiplier(upgrades, grade, boost_multipliers):
+    multiplier = GRADE_BONUSES[grade] * MULTIPLIER_UPGRADE_BONUS ** upgrades.get('multiplier', 0)
+    for boost_multiplier in boost_multipliers:
+        multiplier *= boost_multiplier
+    return multiplier
+
+
+# Разовое начисление (клики) с прогрессом и повышением грейда, как addGradeProgress()
+def add_earnings(state, gain):
+    coins = state['coins'] + gain
+    gems = state['gems']
+    grade = state['current_grade']
+    progress = state['grade_progress'] + gain * grade_progress_per_coin(grade)
+
+    if progress >= 100 and grade < MAX_GRADE:
+        grade += 1
+        progress = 0
+        reward = grade_up_reward(grade)
+        coins += reward['coins']
+        gems += reward['gems']
+
+    return {
+        'coins': coins,
+        'gems': gems,
+        'total_earned': state['total_earned'] + gain,
+        'current_grade': grade,
+        'grade_progress': progress
+    }
+
+
+# Начисление дохода за [since, until] в замкнутой форме.
+# boosts — список (множитель, начало, конец в epoch), буст действует на
+# [начало, конец); начало None — с since. Интервал режется на отрезки
+# с постоянным множителем по началам и концам бустов и моментам повышения
+# грейда, поэтому сложность O(число бустов + число грейдов), а не O(секунд).
+def settle_income(state, cps, boosts, since, until):
+    coins = state['coins']
+    gems = state['gems']
+    total_earned = state['total_earned']
+    grade = state['current_grade']
+    progress = state['grade_progress']
+    earned = 0.0
+
+    boosts = [(multiplier, since if started_at is None else started_at, ends_at)
+              for multiplier, started_at, ends_at in boosts]
+    breakpoints = sorted({moment for _, started_at, ends_at in boosts
+                          for moment in (started_at, ends_at) if since < moment < until})
+    breakpoints.append(until)
+
+    t = since
+    for segment_end in breakpoints:
+        multiplier = 1.0
+        for boost_multiplier, started_at, ends_at in boosts:
+            if started_at <= t < ends_at:
+                multiplier *= boost_multiplier
+
+        while t < segment_end and cps > 0:
+            rate = cps * GRADE_BONUSES[grade] * multiplier
+            per_coin = grade_progress_per_coin(grade)
+
+            if grade < MAX_GRADE:
+                time_to_grade = max(100 - progress, 0) / (rate * per_coin)
+                if t + time_to_grade <= segment_end:
+                    gain = rate * time_to_grade
+                    coins += gain
+                    total_earned += gain
+                    earned += gain
+                    t += time_to_grade
+
+                    grade += 1
+                    progress = 0
+                    reward = grade_up_reward(grade)
+                    coins += reward['coins']
+                    gems += reward['gems']
+                    continue
+
+            gain = rate * (segment_end - t)
+            coins += gain
+            total_earned += gain
+            earned += gain
+            progress += gain * per_coin
+            t = segment_end
+
+        t = segment_end
+
+    return {
+        'coins': coins,
+        'gems': gems,
+        'total_earned': total_earned,
+        'current_grade': grade,
+        'grade_progress': progress,
+        'earned': earned
+    }
+
@@ -0,0 +1,222 @@
+import argparse
+import io
+import json
+import os
+from functools import lru_cache
+
+import assets
+
+try:
+    from PIL import Image, ImageCms, ImageOps, features
+except ImportError:
+    Image = None
+
+
+# Варианты картинок: офлайн-шаг (python images.py build) режет каждую картинку
+# из static/images на несколько ширин и кодирует в AVIF, WebP и исходный формат
+# без метаданных. Сервер по Accept и подсказке ширины выбирает самый легкий
+# подходящий вариант; список вариантов — в manifest.json рядом с ними.
+#
+#   python images.py build     — пересобрать варианты (нужен Pillow)
+#   python images.py report    — сколько байт экономит каждый вариант
+IMAGES_DIR = 'images'
+VARIANTS_DIR = 'images/variants'
+MANIFEST = 'manifest.json'
+
+WIDTHS = (320, 640, 960)
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Формат -> (MIME-тип, расширение, параметры кодировщика)
+FORMATS = {
+    'avif': ('image/avif', 'avif', {'quality': 50, 'speed': 4}),
+    'webp': ('image/webp', 'webp', {'quality': 80, 'method': 6}),
+    'jpeg': ('image/jpeg', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('image/png', 'png', {'optimize': True})
+}
+# Запросы, от которых зависит выбранный вариант
+VARY = ('Accept', 'Sec-CH-Width', 'Width')
+MAX_WIDTH_HINT = 4096
+
+
+def encoders():
+    available = ['jpeg', 'png']
+    if features.check('webp'):
+        available.append('webp')
+    if features.check('avif'):
+        available.append('avif')
+    return available
+
+
+def to_srgb(image):
+    # Метаданные не переносим, поэтому цвет сразу переводим из встроенного профиля в sRGB
+    icc = image.info.get('icc_profile')
+    if icc:
+        try:
+            image = ImageCms.profileToProfile(
+                image, ImageCms.ImageCmsProfile(io.BytesIO(icc)), ImageCms.createProfile('sRGB')
+            )
+        except (ImageCms.PyCMSError, OSError):
+            pass
+    return image
+
+
+def encode(image, fmt):
+    out = io.BytesIO()
+    clean = image.copy()
+    clean.info = {}
+    clean.save(out, format=fmt.upper(), **FORMATS[fmt][2])
+    return out.getvalue()
+
+
+def build_image(path, out_dir, available):
+    with open(path, 'rb') as f:
+        original_bytes = len(f.read())
+
+    source = Image.open(path)
+    base_format = 'png' if source.format == 'PNG' else 'jpeg'
+    image = ImageOps.exif_transpose(source)
+    image = to_srgb(image).convert('RGBA' if base_format == 'png' and 'A' in image.getbands() else 'RGB')
+    width, height = image.size
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    variants = []
+    # Ширины, близкие к исходной, не дают заметной экономии
+    for target in [w for w in WIDTHS if w < width * 0.9] + [width]:
+        resized = image if target == width else image.resize(
+            (target, round(height * target / width)), Image.LANCZOS
+        )
+        for fmt in ('avif', 'webp', base_format):
+            if fmt not in available:
+                continue
+            data = encode(resized, fmt)
+            filename = f'{stem}.{target}w.{FORMATS[fmt][1]}'
+            with open(os.path.join(out_dir, filename), 'wb') as f:
+                f.write(data)
+            variants.append({
+                'file': filename,
+                'format': fmt,
+                'width': target,
+                'height': resized.size[1],
+                'bytes': len(data)
+            })
+
+    return {
+        'width': width,
+        'height': height,
+        'format': base_format,
+        'bytes': original_bytes,
+        'variants': variants
+    }
+
+
+def build(static_dir):
+    if Image is None:
+        raise RuntimeError('Для сборки вариантов нужен Pillow: pip install pillow')
+
+    images_dir = os.path.join(static_dir, IMAGES_DIR)
+    out_dir = os.path.join(static_dir, VARIANTS_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    # Старые варианты удаляем: набор ширин и форматов мог измениться
+    for filename in os.listdir(out_dir):
+        os.remove(os.path.join(out_dir, filename))
+
+    available = encoders()
+    manifest = {}
+    for filename in sorted(os.listdir(images_dir)):
+        if filename.lower().endswith(SOURCE_EXTENSIONS):
+            manifest[f'{IMAGES_DIR}/{filename}'] = build_image(os.path.join(images_dir, filename), out_dir, available)
+
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir):
+    try:
+        with open(os.path.join(static_dir, VARIANTS_DIR, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+# Строки отчета: исходный размер и лучший вариант каждого формата в полную ширину
+def report(manifest):
+    lines = []
+    for name, image in sorted(manifest.items()):
+        lines.append(f"{name} {image['width']}x{image['height']}: {image['bytes']} байт")
+        for fmt in ('avif', 'webp', image['format']):
+            full = [v for v in image['variants'] if v['format'] == fmt and v['width'] == image['width']]
+            if not full:
+                continue
+            size = full[0]['bytes']
+            smallest = min((v for v in image['variants'] if v['format'] == fmt), key=lambda v: v['width'])
+            lines.append(
+                f"  {fmt:5} полная ширина {size:7} байт ({100 - 100 * size / image['bytes']:5.1f}% экономии), "
+                f"{smallest['width']}w {smallest['bytes']:7} байт"
+            )
+    return lines
+
+
+def width_hint(req):
+    for value in (req.args.get('w'), req.headers.get('Sec-CH-Width'), req.headers.get('Width')):
+        try:
+            width = int(value)
+        except (TypeError, ValueError):
+            continue
+        if width > 0:
+            return min(width, MAX_WIDTH_HINT)
+    return None
+
+
+class VariantSelector:
+    def __init__(self, manifest):
+        self.images = manifest
+        # Решение зависит только от (картинка, форматы, ширина) — кэшируем его
+        self._choose = lru_cache(maxsize=4096)(self._pick)
+
+    def __len__(self):
+        return len(self.images)
+
+    # Путь варианта относительно static/ или None — отдать исходный файл
+    def choose(self, name, accept, width):
+        image = self.images.get(name)
+        if image is None:
+            return None
+        accepted = assets.quality_values(accept)
+        formats = tuple(
+            fmt for fmt in ('avif', 'webp')
+            if accepted.get(FORMATS[fmt][0], 0) > 0
+        ) + (image['format'],)
+        return self._choose(name, formats, width)
+
+    def _pick(self, name, formats, width):
+        image = self.images[name]
+        candidates = [v for v in image['variants'] if v['format'] in formats]
+        if not candidates:
+            return None
+
+        widths = sorted({v['width'] for v in candidates})
+        target = widths[-1]
+        if width:
+            target = next((w for w in widths if w >= width), widths[-1])
+        best = min((v for v in candidates if v['width'] == target), key=lambda v: v['bytes'])
+
+        # Вариант в полную ширину тяжелее исходника — отдаем исходник
+        if best['width'] >= image['width'] and best['bytes'] >= image['bytes']:
+            return None
+        return f"{VARIANTS_DIR}/{best['file']}"
+
+    def metrics(self):
+        info = self._choose.cache_info()
+        return {'images': len(self.images), 'decisions_cached': info.currsize, 'hits': info.hits, 'misses': info.misses}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Адаптивные варианты картинок (AVIF/WebP/исходный формат)')
+    parser.add_argument('command', choices=('build', 'report'))
+    parser.add_argument('--static', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'))
+    args = parser.parse_args()
+
+    manifest = build(args.static) if args.command == 'build' else load_manifest(args.static)
+    for line in report(manifest):
+        print(line)
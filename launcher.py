@@ -0,0 +1,337 @@
+import argparse
+import heapq
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import ratelimit
+from leaderboard import CATEGORIES, sort_key
+from shards import shard_for
+
+
+# Многопроцессный режим: по воркеру (app.py или asgi.py) на шард, каждый
+# закреплен за своим ядром, и маршрутизатор на PORT, который отправляет
+# запрос воркеру-владельцу игрока и собирает лидерборд со всех шардов.
+#
+#   python launcher.py --shards 4            (по умолчанию N = число ядер)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Заголовки одного соединения, которые не пересылаются (RFC 7230, 6.1)
+HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+              'te', 'trailers', 'transfer-encoding', 'upgrade', 'host', 'content-length'}
+
+router = Flask(__name__)
+# Адрес клиента за обратным прокси — как в app.py
+PROXY_HOPS = int(os.environ.get('PROXY_HOPS', 0))
+if PROXY_HOPS:
+    router.wsgi_app = ProxyFix(router.wsgi_app, x_for=PROXY_HOPS)
+worker_ports = []
+fanout = ThreadPoolExecutor(max_workers=32, thread_name_prefix='shard-fanout')
+local = threading.local()
+# Открытые потоки /api/events по игрокам: общее число онлайн по всем шардам
+streams = Counter()
+streams_lock = threading.Lock()
+
+
+def shard_connection(index):
+    # Keep-alive соединение к каждому воркеру на поток маршрутизатора
+    connections = getattr(local, 'connections', None)
+    if connections is None:
+        connections = local.connections = {}
+    if index not in connections:
+        connections[index] = http.client.HTTPConnection('127.0.0.1', worker_ports[index], timeout=30)
+    return connections[index]
+
+
+def forward(index, method, path, body=None, headers=None):
+    for attempt in range(2):
+        conn = shard_connection(index)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            return response.status, response.getheaders(), response.read()
+        except (http.client.HTTPException, ConnectionError):
+            # Воркер закрыл keep-alive соединение — переподключаемся один раз
+            conn.close()
+            del local.connections[index]
+            if attempt:
+                raise
+
+
+def forward_json(index, method, path, payload=None):
+    body = json.dumps(payload).encode('utf-8') if payload is not None else None
+    status, _, data = forward(index, method, path, body, {'Content-Type': 'application/json'})
+    return json.loads(data)
+
+
+def request_player_id():
+    if request.view_args and 'player_id' in request.view_args:
+        return request.view_args['player_id']
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        return data.get('player_id')
+    return None
+
+
+def proxy(index):
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP}
+    path = request.full_path if request.query_string else request.path
+    status, response_headers, body = forward(index, request.method, path, request.get_data(), headers)
+    return Response(body, status=status, headers=[
+        (k, v) for k, v in response_headers if k.lower() not in HOP_BY_HOP
+    ])
+
+
+@router.route('/api/player/<player_id>')
+@router.route('/api/save', methods=['POST'])
+@router.route('/api/clicks', methods=['POST'])
+@router.route('/api/buy_upgrade', methods=['POST'])
+@router.route('/api/buy_batch', methods=['POST'])
+@router.route('/api/activate_boost', methods=['POST'])
+@router.route('/api/claim_daily', methods=['POST'])
+def route_player(**kwargs):
+    player_id = request_player_id()
+    if player_id is None:
+        return jsonify({'success': False, 'error': 'Не указан player_id'}), 400
+    return proxy(shard_for(player_id, len(worker_ports)))
+
+
+# Поток событий идет через отдельное соединение к воркеру и пересылается
+# построчно. Шард знает только своих игроков онлайн, поэтому данные события
+# online подменяются общим числом открытых потоков маршрутизатора.
+@router.route('/api/events')
+def route_events():
+    player_id = request.args.get('player_id')
+    if not player_id:
+        return jsonify({'success': False, 'error': 'Не указан player_id'}), 400
+
+    conn = http.client.HTTPConnection('127.0.0.1', worker_ports[shard_for(player_id, len(worker_ports))])
+    conn.request('GET', request.full_path)
+    response = conn.getresponse()
+    if response.status != 200:
+        body = response.read()
+        conn.close()
+        return Response(body, status=response.status, content_type=response.getheader('Content-Type'))
+
+    with streams_lock:
+        streams[player_id] += 1
+
+    def relay():
+        online_data = False
+        try:
+            while True:
+                line = response.readline()
+                if not line:
+                    break
+                if online_data and line.startswith(b'data:'):
+                    line = f'data: {{"players":{len(streams)}}}\n'.encode('ascii')
+                online_data = line == b'event: online\n'
+                yield line
+        finally:
+            conn.close()
+            with streams_lock:
+                streams[player_id] -= 1
+                if streams[player_id] <= 0:
+                    del streams[player_id]
+
+    return Response(relay(), headers=[
+        (k, v) for k, v in response.getheaders() if k.lower() not in HOP_BY_HOP
+    ])
+
+
+def all_shards(fn):
+    return list(fanout.map(fn, range(len(worker_ports))))
+
+
+# Топ каждого шарда уже отсортирован — сливаем k-путевым слиянием
+def merged_top(category):
+    tops = all_shards(lambda index: forward_json(index, 'GET', f'/api/leaderboard/{category}'))
+    merged = heapq.merge(*tops, key=lambda entry: sort_key(category, entry['player_id'], entry))
+    return [entry for _, entry in zip(range(100), merged)]
+
+
+# Сквозное место: место на шарде-владельце плюс число игроков выше ключа на остальных
+def global_rank(category, player_id, local_rank=None):
+    owner = shard_for(player_id, len(worker_ports))
+    if local_rank is None:
+        local_rank = forward_json(owner, 'GET', f'/api/leaderboard/{category}/rank/{player_id}')
+
+    def count(index):
+        if index == owner:
+            return {'before': (local_rank['rank'] or 1) - 1, 'total': local_rank['total']}
+        return forward_json(index, 'POST', f'/api/leaderboard/{category}/before', {'key': local_rank['key'] or []})
+
+    counts = all_shards(count)
+    return {
+        'player_id': player_id,
+        'rank': sum(c['before'] for c in counts) + 1 if local_rank['rank'] else None,
+        'total': sum(c['total'] for c in counts)
+    }
+
+
+# Лидерборд собирается со всех шардов, поэтому частоту его запросов ограничивает
+# маршрутизатор (воркеры в шардированном режиме лидерборд не ограничивают);
+# остальные маршруты ограничивает воркер-владелец игрока
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+rate_limiter = ratelimit.TokenBuckets(ratelimit.parse_limits(os.environ.get('RATE_LIMITS')))
+
+
+@router.before_request
+def admit_request():
+    if not RATE_LIMIT_ENABLED or request.endpoint not in ('route_leaderboard', 'route_leaderboard_rank'):
+        return None
+    # По адресу клиента: player_id в пути и в запросе задает сам клиент
+    retry_after = rate_limiter.take('leaderboard', request.remote_addr)
+    if retry_after:
+        return ratelimit.rejection(retry_after)
+    return None
+
+
+@router.route('/api/leaderboard/<category>')
+def route_leaderboard(category):
+    if category not in CATEGORIES:
+        category = 'total'
+    return jsonify(merged_top(category))
+
+
+@router.route('/api/leaderboard/<category>/rank/<player_id>')
+def route_leaderboard_rank(category, player_id):
+    return jsonify(global_rank(category, player_id))
+
+
+# Старт сессии обслуживает шард игрока; топ и место в нем — только по своему шарду,
+# поэтому их заменяем сквозными
+@router.route('/api/session/<player_id>')
+def route_session(player_id):
+    owner = shard_for(player_id, len(worker_ports))
+    if len(worker_ports) == 1:
+        return proxy(owner)
+
+    status, headers, body = forward(owner, 'GET', request.full_path)
+    if status != 200:
+        # Отказ воркера (в том числе 429 с Retry-After) отдаем как есть
+        return Response(body, status=status, headers=[
+            (k, v) for k, v in headers if k.lower() not in HOP_BY_HOP
+        ])
+    session = json.loads(body)
+    category = session['leaderboard']['category']
+    session['leaderboard'] = {'category': category, 'version': None, 'players': merged_top(category)}
+    session['rank'] = global_rank(category, player_id, session['rank'])
+    return jsonify(session)
+
+
+# У каждого шарда своя база: выгрузка и загрузка — player_dump.py по файлам шардов
+@router.route('/admin/export')
+@router.route('/admin/import', methods=['POST'])
+def route_admin_dump():
+    return jsonify({
+        'success': False,
+        'error': 'В шардированном режиме используйте python player_dump.py для файла каждого шарда'
+    }), 501
+
+
+# Снимок каждого шарда — его воркером (файлы снимков с именем шарда)
+@router.route('/admin/backup', methods=['POST'])
+def route_admin_backup():
+    headers = {'X-Admin-Token': request.headers.get('X-Admin-Token', '')}
+
+    def snapshot(index):
+        status, _, data = forward(index, 'POST', '/admin/backup', b'', headers)
+        return status, json.loads(data)
+
+    results = all_shards(snapshot)
+    status = max(status for status, _ in results)
+    return jsonify({
+        'success': status == 200,
+        'shards': [result for _, result in results]
+    }), status
+
+
+@router.route('/health')
+def route_health():
+    shard_health = all_shards(lambda index: forward_json(index, 'GET', '/health'))
+    return jsonify({'status': 'ok', 'rate_limit': rate_limiter.metrics(), 'shards': shard_health})
+
+
+# Главная страница и статика одинаковы на всех воркерах
+@router.route('/', defaults={'path': ''})
+@router.route('/<path:path>')
+def route_any(path):
+    return proxy(0)
+
+
+def pin_to_core(pid, core):
+    if hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(pid, {core})
+        except OSError as e:
+            print(f"Не удалось закрепить процесс {pid} за ядром {core}: {e}")
+
+
+def start_workers(count, base_port, script):
+    if hasattr(os, 'sched_getaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+
+    workers = []
+    for index in range(count):
+        port = base_port + 1 + index
+        env = dict(os.environ, DB_SHARDS=str(count), DB_SHARD=str(index), PORT=str(port), HOST='127.0.0.1')
+        process = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, script)], env=env, cwd=BASE_DIR)
+        pin_to_core(process.pid, cores[index % len(cores)])
+        workers.append(process)
+        worker_ports.append(port)
+    return workers
+
+
+def wait_ready(timeout=30):
+    deadline = time.monotonic() + timeout
+    for index in range(len(worker_ports)):
+        while True:
+            try:
+                forward(index, 'GET', '/health')
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f'Шард {index} не запустился')
+                time.sleep(0.1)
+
+
+def stop_workers(workers):
+    # SIGTERM: воркеры сбрасывают буферы сохранений через atexit
+    for process in workers:
+        if process.poll() is None:
+            process.terminate()
+    for process in workers:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Запуск шардированного кластера воркеров')
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('DB_SHARDS', os.cpu_count() or 1)))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 10000)))
+    parser.add_argument('--asgi', action='store_true', help='воркеры через asgi.py вместо app.py')
+    args = parser.parse_args()
+
+    workers = start_workers(args.shards, args.port, 'asgi.py' if args.asgi else 'app.py')
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        wait_ready()
+        print(f"💰 Coin Clicker Master: {args.shards} шардов, маршрутизатор на порту {args.port}")
+        router.run(host=os.environ.get('HOST', '0.0.0.0'), port=args.port, threaded=True)
+    finally:
+        stop_workers(workers)
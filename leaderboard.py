@@ -0,0 +1,151 @@
+import atexit
+import threading
+
+from sortedcontainers import SortedList
+
+
+# Ключи сортировки категорий (по убыванию), как в ORDER BY старых запросов
+CATEGORIES = {
+    'total': lambda e: (e['total_score'],),
+    'coins': lambda e: (e['coins_score'],),
+    'grade': lambda e: (e['grade_score'], e['total_score']),
+    'clicks': lambda e: (e['total_clicks'] or 0,)
+}
+
+ENTRY_FIELDS = ('player_id', 'username', 'total_score', 'coins_score', 'grade_score',
+                'achievements_score', 'last_update', 'total_clicks')
+
+
+def total_score(coins, current_grade, achievements_completed):
+    return coins / 1000 + current_grade * 1000 + achievements_completed * 100
+
+
+# Ключ в порядке возрастания: меньший ключ — выше место (общий для всех шардов)
+def sort_key(category, player_id, entry):
+    return tuple(-(value or 0) for value in CATEGORIES[category](entry)) + (player_id,)
+
+
+# Материализованный лидерборд: отсортированный список на каждую категорию,
+# топ-K и место игрока за O(log n) без сканирования таблицы
+class RankedLeaderboard:
+    def __init__(self):
+        self._entries = {}
+        self._ranked = {category: SortedList() for category in CATEGORIES}
+        self._keys = {category: {} for category in CATEGORIES}
+        self._lock = threading.Lock()
+        self._persist_thread = None
+        self._stopped = threading.Event()
+
+    def _reindex(self, player_id, entry):
+        for category, ranked in self._ranked.items():
+            keys = self._keys[category]
+            new_key = sort_key(category, player_id, entry)
+            old_key = keys.get(player_id)
+            if old_key == new_key:
+                continue
+            if old_key is not None:
+                ranked.remove(old_key)
+            ranked.add(new_key)
+            keys[player_id] = new_key
+
+    def load(self, conn):
+        rows = conn.execute('''
+            SELECT l.*, p.total_clicks
+            FROM leaderboard l
+            LEFT JOIN players p ON l.player_id = p.player_id
+        ''').fetchall()
+
+        with self._lock:
+            self._entries = {}
+            self._ranked = {category: SortedList() for category in CATEGORIES}
+            self._keys = {category: {} for category in CATEGORIES}
+            for row in rows:
+                entry = {field: row[field] for field in ENTRY_FIELDS}
+                self._entries[entry['player_id']] = entry
+                for category in CATEGORIES:
+                    key = sort_key(category, entry['player_id'], entry)
+                    self._keys[category][entry['player_id']] = key
+            for category, keys in self._keys.items():
+                self._ranked[category] = SortedList(keys.values())
+        return len(rows)
+
+    def update(self, player_id, **fields):
+        with self._lock:
+            entry = dict(self._entries.get(player_id) or {field: None for field in ENTRY_FIELDS})
+            entry.update(fields)
+            entry['player_id'] = player_id
+            self._entries[player_id] = entry
+            self._reindex(player_id, entry)
+
+    def remove(self, player_id):
+        with self._lock:
+            if self._entries.pop(player_id, None) is None:
+                return
+            for category, ranked in self._ranked.items():
+                ranked.remove(self._keys[category].pop(player_id))
+
+    def top(self, category, limit=100):
+        if category not in CATEGORIES:
+            category = 'total'
+        with self._lock:
+            return [dict(self._entries[key[-1]]) for key in self._ranked[category].islice(0, limit)]
+
+    def rank(self, category, player_id):
+        if category not in CATEGORIES:
+            category = 'total'
+        with self._lock:
+            key = self._keys[category].get(player_id)
+            if key is None:
+                return None
+            return self._ranked[category].index(key) + 1
+
+    def key(self, category, player_id):
+        if category not in CATEGORIES:
+            category = 'total'
+        with self._lock:
+            return self._keys[category].get(player_id)
+
+    # Сколько игроков стоит выше ключа key — для сквозного места по шардам
+    def count_before(self, category, key):
+        if category not in CATEGORIES:
+            category = 'total'
+        with self._lock:
+            return self._ranked[category].bisect_left(tuple(key))
+
+    def entry(self, player_id):
+        with self._lock:
+            entry = self._entries.get(player_id)
+            return dict(entry) if entry else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def persist_top(self, conn, limit=100):
+        rows = []
+        for category in CATEGORIES:
+            for position, entry in enumerate(self.top(category, limit), start=1):
+                rows.append((category, position, entry['player_id'], CATEGORIES[category](entry)[0]))
+
+        conn.execute('DELETE FROM leaderboard_top')
+        conn.executemany('''
+            INSERT INTO leaderboard_top (category, rank, player_id, score)
+            VALUES (?, ?, ?, ?)
+        ''', rows)
+        return len(rows)
+
+    # run_write выполняет persist_top в транзакции (см. app.run_write)
+    def start_persist(self, run_write, interval=60.0, limit=100):
+        def persist():
+            run_write(lambda conn: self.persist_top(conn, limit))
+
+        def run():
+            while not self._stopped.wait(interval):
+                try:
+                    persist()
+                except Exception as e:
+                    print(f"Ошибка сохранения топа лидерборда: {e}")
+
+        if self._persist_thread is None:
+            self._persist_thread = threading.Thread(target=run, name='leaderboard-persist', daemon=True)
+            self._persist_thread.start()
+            atexit.register(lambda: (self._stopped.set(), persist()))
@@ -0,0 +1,282 @@
+import bisect
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+
+from flask import Response, g, jsonify, request
+
+import db_pool
+
+
+# Метрики в формате Prometheus: счетчики и гистограммы с фиксированными
+# корзинами, все значения в памяти процесса. Запись — один lock и пара
+# сложений, поэтому инструментирование включено всегда; профилирование
+# cProfile включается на лету для выбранных маршрутов.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Длина метки запроса: полные тексты SQL не нужны и раздувают /metrics
+STATEMENT_LABEL_LENGTH = 80
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Последняя ячейка — значения больше верхней границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    # collector() -> [(имя, labels, значение)] — снимаются при каждом /metrics
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.counts), h.sum, h.count, h.buckets)) for key, h in self._histograms.items()
+            )
+
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                text = self._help.get(name, (kind, name))[1]
+                lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{format_labels(labels)} {value}')
+
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                header(name, 'gauge')
+                lines.append(f'{name}{format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+registry.describe('coin_http_requests_total', 'counter', 'HTTP requests by route, method and status')
+registry.describe('coin_http_request_duration_seconds', 'histogram', 'Request handling time by route')
+registry.describe('coin_http_request_bytes', 'histogram', 'Request body size by route')
+registry.describe('coin_http_response_bytes', 'histogram', 'Response body size by route')
+registry.describe('coin_sqlite_duration_seconds', 'histogram', 'Time inside SQLite by operation and statement')
+registry.describe('coin_sqlite_rows_total', 'counter', 'Rows changed by statement')
+registry.describe('coin_sqlite_connection_held_seconds', 'histogram', 'Time a pooled connection stays checked out')
+
+
+def statement_label(sql):
+    return ' '.join(sql.split())[:STATEMENT_LABEL_LENGTH]
+
+
+def observe_sql(op, sql, seconds, rows):
+    if op == 'connection':
+        registry.observe('coin_sqlite_connection_held_seconds', (), seconds)
+        return
+    statement = statement_label(sql) if sql else op
+    registry.observe('coin_sqlite_duration_seconds', (('op', op), ('statement', statement)), seconds)
+    if rows is not None and rows > 0:
+        registry.inc('coin_sqlite_rows_total', (('statement', statement),), rows)
+
+
+# Выборочное профилирование: маршрут -> доля запросов, которые профилируются
+class RouteProfiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rates = {}
+        self._stats = {}
+        self._samples = {}
+
+    def configure(self, route, rate):
+        with self._lock:
+            if rate > 0:
+                self.rates[route] = min(rate, 1.0)
+            else:
+                self.rates.pop(route, None)
+
+    def should_sample(self, route):
+        rate = self.rates.get(route)
+        return rate is not None and random.random() < rate
+
+    def record(self, route, profile):
+        with self._lock:
+            stats = self._stats.get(route)
+            if stats is None:
+                self._stats[route] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+            self._samples[route] = self._samples.get(route, 0) + 1
+
+    def report(self, route, sort='cumulative', limit=30):
+        with self._lock:
+            stats = self._stats.get(route)
+            samples = self._samples.get(route, 0)
+            if stats is None:
+                return None
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats(sort).print_stats(limit)
+        return f'{samples} профилированных запросов\n{out.getvalue()}'
+
+    def reset(self, route=None):
+        with self._lock:
+            if route is None:
+                self._stats.clear()
+                self._samples.clear()
+            else:
+                self._stats.pop(route, None)
+                self._samples.pop(route, None)
+
+    def status(self):
+        with self._lock:
+            return {'rates': dict(self.rates), 'samples': dict(self._samples)}
+
+
+profiler = RouteProfiler()
+
+
+def route_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_route = route_label()
+    if profiler.rates and profiler.should_sample(g.metrics_route):
+        g.metrics_profile = cProfile.Profile()
+        g.metrics_profile.enable()
+
+
+def after_request(response):
+    g.metrics_status = response.status_code
+    # Только Content-Length: тело потоковых ответов не читаем
+    registry.observe('coin_http_response_bytes', (('route', g.metrics_route),),
+                     response.content_length or 0, SIZE_BUCKETS)
+    return response
+
+
+def teardown_request(exc):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    route = g.pop('metrics_route')
+
+    profile = g.pop('metrics_profile', None)
+    if profile is not None:
+        profile.disable()
+        profiler.record(route, profile)
+
+    status = g.pop('metrics_status', 500 if exc is not None else 200)
+    registry.inc('coin_http_requests_total', (('route', route), ('method', request.method), ('status', status)))
+    registry.observe('coin_http_request_duration_seconds', (('route', route),), elapsed)
+    registry.observe('coin_http_request_bytes', (('route', route),), request.content_length or 0, SIZE_BUCKETS)
+
+
+def numeric_gauges(prefix, data):
+    return [
+        (f'{prefix}_{key}', (), value)
+        for key, value in data.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
+
+
+# Подключение к приложению: хуки запросов, наблюдатель SQLite и маршруты
+def init_app(app, collectors=(), admin_token=None):
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
+    db_pool.observer = observe_sql
+    for collector in collectors:
+        registry.add_collector(collector)
+
+    def authorized():
+        return admin_token and request.headers.get('X-Admin-Token') == admin_token
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    # Профилирование на лету (нужен ADMIN_TOKEN):
+    #   POST /metrics/profile {"route": "/api/save", "rate": 0.05}   — включить, rate 0 — выключить
+    #   GET  /metrics/profile?route=/api/save&sort=tottime           — отчет pstats
+    @app.route('/metrics/profile', methods=['GET', 'POST', 'DELETE'])
+    def metrics_profile():
+        if not authorized():
+            return jsonify({'success': False, 'error': 'Нет доступа'}), 403
+
+        if request.method == 'POST':
+            data = request.json or {}
+            profiler.configure(data['route'], float(data.get('rate', 0)))
+            return jsonify({'success': True, **profiler.status()})
+
+        if request.method == 'DELETE':
+            profiler.reset(request.args.get('route'))
+            return jsonify({'success': True, **profiler.status()})
+
+        route = request.args.get('route')
+        if route is None:
+            return jsonify(profiler.status())
+        report = profiler.report(route, request.args.get('sort', 'cumulative'), int(request.args.get('limit', 30)))
+        if report is None:
+            return jsonify({'success': False, 'error': 'Нет профилей для маршрута'}), 404
+        return Response(report, mimetype='text/plain')
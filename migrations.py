@@ -0,0 +1,489 @@
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import economy
+
+
+# Версионированная схема базы: шаги применяются по порядку, каждый в своей
+# транзакции, номер последнего примененного шага хранится в schema_version.
+# Новый шаг — новая функция в конце MIGRATIONS; старые шаги не меняются.
+
+# Текущее время в epoch-секундах для DEFAULT и запросов
+EPOCH_NOW = "(CAST(strftime('%s', 'now') AS INTEGER))"
+
+
+def to_epoch(value):
+    # TEXT-время старой схемы: CURRENT_TIMESTAMP (UTC) или isoformat() (локальное)
+    if value is None or value == '':
+        return None
+    try:
+        return int(economy.parse_timestamp(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def baseline(conn):
+    # Схема из init_db() до появления миграций — базы любого возраста приводятся к ней
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS players (
+        player_id TEXT PRIMARY KEY,
+        username TEXT,
+        coins REAL DEFAULT 0,
+        gems INTEGER DEFAULT 10,
+        tokens INTEGER DEFAULT 0,
+        total_clicks INTEGER DEFAULT 0,
+        total_earned REAL DEFAULT 0,
+        current_grade INTEGER DEFAULT 0,
+        grade_progress REAL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        revision INTEGER DEFAULT 0
+    )
+    ''')
+
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(players)')]
+    if 'revision' not in columns:
+        conn.execute('ALTER TABLE players ADD COLUMN revision INTEGER DEFAULT 0')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS upgrades (
+        player_id TEXT,
+        upgrade_id TEXT,
+        level INTEGER DEFAULT 0,
+        purchased_at TIMESTAMP,
+        PRIMARY KEY (player_id, upgrade_id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS autoclickers (
+        player_id TEXT,
+        clicker_id TEXT,
+        quantity INTEGER DEFAULT 0,
+        level INTEGER DEFAULT 1,
+        purchased_at TIMESTAMP,
+        PRIMARY KEY (player_id, clicker_id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS buildings (
+        player_id TEXT,
+        building_id TEXT,
+        quantity INTEGER DEFAULT 0,
+        level INTEGER DEFAULT 1,
+        purchased_at TIMESTAMP,
+        PRIMARY KEY (player_id, building_id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS achievements (
+        player_id TEXT,
+        achievement_id TEXT,
+        progress REAL DEFAULT 0,
+        completed BOOLEAN DEFAULT 0,
+        completed_at TIMESTAMP,
+        PRIMARY KEY (player_id, achievement_id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS daily_rewards (
+        player_id TEXT,
+        day INTEGER DEFAULT 1,
+        claimed_at TIMESTAMP,
+        streak INTEGER DEFAULT 1,
+        PRIMARY KEY (player_id, day)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS leaderboard (
+        player_id TEXT PRIMARY KEY,
+        username TEXT,
+        total_score REAL DEFAULT 0,
+        coins_score REAL DEFAULT 0,
+        grade_score INTEGER DEFAULT 0,
+        achievements_score INTEGER DEFAULT 0,
+        last_update TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS active_boosts (
+        player_id TEXT,
+        boost_id TEXT,
+        multiplier REAL DEFAULT 1.0,
+        ends_at TIMESTAMP,
+        PRIMARY KEY (player_id, boost_id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS leaderboard_top (
+        category TEXT,
+        rank INTEGER,
+        player_id TEXT,
+        score REAL,
+        PRIMARY KEY (category, rank)
+    )
+    ''')
+
+
+# Новая схема таблиц: время — INTEGER epoch (UTC), таблицы с составным
+# первичным ключом — WITHOUT ROWID (строки лежат прямо в B-дереве ключа,
+# без отдельного автоиндекса и лишнего поиска по rowid)
+COMPACT_TABLES = {
+    'players': f'''
+    CREATE TABLE players (
+        player_id TEXT PRIMARY KEY,
+        username TEXT,
+        coins REAL DEFAULT 0,
+        gems INTEGER DEFAULT 10,
+        tokens INTEGER DEFAULT 0,
+        total_clicks INTEGER DEFAULT 0,
+        total_earned REAL DEFAULT 0,
+        current_grade INTEGER DEFAULT 0,
+        grade_progress REAL DEFAULT 0,
+        created_at INTEGER DEFAULT {EPOCH_NOW},
+        last_active INTEGER DEFAULT {EPOCH_NOW},
+        revision INTEGER DEFAULT 0
+    )''',
+    'upgrades': '''
+    CREATE TABLE upgrades (
+        player_id TEXT NOT NULL,
+        upgrade_id TEXT NOT NULL,
+        level INTEGER DEFAULT 0,
+        purchased_at INTEGER,
+        PRIMARY KEY (player_id, upgrade_id)
+    ) WITHOUT ROWID''',
+    'autoclickers': '''
+    CREATE TABLE autoclickers (
+        player_id TEXT NOT NULL,
+        clicker_id TEXT NOT NULL,
+        quantity INTEGER DEFAULT 0,
+        level INTEGER DEFAULT 1,
+        purchased_at INTEGER,
+        PRIMARY KEY (player_id, clicker_id)
+    ) WITHOUT ROWID''',
+    'buildings': '''
+    CREATE TABLE buildings (
+        player_id TEXT NOT NULL,
+        building_id TEXT NOT NULL,
+        quantity INTEGER DEFAULT 0,
+        level INTEGER DEFAULT 1,
+        purchased_at INTEGER,
+        PRIMARY KEY (player_id, building_id)
+    ) WITHOUT ROWID''',
+    'achievements': '''
+    CREATE TABLE achievements (
+        player_id TEXT NOT NULL,
+        achievement_id TEXT NOT NULL,
+        progress REAL DEFAULT 0,
+        completed BOOLEAN DEFAULT 0,
+        completed_at INTEGER,
+        PRIMARY KEY (player_id, achievement_id)
+    ) WITHOUT ROWID''',
+    'daily_rewards': '''
+    CREATE TABLE daily_rewards (
+        player_id TEXT NOT NULL,
+        day INTEGER NOT NULL DEFAULT 1,
+        claimed_at INTEGER,
+        streak INTEGER DEFAULT 1,
+        PRIMARY KEY (player_id, day)
+    ) WITHOUT ROWID''',
+    'leaderboard': f'''
+    CREATE TABLE leaderboard (
+        player_id TEXT PRIMARY KEY,
+        username TEXT,
+        total_score REAL DEFAULT 0,
+        coins_score REAL DEFAULT 0,
+        grade_score INTEGER DEFAULT 0,
+        achievements_score INTEGER DEFAULT 0,
+        last_update INTEGER DEFAULT {EPOCH_NOW}
+    )''',
+    'active_boosts': '''
+    CREATE TABLE active_boosts (
+        player_id TEXT NOT NULL,
+        boost_id TEXT NOT NULL,
+        multiplier REAL DEFAULT 1.0,
+        ends_at INTEGER,
+        PRIMARY KEY (player_id, boost_id)
+    ) WITHOUT ROWID''',
+    'leaderboard_top': '''
+    CREATE TABLE leaderboard_top (
+        category TEXT NOT NULL,
+        rank INTEGER NOT NULL,
+        player_id TEXT,
+        score REAL,
+        PRIMARY KEY (category, rank)
+    ) WITHOUT ROWID'''
+}
+
+TIMESTAMP_COLUMNS = {'created_at', 'last_active', 'purchased_at', 'completed_at',
+                     'claimed_at', 'last_update', 'ends_at'}
+
+
+def compact_layout(conn):
+    # Пересборка таблиц: CREATE новой, перенос данных с переводом времени, замена старой
+    for table, ddl in COMPACT_TABLES.items():
+        conn.execute(ddl.replace(f'CREATE TABLE {table}', f'CREATE TABLE {table}_new', 1))
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table}_new)')]
+        keys = [row[1] for row in conn.execute(f'PRAGMA table_info({table}_new)') if row[5]]
+        select = ', '.join(f'to_epoch({c})' if c in TIMESTAMP_COLUMNS else c for c in columns)
+        where = ' AND '.join(f'{k} IS NOT NULL' for k in keys)
+        conn.execute(f'INSERT OR IGNORE INTO {table}_new ({", ".join(columns)}) SELECT {select} FROM {table} WHERE {where}')
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+
+
+def indexes(conn):
+    # ORDER BY лидерборда (загрузка и выборки топа без сортировки всей таблицы)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_leaderboard_total ON leaderboard (total_score DESC)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_leaderboard_coins ON leaderboard (coins_score DESC)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_leaderboard_grade ON leaderboard (grade_score DESC, total_score DESC)')
+    # Поиск истекших бустов по времени окончания (покрывающий: ключ таблицы входит в индекс)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_active_boosts_ends ON active_boosts (ends_at)')
+    # daily_rewards ORDER BY day DESC LIMIT 1 обслуживает кластерный ключ (player_id, day)
+    conn.execute('ANALYZE')
+
+
+def click_windows(conn):
+    # Конец последнего принятого окна кликов (epoch, мс) — защита от повторной отправки пачки
+    conn.execute('ALTER TABLE players ADD COLUMN clicks_until INTEGER DEFAULT 0')
+
+
+def daily_state(conn):
+    # Одна строка состояния на игрока вместо строки на каждое получение:
+    # в старой таблице ключ (player_id, day) повторялся после 7-дневного цикла
+    conn.execute('''
+    CREATE TABLE daily_state (
+        player_id TEXT PRIMARY KEY,
+        day INTEGER NOT NULL,
+        streak INTEGER NOT NULL,
+        claimed_at INTEGER NOT NULL
+    ) WITHOUT ROWID''')
+    # Кому награда уже доступна: claimed_at <= now - сутки (покрывающий: ключ таблицы входит в индекс)
+    conn.execute('CREATE INDEX idx_daily_state_claimed ON daily_state (claimed_at)')
+    conn.execute('''
+    CREATE TABLE daily_log (
+        player_id TEXT NOT NULL,
+        claimed_at INTEGER NOT NULL,
+        day INTEGER,
+        streak INTEGER,
+        coins INTEGER,
+        gems INTEGER,
+        tokens INTEGER,
+        PRIMARY KEY (player_id, claimed_at)
+    ) WITHOUT ROWID''')
+    conn.execute('''
+    CREATE TABLE daily_totals (
+        player_id TEXT PRIMARY KEY,
+        claims INTEGER DEFAULT 0,
+        coins INTEGER DEFAULT 0,
+        gems INTEGER DEFAULT 0,
+        tokens INTEGER DEFAULT 0,
+        first_at INTEGER,
+        last_at INTEGER,
+        best_streak INTEGER DEFAULT 0
+    ) WITHOUT ROWID''')
+
+    # Состояние — последнее получение игрока; вся старая таблица уходит в историю
+    conn.execute('''
+        INSERT OR REPLACE INTO daily_state (player_id, day, streak, claimed_at)
+        SELECT player_id, day, COALESCE(streak, 1), claimed_at FROM daily_rewards
+        WHERE claimed_at IS NOT NULL
+        ORDER BY player_id, claimed_at
+    ''')
+    conn.execute('''
+        INSERT OR IGNORE INTO daily_log (player_id, claimed_at, day, streak)
+        SELECT player_id, claimed_at, day, streak FROM daily_rewards
+        WHERE claimed_at IS NOT NULL
+    ''')
+    conn.execute('DROP TABLE daily_rewards')
+
+
+def clicks_index(conn):
+    # Категория clicks лидерборда сортирует по players.total_clicks
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_players_clicks ON players (total_clicks DESC)')
+    conn.execute('ANALYZE')
+
+
+def boost_start(conn):
+    # Начало действия буста для досчета дохода: буст умножает доход только на
+    # [started_at, ends_at). У строк до миграции начало неизвестно (NULL) —
+    # такие бусты, как и раньше, считаются действующими с last_active
+    conn.execute('ALTER TABLE active_boosts ADD COLUMN started_at INTEGER')
+
+
+MIGRATIONS = [
+    (1, 'baseline', baseline),
+    (2, 'compact_layout', compact_layout),
+    (3, 'indexes', indexes),
+    (4, 'click_windows', click_windows),
+    (5, 'daily_state', daily_state),
+    (6, 'clicks_index', clicks_index),
+    (7, 'boost_start', boost_start)
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def connect(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.create_function('to_epoch', 1, to_epoch, deterministic=True)
+    return conn
+
+
+def current_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at INTEGER
+        )
+    ''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(path, target=LATEST_VERSION):
+    conn = connect(path)
+    conn.execute('PRAGMA journal_mode = WAL')
+    applied = []
+    try:
+        for version, name, step in MIGRATIONS:
+            if version > target:
+                break
+            # Версию перепроверяем под блокировкой: другой процесс мог успеть раньше
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if current_version(conn) >= version:
+                    conn.execute('ROLLBACK')
+                    continue
+                step(conn)
+                conn.execute('INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                             (version, name, int(time.time())))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            applied.append((version, name))
+    finally:
+        conn.close()
+    return applied
+
+
+# Отчет: планы запросов и задержки до и после миграций на одной и той же базе
+
+def report_queries(version):
+    compact = version >= 2
+    now = EPOCH_NOW if compact else 'CURRENT_TIMESTAMP'
+    return {
+        'leaderboard_total': 'SELECT * FROM leaderboard ORDER BY total_score DESC LIMIT 100',
+        'leaderboard_grade': 'SELECT * FROM leaderboard ORDER BY grade_score DESC, total_score DESC LIMIT 100',
+        'leaderboard_clicks': 'SELECT player_id, total_clicks FROM players ORDER BY total_clicks DESC LIMIT 100',
+        'player_boosts': f'SELECT * FROM active_boosts WHERE player_id = :player_id AND ends_at > {now}',
+        'expired_boosts': f'SELECT player_id, boost_id FROM active_boosts WHERE ends_at <= {now}',
+        'last_daily': 'SELECT * FROM daily_state WHERE player_id = :player_id' if version >= 5 else
+                      'SELECT * FROM daily_rewards WHERE player_id = :player_id ORDER BY day DESC LIMIT 1',
+        'player_upgrades': 'SELECT upgrade_id, level FROM upgrades WHERE player_id = :player_id'
+    }
+
+
+def seed(conn, players):
+    # Синтетические данные в формате базовой схемы (TEXT-время)
+    rng = random.Random(42)
+    conn.execute('BEGIN')
+    for n in range(players):
+        player_id = f'seed_{n}'
+        coins = rng.random() * 1e6
+        grade = rng.randrange(10)
+        conn.execute('INSERT INTO players (player_id, username, coins, current_grade) VALUES (?, ?, ?, ?)',
+                     (player_id, player_id, coins, grade))
+        conn.execute('INSERT INTO leaderboard (player_id, username, total_score, coins_score, grade_score) VALUES (?, ?, ?, ?, ?)',
+                     (player_id, player_id, coins / 1000 + grade * 1000, coins, grade))
+        for upgrade_id in ('click_power', 'multiplier', 'crit_chance', 'crit_power'):
+            conn.execute("INSERT INTO upgrades VALUES (?, ?, ?, CURRENT_TIMESTAMP)", (player_id, upgrade_id, rng.randrange(20)))
+        for day in range(1, rng.randrange(2, 8)):
+            conn.execute("INSERT INTO daily_rewards VALUES (?, ?, strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime', ?), 1)",
+                         (player_id, day, f'-{8 - day} days'))
+        for boost_id in ('double', 'triple')[:rng.randrange(3)]:
+            conn.execute("INSERT INTO active_boosts VALUES (?, ?, 2.0, strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime', ?))",
+                         (player_id, boost_id, f'{rng.randrange(-3600, 3600)} seconds'))
+    conn.execute('COMMIT')
+
+
+def measure(conn, version, players, iterations):
+    results = {}
+    for name, sql in report_queries(version).items():
+        params = {'player_id': 'seed_0'}
+        plan = [row['detail'] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+        samples = []
+        for i in range(iterations):
+            params = {'player_id': f'seed_{i % players}'}
+            started = time.perf_counter()
+            rows = conn.execute(sql, params).fetchall()
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = {'plan': plan, 'ms': statistics.median(samples), 'rows': len(rows)}
+    return results
+
+
+def report(players=20000, iterations=200):
+    path = os.path.join(tempfile.mkdtemp(prefix='coin_clicker_migrations_'), 'report.db')
+    migrate(path, target=1)
+    conn = connect(path)
+    # Без WAL: размер файла сравним до и после
+    conn.execute('PRAGMA journal_mode = DELETE')
+    seed(conn, players)
+    conn.execute('VACUUM')
+    before = measure(conn, 1, players, iterations)
+    size_before = os.path.getsize(path)
+    conn.close()
+
+    migrate(path)
+    conn = connect(path)
+    conn.execute('PRAGMA journal_mode = DELETE')
+    conn.execute('VACUUM')
+    after = measure(conn, LATEST_VERSION, players, iterations)
+    size_after = os.path.getsize(path)
+    conn.close()
+
+    print(f'SQLite {sqlite3.sqlite_version}, {players} игроков, медиана из {iterations} запусков')
+    for name in before:
+        # Разное число строк у сравнений времени: TEXT-сравнение isoformat() с CURRENT_TIMESTAMP было неверным
+        print(f'\n{name}: {before[name]["ms"]:.3f} ms ({before[name]["rows"]} строк) -> '
+              f'{after[name]["ms"]:.3f} ms ({after[name]["rows"]} строк)')
+        print('  до:    ' + ' | '.join(before[name]['plan']))
+        print('  после: ' + ' | '.join(after[name]['plan']))
+    print(f'\nРазмер файла: {size_before / 1024:.0f} KB -> {size_after / 1024:.0f} KB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Миграции схемы базы')
+    sub = parser.add_subparsers(dest='command', required=True)
+    up = sub.add_parser('migrate', help='применить недостающие миграции')
+    up.add_argument('db')
+    up.add_argument('--target', type=int, default=LATEST_VERSION)
+    status = sub.add_parser('status', help='текущая версия схемы')
+    status.add_argument('db')
+    bench = sub.add_parser('report', help='планы запросов и задержки до/после миграций')
+    bench.add_argument('--players', type=int, default=20000)
+    bench.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        for version, name in migrate(args.db, args.target):
+            print(f'Применена миграция {version}: {name}')
+    elif args.command == 'status':
+        conn = connect(args.db)
+        print(f'Версия схемы: {current_version(conn)} из {LATEST_VERSION}')
+        conn.close()
+    else:
+        report(args.players, args.iterations)
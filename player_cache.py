@@ -0,0 +1,126 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+# Весь снимок игрока одним запросом: дочерние таблицы агрегируются в JSON
+SNAPSHOT_QUERY = '''
+    SELECT p.*,
+        (SELECT json_group_object(upgrade_id, level)
+            FROM upgrades WHERE player_id = p.player_id) AS upgrades_json,
+        (SELECT json_group_object(clicker_id, json_object('quantity', quantity, 'level', level))
+            FROM autoclickers WHERE player_id = p.player_id) AS autoclickers_json,
+        (SELECT json_group_object(building_id, json_object('quantity', quantity, 'level', level))
+            FROM buildings WHERE player_id = p.player_id) AS buildings_json,
+        (SELECT json_group_object(achievement_id, json_object('progress', progress, 'completed', completed))
+            FROM achievements WHERE player_id = p.player_id) AS achievements_json,
+        (SELECT json_group_object(boost_id, json_object('multiplier', multiplier, 'started_at', started_at, 'ends_at', ends_at))
+            FROM active_boosts WHERE player_id = p.player_id) AS boosts_json,
+        (SELECT achievements_score FROM leaderboard WHERE player_id = p.player_id) AS achievements_completed,
+        (SELECT streak FROM daily_state WHERE player_id = p.player_id) AS daily_streak
+    FROM players p
+    WHERE p.player_id = ?
+'''
+
+SNAPSHOT_CHILDREN = {
+    'upgrades_json': 'upgrades',
+    'autoclickers_json': 'autoclickers',
+    'buildings_json': 'buildings',
+    'achievements_json': 'achievements',
+    'boosts_json': 'boosts'
+}
+
+
+def load_snapshot(conn, player_id):
+    row = conn.execute(SNAPSHOT_QUERY, (player_id,)).fetchone()
+    if row is None:
+        return None
+
+    data = dict(row)
+    for column, key in SNAPSHOT_CHILDREN.items():
+        data[key] = json.loads(data.pop(column) or '{}')
+    return data
+
+
+# LRU-кэш состояния игроков с ограничением размера и TTL
+class PlayerCache:
+    def __init__(self, max_size=10000, ttl=30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'invalidations': 0,
+            'loads': 0,
+            'load_ms_total': 0.0,
+            'load_ms_max': 0.0
+        }
+
+    def get(self, player_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(player_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(player_id)
+                self.stats['hits'] += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[player_id]
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, player_id, snapshot):
+        with self._lock:
+            self._entries[player_id] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(player_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def update(self, player_id, fn):
+        # Обновление на месте: fn получает старый снимок и возвращает новый
+        with self._lock:
+            entry = self._entries.get(player_id)
+            if entry is None:
+                return False
+            self._entries[player_id] = (entry[0], fn(entry[1]))
+            return True
+
+    def invalidate(self, player_id):
+        with self._lock:
+            if self._entries.pop(player_id, None) is not None:
+                self.stats['invalidations'] += 1
+
+    def load(self, player_id, loader):
+        snapshot = self.get(player_id)
+        if snapshot is not None:
+            return snapshot
+
+        started = time.perf_counter()
+        snapshot = loader(player_id)
+        elapsed = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self.stats['loads'] += 1
+            self.stats['load_ms_total'] += elapsed
+            self.stats['load_ms_max'] = max(self.stats['load_ms_max'], elapsed)
+
+        if snapshot is not None:
+            self.put(player_id, snapshot)
+        return snapshot
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self.stats)
+            data['size'] = len(self._entries)
+        lookups = data['hits'] + data['misses']
+        data['hit_rate'] = round(data['hits'] / lookups, 4) if lookups else 0.0
+        data['load_ms_avg'] = round(data['load_ms_total'] / data['loads'], 3) if data['loads'] else 0.0
+        data['load_ms_total'] = round(data['load_ms_total'], 3)
+        data['load_ms_max'] = round(data['load_ms_max'], 3)
+        return data
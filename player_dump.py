@@ -0,0 +1,257 @@
+import argparse
+import gzip
+import json
+import sqlite3
+import sys
+import time
+
+import migrations
+
+
+# Выгрузка и загрузка данных игроков потоком NDJSON. Первая строка — заголовок
+# (формат, версия схемы, колонки таблиц), дальше записи одного из форматов:
+#   players  — строка на игрока: его строки из всех таблиц (для переноса игроков)
+#   columnar — пачка строк одной таблицы по колонкам (быстрее выгружается и грузится)
+# Выгрузка идет в одной читающей транзакции (согласованный снимок, в WAL писатели
+# не блокируются) генератором: память не зависит от размера базы.
+# Загрузка — INSERT OR REPLACE через executemany большими транзакциями; из CLI
+# вторичные индексы снимаются на время загрузки и строятся заново в конце.
+#
+#   python player_dump.py export coin_clicker.db players.ndjson.gz --format columnar
+#   python player_dump.py import players.ndjson.gz new.db
+FORMAT_NAME = 'coin-clicker-dump'
+FORMATS = ('players', 'columnar')
+
+# Таблицы с данными игроков; у всех первая колонка ключа — player_id
+TABLES = ('players', 'upgrades', 'autoclickers', 'buildings', 'achievements', 'active_boosts',
+          'daily_state', 'daily_totals', 'daily_log', 'leaderboard')
+
+# Строк в пачке формата columnar и в одной транзакции загрузки
+CHUNK_ROWS = 5000
+BATCH_ROWS = 100000
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def schema_version(conn):
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+# Генератор строк выгрузки. conn — отдельное соединение: на время выгрузки на нем
+# открыта читающая транзакция
+def export_lines(conn, fmt='players', chunk=CHUNK_ROWS):
+    if fmt not in FORMATS:
+        raise ValueError(f'Неизвестный формат: {fmt}')
+
+    conn.execute('BEGIN')
+    try:
+        columns = {table: table_columns(conn, table) for table in TABLES}
+        yield dumps({
+            'format': FORMAT_NAME,
+            'layout': fmt,
+            'schema_version': schema_version(conn),
+            'exported_at': int(time.time()),
+            'columns': columns
+        })
+        if fmt == 'players':
+            yield from _export_players(conn, columns)
+        else:
+            yield from _export_columnar(conn, chunk)
+    finally:
+        conn.execute('COMMIT')
+
+
+def _export_columnar(conn, chunk):
+    for table in TABLES:
+        cursor = conn.execute(f'SELECT * FROM {table}')
+        while True:
+            rows = cursor.fetchmany(chunk)
+            if not rows:
+                break
+            yield dumps({'table': table, 'data': [list(column) for column in zip(*rows)]})
+
+
+# Слияние по player_id: все таблицы читаются по первичному ключу в одном порядке,
+# курсоры продвигаются вместе — один проход без промежуточных структур
+def _export_players(conn, columns):
+    children = TABLES[1:]
+    cursors = {table: conn.execute(f'SELECT * FROM {table} ORDER BY player_id') for table in children}
+    positions = {table: columns[table].index('player_id') for table in children}
+    pending = {table: cursors[table].fetchone() for table in children}
+
+    for player in conn.execute('SELECT * FROM players ORDER BY player_id'):
+        player_id = player[columns['players'].index('player_id')]
+        record = {'player_id': player_id, 'players': [list(player)]}
+        for table in children:
+            position = positions[table]
+            rows = []
+            # Строки без игрока (остались от удаленных) пропускаем
+            while pending[table] is not None and pending[table][position] <= player_id:
+                if pending[table][position] == player_id:
+                    rows.append(list(pending[table]))
+                pending[table] = cursors[table].fetchone()
+            if rows:
+                record[table] = rows
+        yield dumps(record)
+
+
+# Загрузка строк выгрузки. write(fn) выполняет fn(conn) в одной транзакции
+# (app.run_write на работающем сервере или local_writer в CLI);
+# on_commit(player_ids) вызывается после каждой записанной пачки.
+def import_lines(lines, write, target_columns, batch=BATCH_ROWS, on_commit=None):
+    lines = iter(lines)
+    header = json.loads(next(lines))
+    if header.get('format') != FORMAT_NAME:
+        raise ValueError('Это не выгрузка игроков')
+
+    # Колонки выгрузки, которых нет в целевой схеме, отбрасываются; недостающие берут DEFAULT
+    statements = {}
+    for table, columns in header['columns'].items():
+        if table not in target_columns:
+            continue
+        keep = [index for index, column in enumerate(columns) if column in target_columns[table]]
+        names = ', '.join(columns[index] for index in keep)
+        placeholders = ', '.join('?' * len(keep))
+        statements[table] = (f'INSERT OR REPLACE INTO {table} ({names}) VALUES ({placeholders})', keep,
+                             len(keep) == len(columns), columns.index('player_id'))
+
+    stats = {'players': 0, 'rows': 0, 'batches': 0}
+    pending = {table: [] for table in statements}
+    player_ids = set()
+    size = 0
+
+    def flush():
+        def load(conn):
+            for table, rows in pending.items():
+                if rows:
+                    conn.executemany(statements[table][0], rows)
+        write(load)
+        stats['batches'] += 1
+        if on_commit:
+            on_commit(player_ids)
+        for rows in pending.values():
+            rows.clear()
+        player_ids.clear()
+
+    def add(table, rows):
+        nonlocal size
+        statement = statements.get(table)
+        if statement is None:
+            return
+        _, keep, whole, position = statement
+        for row in rows:
+            pending[table].append(row if whole else [row[index] for index in keep])
+            player_ids.add(row[position])
+        size += len(rows)
+        stats['rows'] += len(rows)
+        if table == 'players':
+            stats['players'] += len(rows)
+
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if 'table' in record:
+            add(record['table'], list(zip(*record['data'])))
+        else:
+            for table in TABLES:
+                if table in record:
+                    add(table, record[table])
+        if size >= batch:
+            flush()
+            size = 0
+
+    if size:
+        flush()
+    return stats
+
+
+def local_writer(conn):
+    def write(fn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            fn(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    return write
+
+
+# Вторичные индексы таблиц игроков: снимаются перед загрузкой, строятся после
+def drop_indexes(conn):
+    placeholders = ', '.join('?' * len(TABLES))
+    indexes = conn.execute(f'''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+    ''', TABLES).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX {name}')
+    return [sql for _, sql in indexes]
+
+
+def open_dump(path, mode):
+    if path == '-':
+        return sys.stdout if 'w' in mode else sys.stdin
+    if path.endswith('.gz'):
+        # Уровень 9 по умолчанию в несколько раз медленнее при почти том же размере
+        return gzip.open(path, mode + 't', compresslevel=5, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Выгрузка и загрузка данных игроков (NDJSON)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help='выгрузить базу в файл (.gz — со сжатием, - — stdout)')
+    export.add_argument('db')
+    export.add_argument('output')
+    export.add_argument('--format', choices=FORMATS, default='players')
+    export.add_argument('--chunk', type=int, default=CHUNK_ROWS)
+    load = sub.add_parser('import', help='загрузить выгрузку в базу (схема создается миграциями)')
+    load.add_argument('input')
+    load.add_argument('db')
+    load.add_argument('--batch', type=int, default=BATCH_ROWS)
+    load.add_argument('--keep-indexes', action='store_true', help='не снимать индексы на время загрузки')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == 'export':
+        conn = sqlite3.connect(args.db, isolation_level=None)
+        lines = 0
+        try:
+            with open_dump(args.output, 'w') as out:
+                for line in export_lines(conn, args.format, args.chunk):
+                    out.write(line)
+                    lines += 1
+        finally:
+            conn.close()
+        print(f'Выгружено строк: {lines} за {time.perf_counter() - started:.1f} с', file=sys.stderr)
+    else:
+        migrations.migrate(args.db)
+        conn = sqlite3.connect(args.db, isolation_level=None)
+        # Загрузку можно повторить целиком, поэтому на ее время fsync не нужен
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA cache_size = -262144')
+        try:
+            if schema_version(conn) != migrations.LATEST_VERSION:
+                raise SystemExit('Схема базы новее, чем знает этот код')
+            index_sql = [] if args.keep_indexes else drop_indexes(conn)
+            target = {table: set(table_columns(conn, table)) for table in TABLES}
+            try:
+                with open_dump(args.input, 'r') as source:
+                    stats = import_lines(source, local_writer(conn), target, args.batch)
+            finally:
+                # Индексы строятся заново и после прерванной загрузки
+                for sql in index_sql:
+                    conn.execute(sql)
+            conn.execute('ANALYZE')
+        finally:
+            conn.close()
+        print(f"Загружено игроков: {stats['players']}, строк: {stats['rows']}, "
+              f"транзакций: {stats['batches']} за {time.perf_counter() - started:.1f} с", file=sys.stderr)
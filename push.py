@@ -0,0 +1,226 @@
+import heapq
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+
+# Канал push-событий (Server-Sent Events): одно долгое соединение на вкладку.
+# Событие игрока кодируется один раз и кладется в очереди его подписчиков,
+# лидерборд и счетчик онлайна раз в интервал рассылаются всем диффами.
+KEEPALIVE_SECONDS = 15
+# Переподключение EventSource после обрыва, мс
+RETRY_MS = 3000
+# Очередь медленного клиента: при переполнении поток закрывается,
+# клиент переподключается и получает состояние заново
+MAX_PENDING = 256
+
+KEEPALIVE = b': keepalive\n\n'
+
+# Поля записи лидерборда в диффах: last_update меняется при каждом сохранении
+# и клиенту не нужен
+BOARD_FIELDS = ('player_id', 'username', 'total_score', 'coins_score', 'grade_score',
+                'achievements_score', 'total_clicks')
+
+
+def encode(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode('utf-8')
+
+
+# Дифф топа: order — для каждой позиции индекс в прошлом списке (>= 0)
+# либо -1 - i для новой/изменившейся записи entries[i]
+def board_diff(old, new):
+    index = {entry['player_id']: i for i, entry in enumerate(old)}
+    order = []
+    entries = []
+    for entry in new:
+        i = index.get(entry['player_id'])
+        if i is None or old[i] != entry:
+            entries.append(entry)
+            order.append(-len(entries))
+        else:
+            order.append(i)
+    if not entries and order == list(range(len(old))):
+        return None
+    return {'order': order, 'entries': entries}
+
+
+class Subscriber:
+    def __init__(self, player_id, client_id, notify):
+        self.player_id = player_id
+        self.client_id = client_id
+        self.closed = False
+        self._notify = notify
+        self._pending = deque([f'retry: {RETRY_MS}\n\n'.encode('ascii')])
+
+    # Вызывается из любых потоков; notify будит поток или event loop соединения
+    def send(self, chunk):
+        if self.closed:
+            return False
+        if len(self._pending) >= MAX_PENDING:
+            self.closed = True
+        else:
+            self._pending.append(chunk)
+        self._notify()
+        return not self.closed
+
+    def close(self):
+        self.closed = True
+        self._notify()
+
+    def drain(self):
+        chunks = []
+        while self._pending:
+            chunks.append(self._pending.popleft())
+        return b''.join(chunks)
+
+
+class PushHub:
+    def __init__(self, top=None, categories=(), tick_seconds=1.0, leaderboard_interval=2.0):
+        # top(category) -> список записей; None — диффы лидерборда выключены
+        self.top = top
+        self.categories = tuple(categories)
+        self.tick_seconds = tick_seconds
+        self.leaderboard_interval = leaderboard_interval
+
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._schedule = []
+        self._scheduled = set()
+        self._sequence = itertools.count()
+        self._boards = {}
+        self._boards_at = 0.0
+        self._online_sent = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self.stats = {
+            'connections': 0,
+            'events': 0,
+            'broadcasts': 0,
+            'overflows': 0
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='push-hub', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            subscribers = [s for group in self._subscribers.values() for s in group]
+        for subscriber in subscribers:
+            subscriber.close()
+
+    def subscribe(self, player_id, client_id, notify):
+        subscriber = Subscriber(player_id, client_id, notify)
+        with self._lock:
+            self._subscribers.setdefault(player_id, set()).add(subscriber)
+            self.stats['connections'] += 1
+        self.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.closed = True
+        with self._lock:
+            group = self._subscribers.get(subscriber.player_id)
+            if group is not None:
+                group.discard(subscriber)
+                if not group:
+                    del self._subscribers[subscriber.player_id]
+
+    def online(self):
+        return len(self._subscribers)
+
+    # Событие игроку во все его вкладки; exclude — вкладка, которая сама
+    # выполнила действие и уже знает результат из ответа
+    def publish(self, player_id, event, data, exclude=None):
+        with self._lock:
+            group = self._subscribers.get(player_id)
+            targets = [s for s in group if exclude is None or s.client_id != exclude] if group else ()
+        if targets:
+            self._deliver(targets, encode(event, data))
+
+    def broadcast(self, event, data):
+        with self._lock:
+            targets = [s for group in self._subscribers.values() for s in group]
+        if targets:
+            self._deliver(targets, encode(event, data), broadcast=True)
+
+    def _deliver(self, targets, chunk, broadcast=False):
+        overflows = sum(1 for subscriber in targets if not subscriber.send(chunk))
+        with self._lock:
+            self.stats['events'] += len(targets)
+            self.stats['overflows'] += overflows
+            self.stats['broadcasts'] += broadcast
+
+    # Отложенное событие (например, доступная награда): публикуется в момент at,
+    # если игрок к тому времени подключен
+    def schedule(self, at, player_id, event, data):
+        key = (player_id, event, json.dumps(data, sort_keys=True))
+        with self._lock:
+            if key in self._scheduled:
+                return
+            self._scheduled.add(key)
+            heapq.heappush(self._schedule, (at, next(self._sequence), key, data))
+
+    # Опубликованный топ категории и его версия — для GET лидерборда,
+    # пока диффы рассылаются (иначе None)
+    def board(self, category):
+        if self.top is None or time.monotonic() - self._boards_at > 2 * self.leaderboard_interval:
+            return None
+        return self._boards.get(category)
+
+    def _run(self):
+        while not self._stopped.wait(self.tick_seconds):
+            try:
+                self._tick()
+            except Exception as e:
+                print(f"Ошибка рассылки push-событий: {e}")
+
+    def _tick(self):
+        now = time.time()
+        due = []
+        with self._lock:
+            while self._schedule and self._schedule[0][0] <= now:
+                _, _, key, data = heapq.heappop(self._schedule)
+                self._scheduled.discard(key)
+                due.append((key[0], key[1], data))
+        for player_id, event, data in due:
+            self.publish(player_id, event, data)
+
+        if not self._subscribers:
+            return
+
+        online = self.online()
+        if online != self._online_sent:
+            self._online_sent = online
+            self.broadcast('online', {'players': online})
+
+        if self.top is not None and time.monotonic() - self._boards_at >= self.leaderboard_interval:
+            self._publish_boards()
+
+    def _publish_boards(self):
+        for category in self.categories:
+            entries = [{field: entry.get(field) for field in BOARD_FIELDS} for entry in self.top(category)]
+            version, old = self._boards.get(category, (0, None))
+            if old is None:
+                self._boards[category] = (1, entries)
+                continue
+            diff = board_diff(old, entries)
+            if diff is not None:
+                self._boards[category] = (version + 1, entries)
+                self.broadcast('leaderboard', {'category': category, 'base': version, 'version': version + 1, **diff})
+        self._boards_at = time.monotonic()
+
+    def metrics(self):
+        with self._lock:
+            subscribers = sum(len(group) for group in self._subscribers.values())
+            scheduled = len(self._schedule)
+        return {
+            **self.stats,
+            'subscribers': subscribers,
+            'players_online': self.online(),
+            'scheduled': scheduled
+        }
@@ -0,0 +1,127 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import jsonify
+
+
+# Допуск запросов: корзины токенов по (группа маршрутов, игрок) и общий лимит
+# одновременных запросов к базе. Корзины — кортежи (токены, время пополнения)
+# в LRU на max_keys ключей: память ограничена, вытесняются давно не приходившие
+# клиенты, чьи корзины к этому времени и так снова полные.
+
+# Лимиты групп по умолчанию: (токенов в секунду, емкость корзины). Клиент
+# сохраняется раз в 30 с и после покупок, клики отправляет раз в 2 с,
+# покупки копит по 300 мс; session — старт игры (повторный init() клиента)
+LIMITS = {
+    'session': (0.2, 5),
+    'save': (2, 20),
+    'clicks': (1, 10),
+    'purchase': (5, 20),
+    'leaderboard': (2, 20)
+}
+MAX_KEYS = 100000
+
+
+# "save=2:20,clicks=1:10" -> {'save': (2.0, 20.0), ...} поверх limits
+def parse_limits(spec, limits=LIMITS):
+    result = dict(limits)
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        group, _, value = item.partition('=')
+        rate, _, burst = value.partition(':')
+        if group not in result:
+            raise ValueError(f'Неизвестная группа лимитов: {group}')
+        result[group] = (float(rate), float(burst or rate))
+    return result
+
+
+def rejection(retry_after, status=429, error='Слишком много запросов'):
+    response = jsonify({'success': False, 'error': error, 'retry_after': round(retry_after, 3)})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+class TokenBuckets:
+    def __init__(self, limits=LIMITS, max_keys=MAX_KEYS):
+        self.limits = limits
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'allowed': 0,
+            'rejected': 0,
+            'evictions': 0
+        }
+        self.rejected = {group: 0 for group in limits}
+
+    # Берет токен: 0 — запрос допущен, иначе через сколько секунд появится токен
+    def take(self, group, key, now=None):
+        rate, burst = self.limits[group]
+        now = time.monotonic() if now is None else now
+        bucket_key = (group, key)
+        with self._lock:
+            bucket = self._buckets.get(bucket_key)
+            if bucket is None:
+                tokens = burst
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                self._buckets.move_to_end(bucket_key)
+
+            if tokens >= 1:
+                self._buckets[bucket_key] = (tokens - 1, now)
+                self.stats['allowed'] += 1
+                retry_after = 0
+            else:
+                self._buckets[bucket_key] = (tokens, now)
+                self.stats['rejected'] += 1
+                self.rejected[group] += 1
+                retry_after = (1 - tokens) / rate
+
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.stats['evictions'] += 1
+        return retry_after
+
+    def metrics(self):
+        with self._lock:
+            data = dict(self.stats)
+            data.update((f'rejected_{group}', count) for group, count in self.rejected.items())
+            data['keys'] = len(self._buckets)
+        return data
+
+
+# Лимит одновременных запросов без очереди: сверх limit запрос сразу
+# отклоняется — очередь к единственному писателю SQLite только растянула бы
+# задержки всем, включая тех, кто укладывается в свои лимиты
+class ConcurrencyLimit:
+    def __init__(self, limit):
+        self.limit = limit
+        self._active = 0
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'admitted': 0,
+            'shed': 0,
+            'max_active': 0
+        }
+
+    def acquire(self):
+        with self._lock:
+            if self._active >= self.limit:
+                self.stats['shed'] += 1
+                return False
+            self._active += 1
+            self.stats['admitted'] += 1
+            self.stats['max_active'] = max(self.stats['max_active'], self._active)
+            return True
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+
+    def metrics(self):
+        with self._lock:
+            return {**self.stats, 'active': self._active, 'limit': self.limit}
@@ -0,0 +1,70 @@
+import json
+
+import assets
+
+
+# Реестр определений игры: game_config.json и таблицы, посчитанные один раз
+# при старте. Клиент получает определения через /api/config — версия равна
+# хешу содержимого, адрес /api/config?v=<версия> кэшируется навсегда, а сама
+# версия приходит в странице. Цены покупок сервер берет только отсюда.
+#
+# Уровни, для которых цена хранится в таблице; дальше — формула
+TABLE_LEVELS = 1000
+
+
+class Registry:
+    def __init__(self, config):
+        self.config = config
+
+        # (вид, id) -> (базовая цена, рост, [цена при 0..TABLE_LEVELS-1 купленных])
+        self.costs = {}
+        for upgrade in config['upgrades']:
+            self._add_costs('upgrade', upgrade['id'], upgrade['base_cost'], upgrade['cost_growth'])
+        for clicker in config['autoclickers']:
+            self._add_costs('autoclicker', clicker['id'], clicker['base_cost'], config['autoclicker_cost_growth'])
+        for building in config['buildings']:
+            self._add_costs('building', building['id'], building['base_cost'], config['building_cost_growth'])
+
+        # Доход одной штуки первого уровня
+        self.cps = {('autoclicker', c['id']): c['base_cps'] for c in config['autoclickers']}
+        self.cps.update({('building', b['id']): b['base_cps'] for b in config['buildings']})
+
+        self.boosts = {boost['id']: boost for boost in config['boosts']}
+        self.achievements = {achievement['id']: achievement for achievement in config['achievements']}
+
+        body = json.dumps(config, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        self.asset = assets.Asset('config.json', body, 'application/json')
+        self.version = self.asset.digest
+
+    def _add_costs(self, kind, item_id, base_cost, growth):
+        table = [base_cost * growth ** level for level in range(TABLE_LEVELS)]
+        self.costs[(kind, item_id)] = (base_cost, growth, table)
+
+    # Цена quantity штук подряд при уже купленных owned; None — такого предмета нет.
+    # Первая штука — из таблицы, остальные — сумма геометрической прогрессии
+    def purchase_cost(self, kind, item_id, owned, quantity=1):
+        entry = self.costs.get((kind, item_id))
+        if entry is None:
+            return None
+        base_cost, growth, table = entry
+        first = table[owned] if owned < TABLE_LEVELS else base_cost * growth ** owned
+        if quantity == 1:
+            return first
+        return first * (growth ** quantity - 1) / (growth - 1)
+
+    def producer_cps(self, kind, item_id, quantity=1, level=1):
+        return self.cps.get((kind, item_id), 0) * quantity * level
+
+    def respond(self, requested_version=None):
+        # Адрес с текущей версией не меняется; без версии или со старой — с проверкой по ETag
+        immutable = requested_version == self.version
+        return assets.respond(self.asset, assets.IMMUTABLE_CACHE if immutable else assets.REVALIDATE_CACHE)
+
+    def metrics(self):
+        return {
+            'version': self.version,
+            'items': len(self.costs),
+            'bytes': len(self.asset.bodies['identity']),
+            'gzip_bytes': len(self.asset.bodies.get('gzip', self.asset.bodies['identity']))
+        }
+
@@ -0,0 +1,120 @@
+import atexit
+import threading
+import time
+
+
+def replace_save(old, new):
+    return new
+
+
+# Буфер отложенной записи (write-behind) для /api/save.
+# Для каждого игрока хранится одна запись (последнее сохранение побеждает,
+# либо изменения сливаются через merge_fn), а все «грязные» игроки
+# сбрасываются в SQLite одной транзакцией по таймеру или по порогу.
+class SaveBuffer:
+    def __init__(self, flush_fn, interval=1.0, max_dirty=500, merge_fn=replace_save):
+        self.flush_fn = flush_fn
+        self.merge_fn = merge_fn
+        self.interval = interval
+        self.max_dirty = max_dirty
+
+        self._pending = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self.stats = {
+            'saves': 0,
+            'coalesced': 0,
+            'flushes': 0,
+            'rows_flushed': 0,
+            'errors': 0,
+            'last_flush_ms': 0.0
+        }
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='save-buffer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def put(self, player_id, data):
+        with self._lock:
+            if player_id in self._pending:
+                self.stats['coalesced'] += 1
+                data = self.merge_fn(self._pending[player_id], data)
+            self._pending[player_id] = data
+            self.stats['saves'] += 1
+            dirty = len(self._pending)
+
+        if dirty >= self.max_dirty:
+            self._wakeup.set()
+
+    def get(self, player_id):
+        # Несброшенное сохранение (в очереди или в процессе записи)
+        with self._lock:
+            pending = self._pending.get(player_id)
+            inflight = self._inflight.get(player_id)
+            if pending is not None and inflight is not None:
+                return self.merge_fn(inflight, pending)
+            return pending if pending is not None else inflight
+
+    def dirty_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, player_id=None):
+        with self._flush_lock:
+            with self._lock:
+                if player_id is None:
+                    batch, self._pending = self._pending, {}
+                elif player_id in self._pending:
+                    batch = {player_id: self._pending.pop(player_id)}
+                else:
+                    batch = {}
+                self._inflight = batch
+
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                self.flush_fn(batch)
+            except Exception:
+                # Возвращаем пачку в очередь, поверх нее — более новые сохранения
+                with self._lock:
+                    for pid, data in batch.items():
+                        if pid in self._pending:
+                            data = self.merge_fn(data, self._pending[pid])
+                        self._pending[pid] = data
+                    self.stats['errors'] += 1
+                raise
+            finally:
+                with self._lock:
+                    self._inflight = {}
+
+            with self._lock:
+                self.stats['flushes'] += 1
+                self.stats['rows_flushed'] += len(batch)
+                self.stats['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            return len(batch)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Ошибка сброса буфера сохранений: {e}")
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
@@ -0,0 +1,88 @@
+import argparse
+import os
+import re
+import sqlite3
+import zlib
+
+
+# Шардирование игроков по player_id между N файлами SQLite.
+# Каждый шард целиком владеет строками своих игроков во всех таблицах,
+# поэтому процессы-воркеры не делят ни базу, ни кэши, ни блокировки.
+SHARD_COUNT = int(os.environ.get('DB_SHARDS', 1))
+SHARD_INDEX = int(os.environ.get('DB_SHARD', 0))
+
+
+def shard_for(player_id, count=SHARD_COUNT):
+    # crc32 стабилен между процессами и запусками, в отличие от hash()
+    if count <= 1:
+        return 0
+    return zlib.crc32(str(player_id).encode('utf-8')) % count
+
+
+def shard_path(db_file, index=SHARD_INDEX, count=SHARD_COUNT):
+    if count <= 1:
+        return db_file
+    # Число шардов входит в имя: после смены N старые файлы не подхватятся молча
+    root, ext = os.path.splitext(db_file)
+    return f'{root}.shard{index}of{count}{ext}'
+
+
+def owns(player_id):
+    return shard_for(player_id) == SHARD_INDEX
+
+
+# Разбивает существующую базу на count шардов (исходный файл не меняется)
+def split_database(source, count):
+    src = sqlite3.connect(source)
+    src.create_function('shard_for', 1, lambda player_id: shard_for(player_id, count), deterministic=True)
+
+    schema = src.execute('''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'
+        ORDER BY type = 'index'
+    ''').fetchall()
+    tables = [name for kind, name, _ in schema if kind == 'table']
+    # Производные таблицы (например, leaderboard_top) пересобираются воркерами,
+    # служебные без player_id (schema_version) копируются в каждый шард целиком
+    sharded = [
+        table for table in tables
+        if any(column[1] == 'player_id' for column in src.execute(f'PRAGMA table_info({table})'))
+        and table != 'leaderboard_top'
+    ]
+    shared = [table for table in tables if table not in sharded and table != 'leaderboard_top']
+
+    counts = {}
+    for index in range(count):
+        path = shard_path(source, index, count)
+        if os.path.exists(path):
+            raise FileExistsError(f'Шард уже существует: {path}')
+
+        src.execute('ATTACH DATABASE ? AS shard', (path,))
+        try:
+            for kind, name, sql in schema:
+                # CREATE TABLE "players" (...) -> CREATE TABLE shard."players" (...)
+                src.execute(re.sub(
+                    rf'^(CREATE\s+(?:UNIQUE\s+)?(?:TABLE|INDEX)\s+(?:IF\s+NOT\s+EXISTS\s+)?)("?{re.escape(name)}"?)',
+                    r'\1shard.\2', sql, count=1, flags=re.IGNORECASE
+                ))
+            for table in sharded:
+                src.execute(f'INSERT INTO shard.{table} SELECT * FROM main.{table} WHERE shard_for(player_id) = ?', (index,))
+            for table in shared:
+                src.execute(f'INSERT INTO shard.{table} SELECT * FROM main.{table}')
+            src.commit()
+            counts[path] = src.execute('SELECT COUNT(*) FROM shard.players').fetchone()[0]
+        finally:
+            src.execute('DETACH DATABASE shard')
+
+    src.close()
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Разбиение базы игроков на шарды')
+    parser.add_argument('source', help='исходный файл базы (например, coin_clicker.db)')
+    parser.add_argument('--shards', type=int, required=True)
+    args = parser.parse_args()
+
+    for path, players in split_database(args.source, args.shards).items():
+        print(f'{path}: {players} игроков')
@@ -0,0 +1,360 @@
+import argparse
+import json
+import math
+import time
+
+import economy
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Симулятор экономики для балансировки и оценки нагрузки. Определения —
+# из того же game_config.json, что у сервера и клиента. Состояние всей
+# популяции — массивы NumPy (строка на игрока), шаг симуляции обрабатывает
+# всех игроков сразу, без цикла по игрокам.
+#
+#   python simulate.py --players 100000 --days 14            — отчет в консоль
+#   python simulate.py --players 100000 --json report.json   — полный отчет в файл
+#
+# Модель игрока: сессии (марковская цепь онлайн/офлайн с суточным ритмом),
+# доля времени сессии с кликами и темп кликов, жадные покупки с лучшей
+# отдачей на монету, ежедневная награда при входе, бусты за самоцветы.
+# Частота запросов — по таймерам game.js.
+DAY = 24 * 3600
+# game.js: saveGame() каждые 30 с, /api/clicks через 2 с после первого клика
+SAVE_INTERVAL = 30
+CLICK_FLUSH_INTERVAL = 2
+# Покупок за шаг на игрока (очередь /api/buy_batch уходит одним запросом)
+PURCHASE_ROUNDS = 5
+# Суточный ритм: доля от средней активности в пике и в провале
+DIURNAL_AMPLITUDE = 0.6
+PEAK_HOUR = 20
+PERCENTILES = (10, 50, 90)
+# Длина таблиц цен и множителей по уровням; дальше цена — бесконечность
+MAX_LEVEL = 4096
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError('Для симуляции нужен NumPy: pip install numpy')
+
+
+# Массивы определений: производители (автокликеры, затем здания) и улучшения
+class Tables:
+    def __init__(self, config):
+        producers = config['autoclickers'] + config['buildings']
+        self.producer_ids = [p['id'] for p in producers]
+        self.base_cps = np.array([p['base_cps'] for p in producers], dtype=np.float64)
+        self.base_cost = np.array([p['base_cost'] for p in producers], dtype=np.float64)
+        cost_growth = np.array(
+            [config['autoclicker_cost_growth']] * len(config['autoclickers'])
+            + [config['building_cost_growth']] * len(config['buildings'])
+        )
+        # Степени по уровням считаются один раз; в шаге — выборка по индексу вместо **
+        level = np.arange(MAX_LEVEL)
+        with np.errstate(over='ignore'):
+            self.producer_cost = self.base_cost[:, None] * cost_growth[:, None] ** level
+
+        self.upgrade_ids = [u['id'] for u in config['upgrades']]
+        self.upgrade_index = {upgrade_id: i for i, upgrade_id in enumerate(self.upgrade_ids)}
+        click = config['click']
+        with np.errstate(over='ignore'):
+            self.upgrade_cost = np.array([
+                u['base_cost'] * u['cost_growth'] ** level for u in config['upgrades']
+            ])
+            self.click_power = click['power_growth'] ** level
+            self.income_multiplier = click['multiplier_upgrade_bonus'] ** level
+
+        self.grade_bonus = np.array([g['bonus'] for g in config['grades']])
+        self.max_grade = len(config['grades']) - 1
+        progress = config['grade_progress']
+        self.progress_per_coin = 100 / (progress['growth'] ** np.arange(len(config['grades'])) * progress['base_coins'])
+        reward = config['grade_reward']
+        self.grade_coins = reward['base_coins'] * reward['coins_growth'] ** np.arange(len(config['grades']), dtype=np.float64)
+        self.grade_gems = reward['gems_per_grade'] * np.arange(len(config['grades']))
+
+        self.click = config['click']
+        daily = config['daily']
+        self.daily_cooldown = daily['cooldown']
+        self.daily_window = daily['streak_window']
+        self.daily_bonus = daily['streak_bonus']
+        self.daily_coins = np.array([r['coins'] for r in daily['rewards']], dtype=np.float64)
+        self.daily_gems = np.array([r.get('gems', 0) for r in daily['rewards']])
+        self.daily_tokens = np.array([r.get('tokens', 0) for r in daily['rewards']])
+
+        # Бусты от дорогого к дешевому: игрок берет лучший доступный
+        boosts = sorted(config['boosts'], key=lambda b: b['gems'], reverse=True)
+        self.boosts = [(b['gems'], b['multiplier'], b['duration']) for b in boosts]
+
+
+# Поведение игроков: случайные параметры на игрока
+def behaviour(rng, players, join_days):
+    return {
+        'join_at': rng.uniform(0, join_days * DAY, players) if join_days > 0 else np.zeros(players),
+        # Время жизни игрока в днях (отток)
+        'lifetime': rng.exponential(30, players) * DAY,
+        'sessions_per_day': rng.lognormal(math.log(3), 0.6, players),
+        'session_seconds': rng.lognormal(math.log(600), 0.7, players),
+        'click_share': rng.beta(2, 3, players),
+        'click_rate': np.clip(rng.normal(4, 1.5, players), 0.5, 12),
+        'boost_propensity': rng.beta(1, 4, players)
+    }
+
+
+def percentiles(values):
+    if len(values) == 0:
+        return {f'p{p}': None for p in PERCENTILES}
+    return {f'p{p}': float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def simulate(players=100000, days=14, step=300, seed=0, join_days=0, config=None):
+    require_numpy()
+    t0 = time.perf_counter()
+    tables = Tables(config or economy.CONFIG)
+    click = tables.click
+    rng = np.random.default_rng(seed)
+    who = behaviour(rng, players, join_days)
+    leave_at = who['join_at'] + who['lifetime']
+
+    coins = np.zeros(players)
+    gems = np.zeros(players)
+    tokens = np.zeros(players)
+    earned = np.zeros(players)
+    grade = np.zeros(players, dtype=np.int64)
+    progress = np.zeros(players)
+    owned = np.zeros((players, len(tables.base_cps)), dtype=np.int64)
+    levels = np.zeros((players, len(tables.upgrade_ids)), dtype=np.int64)
+    # Доход производителей без множителей; меняется только при покупках
+    base_rate = np.zeros(players)
+    online = np.zeros(players, dtype=bool)
+    boost_until = np.zeros(players)
+    boost_multiplier = np.ones(players)
+    daily_at = np.full(players, -np.inf)
+    daily_day = np.zeros(players, dtype=np.int64)
+    daily_streak = np.zeros(players, dtype=np.int64)
+    grade_at = np.full((players, tables.max_grade + 1), np.nan)
+    grade_at[:, 0] = 0
+
+    up_click = tables.upgrade_index['click_power']
+    up_multiplier = tables.upgrade_index['multiplier']
+    up_crit_chance = tables.upgrade_index['crit_chance']
+    up_crit_power = tables.upgrade_index['crit_power']
+    producer_index = np.arange(len(tables.base_cps))
+    upgrade_index = np.arange(len(tables.upgrade_ids))
+
+    steps = int(days * DAY / step)
+    series = {key: np.zeros(steps) for key in (
+        'online', 'sessions', 'saves', 'clicks', 'click_requests', 'purchases', 'buy_requests',
+        'daily_claims', 'boosts'
+    )}
+    by_day = []
+    totals = {'minted': 0.0, 'spent': 0.0}
+
+    for i in range(steps):
+        t = i * step
+        alive = (who['join_at'] <= t) & (t < leave_at)
+
+        # Сессии: вход с учетом суточного ритма, выход по средней длине сессии
+        hour = (t % DAY) / 3600
+        diurnal = 1 + DIURNAL_AMPLITUDE * math.cos(2 * math.pi * (hour - PEAK_HOUR) / 24)
+        start = who['sessions_per_day'] * step / DAY * diurnal
+        end = np.minimum(step / who['session_seconds'], 1)
+        draw = rng.random(players)
+        started = alive & ~online & (draw < start)
+        online = alive & ((online & (draw >= end)) | started)
+
+        # Доход за шаг: пассивный идет и офлайн (сервер досчитывает при входе), клики — только в сессии
+        boost = np.where(boost_until > t, boost_multiplier, 1.0)
+        multiplier = tables.grade_bonus[grade] * tables.income_multiplier[levels[:, up_multiplier]] * boost
+        cps = base_rate * multiplier
+        crit_chance = np.minimum(
+            click['base_crit_chance'] + levels[:, up_crit_chance] * click['crit_chance_per_level'], click['max_crit_chance']
+        )
+        crit_multiplier = click['base_crit_multiplier'] + levels[:, up_crit_power] * click['crit_multiplier_per_level']
+        click_value = tables.click_power[levels[:, up_click]] * multiplier * (1 + crit_chance * (crit_multiplier - 1))
+        clicks_per_second = np.where(online, who['click_share'] * who['click_rate'], 0)
+        gain = np.where(alive, cps * step, 0) + clicks_per_second * step * click_value
+        coins += gain
+        earned += gain
+        totals['minted'] += gain.sum()
+
+        # Грейд: не больше одного повышения за начисление, как economy.add_earnings
+        progress += gain * tables.progress_per_coin[grade]
+        up = (progress >= 100) & (grade < tables.max_grade)
+        if up.any():
+            grade[up] += 1
+            progress[up] = 0
+            coins[up] += tables.grade_coins[grade[up]]
+            gems[up] += tables.grade_gems[grade[up]]
+            totals['minted'] += tables.grade_coins[grade[up]].sum()
+            rows = np.flatnonzero(up)
+            grade_at[rows, grade[rows]] = t + step - who['join_at'][rows]
+
+        # Ежедневная награда при входе, серия — если прошло меньше двух суток
+        claim = online & (t - daily_at >= tables.daily_cooldown)
+        if claim.any():
+            keep = claim & (t - daily_at < tables.daily_window)
+            daily_streak[claim] = np.where(keep[claim], daily_streak[claim] + 1, 1)
+            daily_day[claim] = daily_day[claim] % len(tables.daily_coins) + 1
+            bonus = np.where(daily_streak[claim] > 1, 1 + daily_streak[claim] * tables.daily_bonus, 1)
+            reward = np.floor(tables.daily_coins[daily_day[claim] - 1] * bonus)
+            coins[claim] += reward
+            gems[claim] += np.floor(tables.daily_gems[daily_day[claim] - 1] * bonus)
+            tokens[claim] += tables.daily_tokens[daily_day[claim] - 1]
+            daily_at[claim] = t
+            totals['minted'] += reward.sum()
+
+        # Буст за самоцветы, если сейчас не действует
+        wants = online & (boost_until <= t) & (rng.random(players) < who['boost_propensity'] * step / 3600)
+        bought_boost = np.zeros(players, dtype=bool)
+        for cost, boost_mult, duration in tables.boosts:
+            pick = wants & ~bought_boost & (gems >= cost)
+            gems[pick] -= cost
+            boost_until[pick] = t + duration
+            boost_multiplier[pick] = boost_mult
+            bought_boost |= pick
+
+        # Покупки в сессии: копим на вариант с лучшей отдачей (прирост дохода в секунду на монету)
+        rows = np.flatnonzero(online)
+        purchases = np.zeros(players)
+        for _ in range(PURCHASE_ROUNDS):
+            if len(rows) == 0:
+                break
+            n = levels[rows]
+            mult = multiplier[rows]
+            click_income = clicks_per_second[rows] * click_value[rows]
+            producer_cost = tables.producer_cost[producer_index, np.minimum(owned[rows], MAX_LEVEL - 1)]
+            producer_gain = tables.base_cps * mult[:, None]
+            upgrade_cost = tables.upgrade_cost[upgrade_index, np.minimum(n, MAX_LEVEL - 1)]
+            upgrade_gain = np.zeros_like(upgrade_cost)
+            upgrade_gain[:, up_click] = click_income * (click['power_growth'] - 1)
+            upgrade_gain[:, up_multiplier] = (cps[rows] + click_income) * (click['multiplier_upgrade_bonus'] - 1)
+            chance = crit_chance[rows]
+            per_crit = (crit_multiplier[rows] - 1) / (1 + chance * (crit_multiplier[rows] - 1))
+            upgrade_gain[:, up_crit_chance] = np.where(
+                chance < click['max_crit_chance'], click_income * click['crit_chance_per_level'] * per_crit, 0
+            )
+            upgrade_gain[:, up_crit_power] = click_income * chance * click['crit_multiplier_per_level'] / (
+                1 + chance * (crit_multiplier[rows] - 1)
+            )
+
+            cost = np.hstack([producer_cost, upgrade_cost])
+            value = np.hstack([producer_gain, upgrade_gain]) / cost
+            choice = value.argmax(axis=1)
+            price = cost[np.arange(len(rows)), choice]
+            buy = coins[rows] >= price
+            if not buy.any():
+                break
+            rows, choice, price = rows[buy], choice[buy], price[buy]
+            coins[rows] -= price
+            totals['spent'] += price.sum()
+            purchases[rows] += 1
+            producer = choice < len(tables.base_cps)
+            owned[rows[producer], choice[producer]] += 1
+            levels[rows[~producer], choice[~producer] - len(tables.base_cps)] += 1
+            base_rate[rows[producer]] += tables.base_cps[choice[producer]]
+            # Множители и доход кликов на следующем круге — по началу шага, этого достаточно
+            cps[rows[producer]] += tables.base_cps[choice[producer]] * multiplier[rows[producer]]
+
+        series['online'][i] = online.sum()
+        series['sessions'][i] = started.sum()
+        series['saves'][i] = online.sum() * step / SAVE_INTERVAL
+        series['clicks'][i] = clicks_per_second.sum() * step
+        series['click_requests'][i] = (who['click_share'][online] * step / CLICK_FLUSH_INTERVAL).sum()
+        series['purchases'][i] = purchases.sum()
+        series['buy_requests'][i] = (purchases > 0).sum()
+        series['daily_claims'][i] = claim.sum()
+        series['boosts'][i] = bought_boost.sum()
+
+        if (i + 1) * step % DAY == 0 or i == steps - 1:
+            active = alive
+            by_day.append({
+                'day': (i + 1) * step / DAY,
+                'players': int(active.sum()),
+                'coins_supply': float(coins[active].sum()),
+                'coins_median': float(np.median(coins[active])) if active.any() else 0.0,
+                'earned_median': float(np.median(earned[active])) if active.any() else 0.0,
+                'gems_supply': float(gems[active].sum()),
+                'tokens_supply': float(tokens[active].sum()),
+                'minted': totals['minted'],
+                'spent': totals['spent'],
+                'grade_counts': np.bincount(grade[active], minlength=tables.max_grade + 1).tolist()
+            })
+
+    # Рост за день: суммарный запас смещают редкие игроки с огромными множителями,
+    # рост медианы показывает типичного игрока
+    for prev, day in zip([None] + by_day[:-1], by_day):
+        for key, growth in (('coins_supply', 'supply_growth'), ('coins_median', 'median_growth')):
+            day[growth] = day[key] / prev[key] - 1 if prev and prev[key] > 0 else None
+
+    grades = []
+    for g in range(1, tables.max_grade + 1):
+        reached = grade_at[:, g]
+        reached = reached[~np.isnan(reached)] / 3600
+        grades.append({
+            'grade': g,
+            'reached': len(reached) / players,
+            'hours': percentiles(reached)
+        })
+
+    requests = {}
+    for key in ('sessions', 'saves', 'click_requests', 'buy_requests', 'daily_claims', 'boosts'):
+        rate = series[key] / step
+        requests[key] = {'mean_rps': float(rate.mean()), 'peak_rps': float(rate.max())}
+    requests['clicks'] = {'mean_per_second': float(series['clicks'].mean() / step), 'peak_per_second': float(series['clicks'].max() / step)}
+    requests['online'] = {'mean': float(series['online'].mean()), 'peak': float(series['online'].max())}
+
+    return {
+        'players': players,
+        'days': days,
+        'step': step,
+        'seed': seed,
+        'elapsed_seconds': time.perf_counter() - t0,
+        'time_to_grade': grades,
+        'economy': by_day,
+        'requests': requests
+    }
+
+
+def print_report(report):
+    print(f"{report['players']} игроков, {report['days']} дней, шаг {report['step']} с "
+          f"(расчет {report['elapsed_seconds']:.1f} с)")
+
+    print('\nВремя до грейда, часы от входа в игру:')
+    for g in report['time_to_grade']:
+        hours = ' '.join(
+            f"{name}={value:8.1f}" if value is not None else f'{name}=       -'
+            for name, value in g['hours'].items()
+        )
+        print(f"  {g['grade']}: достигли {100 * g['reached']:5.1f}%  {hours}")
+
+    print('\nЭкономика по дням:')
+    for day in report['economy']:
+        growth = f"{100 * day['median_growth']:7.1f}%" if day['median_growth'] is not None else '       -'
+        print(f"  день {day['day']:5.1f}: игроков {day['players']:7}, медиана монет {day['coins_median']:.3e} "
+              f"(+{growth}), всего {day['coins_supply']:.3e}, самоцветов {day['gems_supply']:.0f}")
+
+    print('\nЗапросы:')
+    for key, value in report['requests'].items():
+        print(f'  {key}: ' + ', '.join(f'{name}={number:.2f}' for name, number in value.items()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Симуляция экономики на синтетической популяции игроков')
+    parser.add_argument('--players', type=int, default=100000)
+    parser.add_argument('--days', type=float, default=14)
+    parser.add_argument('--step', type=int, default=300, help='шаг симуляции, секунды игрового времени')
+    parser.add_argument('--join-days', type=float, default=0, help='игроки приходят равномерно за N дней (0 — все сразу)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--config', default=economy.CONFIG_FILE)
+    parser.add_argument('--json', help='записать полный отчет в файл')
+    args = parser.parse_args()
+
+    result = simulate(args.players, args.days, args.step, args.seed, args.join_days, economy.load_config(args.config))
+    print_report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
@@ -24,41 +24,64 @@ class CoinClickerGame {
         this.username = 'Игрок';
         this.playTime = 0;
         
-        this.grades = [
-            {id: 0, name: 'BRONZE', bonus: 1.0, icon: '🥉', color: '#cd7f32'},
-            {id: 1, name: 'SILVER', bonus: 1.1, icon: '🥈', color: '#c0c0c0'},
-            {id: 2, name: 'GOLD', bonus: 1.25, icon: '🥇', color: '#ffd700'},
-            {id: 3, name: 'PLATINUM', bonus: 1.5, icon: '🏆', color: '#e5e4e2'},
-            {id: 4, name: 'DIAMOND', bonus: 2.0, icon: '💎', color: '#b9f2ff'},
-            {id: 5, name: 'EMERALD', bonus: 3.0, icon: '🔮', color: '#50c878'},
-            {id: 6, name: 'RUBY', bonus: 5.0, icon: '❤️', color: '#e0115f'},
-            {id: 7, name: 'SAPPHIRE', bonus: 9.0, icon: '💠', color: '#0f52ba'},
-            {id: 8, name: 'AMETHYST', bonus: 16.0, icon: '💜', color: '#9966cc'},
-            {id: 9, name: 'COSMIC', bonus: 31.0, icon: '🌌', color: '#8a2be2'}
-        ];
-        
-        this.autoclickerTypes = [
-            {id: 'basic', name: 'Простой робот', baseCPS: 0.1, baseCost: 100, icon: '🤖'},
-            {id: 'advanced', name: 'Продвинутый робот', baseCPS: 0.5, baseCost: 500, icon: '🦾'},
-            {id: 'farm', name: 'Ферма кликов', baseCPS: 2, baseCost: 2000, icon: '🏭'},
-            {id: 'factory', name: 'Фабрика', baseCPS: 10, baseCost: 10000, icon: '🏢'},
-            {id: 'ai', name: 'ИИ система', baseCPS: 50, baseCost: 50000, icon: '🧠'}
-        ];
-        
-        this.buildingTypes = [
-            {id: 'lemonade', name: 'Лавка лимонада', baseCPS: 0.5, baseCost: 1000, icon: '🍋'},
-            {id: 'newspaper', name: 'Газетный киоск', baseCPS: 2, baseCost: 5000, icon: '📰'},
-            {id: 'car_wash', name: 'Мойка авто', baseCPS: 10, baseCost: 25000, icon: '🚗'},
-            {id: 'pizza', name: 'Пиццерия', baseCPS: 50, baseCost: 100000, icon: '🍕'},
-            {id: 'cinema', name: 'Кинотеатр', baseCPS: 200, baseCost: 500000, icon: '🎬'},
-            {id: 'bank', name: 'Банк', baseCPS: 1000, baseCost: 2500000, icon: '🏦'},
-            {id: 'tech', name: 'Тех компания', baseCPS: 5000, baseCost: 10000000, icon: '💻'}
-        ];
+        // Дельта-сохранения: последняя подтвержденная сервером ревизия и состояние на ней
+        this.revision = 0;
+        this.syncedState = null;
+        this.saveInFlight = false;
+        this.savePending = false;
+        // Повтор сохранения после 429/503 (Retry-After)
+        this.syncRetryTimer = null;
+        
+        // Очередь покупок для /api/buy_batch
+        this.purchaseQueue = [];
+        this.purchaseTimer = null;
+        // Цена покупок, которые сервер еще не подтвердил: вычитается из любого
+        // пришедшего с сервера баланса, пока не придет ответ на их пачку
+        this.unconfirmedCost = 0;
+        
+        // Клики копятся посекундными окнами {start, clicks, crits, gain}
+        // и уходят в /api/clicks или вместе со следующим сохранением
+        this.clickWindows = [];
+        this.clickTimer = null;
+        
+        // Push-канал /api/events: события игрока, диффы лидерборда, онлайн.
+        // clientId отличает эту вкладку — сервер не шлет ей баланс после ее же покупок
+        this.clientId = Math.random().toString(36).substr(2, 12);
+        this.events = null;
+        this.pushConnected = false;
+        this.boostEnds = {};
+        this.dailyAvailable = true;
+        // Кэш топов по категориям {version, players}, обновляется диффами
+        this.leaderboards = {};
+        this.leaderboardCategory = 'total';
+        // Разница часов сервера и клиента (мс) — окна кликов сервер сверяет по своим часам
+        this.clockOffset = 0;
+        // Место игрока из /api/session — показывается, если он не попал в топ
+        this.playerRank = null;
+        this.initialized = null;
+        
+        // Определения игры (грейды, автокликеры, здания, цены, бусты, достижения) —
+        // из /api/config, см. loadConfig()/applyConfig()
+        this.config = null;
+        this.grades = [];
+        this.autoclickerTypes = [];
+        this.buildingTypes = [];
+        this.upgradeTypes = [];
+        this.boostTypes = [];
+        this.achievementTypes = [];
         
         this.init();
     }
     
-    async init() {
+    // Повторный вызов (например, из старой страницы) возвращает ту же инициализацию
+    init() {
+        if (!this.initialized) {
+            this.initialized = this.start();
+        }
+        return this.initialized;
+    }
+    
+    async start() {
         // Telegram WebApp
         if (window.Telegram && Telegram.WebApp) {
             const tg = Telegram.WebApp;
@@ -75,7 +98,9 @@ class CoinClickerGame {
             this.playerId = 'local_' + Date.now();
         }
         
+        await this.loadConfig();
         await this.loadGame();
+        this.connectEvents();
         this.setupEventListeners();
         this.startGameLoop();
         this.updateUI();
@@ -84,17 +109,83 @@ class CoinClickerGame {
         this.loadBuildings();
         this.loadAchievements();
         this.loadGradesInfo();
-        this.updateLeaderboard('total');
         
         console.log('🎮 Coin Clicker Master инициализирован!');
     }
     
+    // Определения скачиваются не чаще раза на версию: версия приходит в странице
+    // (meta config-version), сами определения лежат в localStorage
+    async loadConfig() {
+        const meta = document.querySelector('meta[name="config-version"]');
+        const version = meta ? meta.content : '';
+        
+        let cached = null;
+        try {
+            cached = JSON.parse(localStorage.getItem('gameConfig') || 'null');
+        } catch (error) {
+            console.error('Ошибка чтения кэша определений:', error);
+        }
+        if (cached && version && cached.version === version) {
+            this.applyConfig(cached.config);
+            return;
+        }
+        
+        let config;
+        try {
+            const response = await fetch(version ? `/api/config?v=${version}` : '/api/config');
+            config = await response.json();
+        } catch (error) {
+            // Без сети — устаревшие определения лучше, чем никаких
+            if (!cached) throw error;
+            console.error('Ошибка загрузки определений:', error);
+            this.applyConfig(cached.config);
+            return;
+        }
+        this.applyConfig(config);
+        
+        try {
+            localStorage.setItem('gameConfig', JSON.stringify({version: version, config: config}));
+        } catch (error) {
+            console.error('Ошибка записи кэша определений:', error);
+        }
+    }
+    
+    applyConfig(config) {
+        this.config = config;
+        this.grades = config.grades;
+        this.autoclickerTypes = config.autoclickers.map(c => ({
+            id: c.id, name: c.name, baseCPS: c.base_cps, baseCost: c.base_cost, icon: c.icon,
+            costGrowth: config.autoclicker_cost_growth
+        }));
+        this.buildingTypes = config.buildings.map(b => ({
+            id: b.id, name: b.name, baseCPS: b.base_cps, baseCost: b.base_cost, icon: b.icon,
+            costGrowth: config.building_cost_growth
+        }));
+        this.upgradeTypes = config.upgrades.map(u => ({
+            id: u.id, name: u.name, desc: u.desc, icon: u.icon, baseCost: u.base_cost, costGrowth: u.cost_growth
+        }));
+        this.boostTypes = config.boosts;
+        this.achievementTypes = config.achievements;
+    }
+    
+    // Цена следующей штуки при owned купленных — та же формула, что registry.purchase_cost
+    itemCost(item, owned) {
+        return item.baseCost * Math.pow(item.costGrowth, owned);
+    }
+    
+    // Все стартовые данные одним запросом /api/session: состояние игрока (новый
+    // создается на сервере), топ лидерборда, место игрока, дневная награда, время сервера
     async loadGame() {
+        let loaded = false;
+        
         try {
-            const response = await fetch(`/api/player/${this.playerId}`);
-            const data = await response.json();
+            const query = `category=${this.leaderboardCategory}&username=${encodeURIComponent(this.username)}`;
+            const response = await fetch(`/api/session/${encodeURIComponent(this.playerId)}?${query}`);
+            const session = await response.json();
+            const data = session.player;
             
-            if (data.coins !== undefined) {
+            if (data && data.coins !== undefined) {
+                loaded = true;
                 this.coins = data.coins;
                 this.gems = data.gems;
                 this.tokens = data.tokens;
@@ -108,23 +199,135 @@ class CoinClickerGame {
                 this.buildings = data.buildings || {};
                 this.achievements = data.achievements || {};
                 this.activeBoosts = data.active_boosts || {};
+                this.revision = data.revision || 0;
+                
+                this.clockOffset = session.server_time * 1000 - Date.now();
+                this.setDailyAvailable(session.daily, false);
+                
+                // Топ с версией дальше обновляется диффами из /api/events
+                const board = session.leaderboard;
+                this.playerRank = {category: board.category, ...session.rank};
+                if (board.version !== null) {
+                    this.leaderboards[board.category] = {version: board.version, players: board.players};
+                }
+                this.renderLeaderboard(board.category, board.players);
                 
                 this.calculateStats();
+                
+                // Доход, начисленный сервером за время отсутствия
+                if (data.offline_earnings && data.offline_earnings.coins > 0) {
+                    this.showNotification(`💤 Пока вас не было: +${this.formatNumber(data.offline_earnings.coins)} 🪙`);
+                }
             }
         } catch (error) {
             console.log('Загрузка сохранения:', error);
         }
         
+        // Сервер — источник истины, локальное сохранение нужно только без связи
         const localSave = localStorage.getItem(`coinclicker_${this.playerId}`);
-        if (localSave) {
+        if (!loaded && localSave) {
             const localData = JSON.parse(localSave);
             Object.assign(this, localData);
         }
+    }
+    
+    connectEvents() {
+        if (this.events || !window.EventSource) return;
+        
+        const query = `player_id=${encodeURIComponent(this.playerId)}&client_id=${this.clientId}`;
+        this.events = new EventSource(`/api/events?${query}`);
         
-        this.saveGame();
+        this.events.onopen = () => {
+            this.pushConnected = true;
+        };
+        this.events.onerror = () => {
+            // EventSource переподключится сам; пропущенные диффы не восстановить — сбрасываем кэш
+            this.pushConnected = false;
+            this.leaderboards = {};
+        };
+        
+        const handlers = {
+            state: (data) => this.onPushState(data),
+            balance: (data) => this.onPushBalance(data),
+            boost: (data) => this.onPushBoost(data),
+            achievement: (data) => this.onPushAchievement(data),
+            daily: (data) => this.setDailyAvailable(data, true),
+            online: (data) => {
+                const online = document.getElementById('onlineCount');
+                if (online) online.textContent = data.players;
+            },
+            leaderboard: (data) => this.onPushLeaderboard(data)
+        };
+        Object.entries(handlers).forEach(([event, handler]) => {
+            this.events.addEventListener(event, (message) => handler(JSON.parse(message.data)));
+        });
+    }
+    
+    onPushState(data) {
+        // Состояние при (пере)подключении заменяет локальное
+        this.activeBoosts = {};
+        this.boostEnds = {};
+        Object.entries(data.boosts).forEach(([boostId, boost]) => {
+            this.activeBoosts[boostId] = boost.multiplier;
+            this.boostEnds[boostId] = boost.ends_at;
+        });
+        this.setDailyAvailable(data.daily, false);
+        this.calculateStats();
+        this.updateUI();
+    }
+    
+    onPushBalance(data) {
+        // Покупка в другой вкладке или на другом устройстве
+        this.applyBalance(data);
     }
     
-    saveGame() {
+    onPushBoost(data) {
+        if (data.active) {
+            this.activeBoosts[data.boost_id] = data.multiplier;
+            this.boostEnds[data.boost_id] = data.ends_at;
+        } else if (this.boostEnds[data.boost_id] !== undefined && this.boostEnds[data.boost_id] <= data.ends_at) {
+            // Буст могли продлить: снимаем только тот, что действительно закончился
+            delete this.activeBoosts[data.boost_id];
+            delete this.boostEnds[data.boost_id];
+            this.showNotification('⌛ Буст закончился');
+        } else {
+            return;
+        }
+        this.calculateStats();
+        this.updateUI();
+    }
+    
+    setDailyAvailable(daily, notify) {
+        if (notify && daily.available && !this.dailyAvailable) {
+            this.showNotification('🎁 Дневная награда доступна!');
+        }
+        this.dailyAvailable = daily.available;
+        const claimBtn = document.getElementById('claimDailyBtn');
+        if (claimBtn) claimBtn.disabled = !daily.available;
+    }
+    
+    onPushLeaderboard(data) {
+        const cached = this.leaderboards[data.category];
+        if (!cached || cached.version !== data.base) {
+            // Диффы пропущены — при следующем показе загрузим топ заново
+            delete this.leaderboards[data.category];
+            return;
+        }
+        
+        // Индекс >= 0 — запись из прошлой версии, отрицательный — новая запись из entries
+        const players = data.order.map(i => i >= 0 ? cached.players[i] : data.entries[-1 - i]);
+        this.leaderboards[data.category] = {version: data.version, players: players};
+        if (this.leaderboardCategory === data.category) {
+            this.renderLeaderboard(data.category, players);
+        }
+    }
+    
+    saveGame(keepalive = false) {
+        this.saveLocal();
+        this.syncToServer(keepalive);
+    }
+    
+    saveLocal() {
         const saveData = {
             coins: this.coins,
             gems: this.gems,
@@ -147,26 +350,106 @@ class CoinClickerGame {
         };
         
         localStorage.setItem(`coinclicker_${this.playerId}`, JSON.stringify(saveData));
+    }
+    
+    // Баланс и статистику ведет сервер (клики — через окна, доход досчитывает сам),
+    // в сохранении остается только то, что задает игрок
+    serverState() {
+        return {
+            fields: {
+                username: this.username
+            }
+        };
+    }
+    
+    // Баланс из ответа сервера; поверх — клики, которые он еще не получил,
+    // и покупки, которые он еще не подтвердил
+    applyBalance(balance) {
+        const pending = this.clickWindows.reduce((sum, window) => ({
+            clicks: sum.clicks + window.clicks,
+            gain: sum.gain + window.gain
+        }), {clicks: 0, gain: 0});
+        
+        this.coins = balance.coins + pending.gain - this.unconfirmedCost;
+        this.gems = balance.gems;
+        this.tokens = balance.tokens;
+        if (balance.total_clicks !== undefined) {
+            this.totalClicks = balance.total_clicks + pending.clicks;
+            this.totalEarned = balance.total_earned + pending.gain;
+            this.currentGrade = balance.current_grade;
+            this.gradeProgress = balance.grade_progress;
+        }
+        this.calculateStats();
+        this.updateUI();
+    }
+    
+    async syncToServer(keepalive = false) {
+        // Одновременно в полете только одно сохранение, остальные сливаются в следующее
+        if (this.saveInFlight) {
+            this.savePending = true;
+            return;
+        }
         
-        const achievementsCompleted = Object.values(this.achievements).filter(a => a.completed).length;
+        const state = this.serverState();
+        let body;
         
-        fetch('/api/save', {
-            method: 'POST',
-            headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({
+        if (!this.syncedState) {
+            // Полное сохранение: первое в сессии или после отказа по ревизии
+            body = {player_id: this.playerId, ...state.fields};
+        } else {
+            const patch = {};
+            Object.entries(state.fields).forEach(([key, value]) => {
+                if (this.syncedState.fields[key] !== value) patch[key] = value;
+            });
+            
+            if (Object.keys(patch).length === 0 && this.clickWindows.length === 0) return;
+            
+            body = {
                 player_id: this.playerId,
-                username: this.username,
-                coins: this.coins,
-                gems: this.gems,
-                tokens: this.tokens,
-                total_clicks: this.totalClicks,
-                total_earned: this.totalEarned,
-                current_grade: this.currentGrade,
-                grade_progress: this.gradeProgress,
-                achievements: this.achievements,
-                achievements_completed: achievementsCompleted
-            })
-        }).catch(console.error);
+                base_revision: this.revision,
+                revision: this.revision + 1,
+                patch: patch
+            };
+        }
+        
+        // Несохраненные клики едут вместе с сохранением: сервер начислит их до применения
+        const windows = this.takeClickWindows(keepalive);
+        if (windows.length > 0) body.clicks = this.clickBatch(windows);
+        if (this.clickWindows.length > 0) this.scheduleClickSync();
+        
+        this.saveInFlight = true;
+        try {
+            const response = await fetch('/api/save', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify(body),
+                keepalive: keepalive
+            });
+            const result = await response.json();
+            if (result.balance) this.applyBalance(result.balance);
+            
+            if (result.success) {
+                this.revision = result.revision;
+                this.syncedState = state;
+            } else if (response.status === 409) {
+                // Ревизия устарела — следующим отправим полное состояние
+                this.revision = result.revision;
+                this.syncedState = null;
+                this.savePending = true;
+            } else if (this.isThrottled(response)) {
+                this.restoreClickWindows(windows);
+                this.scheduleSync(this.retryDelay(response));
+            }
+        } catch (error) {
+            console.error(error);
+            this.restoreClickWindows(windows);
+        } finally {
+            this.saveInFlight = false;
+            if (this.savePending) {
+                this.savePending = false;
+                this.syncToServer();
+            }
+        }
     }
     
     calculateStats() {
@@ -174,25 +457,26 @@ class CoinClickerGame {
         let baseClick = 1;
         
         // Улучшения клика
+        const click = this.config.click;
         if (this.upgrades.click_power) {
-            baseClick *= Math.pow(1.1, this.upgrades.click_power);
+            baseClick *= Math.pow(click.power_growth, this.upgrades.click_power);
         }
         
         this.clickPower = baseClick;
         
         // Критические удары
-        let critChance = 0.05;
-        let critMultiplier = 2;
+        let critChance = click.base_crit_chance;
+        let critMultiplier = click.base_crit_multiplier;
         
         if (this.upgrades.crit_chance) {
-            critChance += this.upgrades.crit_chance * 0.01;
+            critChance += this.upgrades.crit_chance * click.crit_chance_per_level;
         }
         
         if (this.upgrades.crit_power) {
-            critMultiplier += this.upgrades.crit_power * 0.2;
+            critMultiplier += this.upgrades.crit_power * click.crit_multiplier_per_level;
         }
         
-        this.critChance = Math.min(critChance, 0.5);
+        this.critChance = Math.min(critChance, click.max_crit_chance);
         this.critMultiplier = critMultiplier;
         
         // Множители
@@ -209,7 +493,7 @@ class CoinClickerGame {
         
         // Улучшения множителя
         if (this.upgrades.multiplier) {
-            multiplier *= Math.pow(1.2, this.upgrades.multiplier);
+            multiplier *= Math.pow(click.multiplier_upgrade_bonus, this.upgrades.multiplier);
         }
         
         this.totalMultiplier = multiplier;
@@ -255,66 +539,145 @@ class CoinClickerGame {
         this.createClickEffect(event, isCritical, gain);
         this.showNotification(isCritical ? `💥 КРИТИЧЕСКИЙ УДАР! +${gain.toFixed(2)}` : `+${gain.toFixed(2)}`);
         this.updateUI();
-        this.saveGame();
+        this.recordClick(isCritical, gain);
         
         return gain;
     }
     
+    // Секундные окна кликов; gain — локальная оценка дохода, пока сервер не начислил окно
+    recordClick(isCritical, gain) {
+        const start = Math.floor((Date.now() + this.clockOffset) / 1000) * 1000;
+        let window = this.clickWindows[this.clickWindows.length - 1];
+        if (!window || window.start !== start) {
+            window = {start: start, clicks: 0, crits: 0, gain: 0};
+            this.clickWindows.push(window);
+        }
+        window.clicks++;
+        if (isCritical) window.crits++;
+        window.gain += gain;
+        
+        this.scheduleClickSync();
+    }
+    
+    scheduleClickSync() {
+        if (this.clickTimer) return;
+        this.clickTimer = setTimeout(() => {
+            this.clickTimer = null;
+            this.syncClicks();
+        }, 2000);
+    }
+    
+    // Уходят только окна завершившихся секунд: сервер принимает окно не раньше конца
+    // последнего принятого, и клики, сделанные в ту же секунду после отправки ее окна,
+    // были бы отклонены. При уходе со страницы (all) — все, включая текущее
+    takeClickWindows(all = false) {
+        const now = Date.now() + this.clockOffset;
+        const count = all ? this.clickWindows.length
+            : this.clickWindows.filter(window => window.start + 1000 <= now).length;
+        return this.clickWindows.splice(0, count);
+    }
+    
+    // Окна для сервера: [начало_мс, длительность_мс, клики, криты]
+    clickBatch(windows) {
+        return windows.map(window => [window.start, 1000, window.clicks, window.crits]);
+    }
+    
+    restoreClickWindows(windows) {
+        // Окна, которые сервер не получил, возвращаются в начало очереди
+        this.clickWindows = windows.concat(this.clickWindows);
+    }
+    
+    async syncClicks() {
+        // Клики и сохранения идут по одному каналу: сохранение в полете заберет клики следующим
+        if (this.saveInFlight) {
+            this.savePending = true;
+            return;
+        }
+        
+        const windows = this.takeClickWindows();
+        // Окно текущей секунды отправится следующим
+        if (this.clickWindows.length > 0) this.scheduleClickSync();
+        if (windows.length === 0) return;
+        
+        this.saveInFlight = true;
+        try {
+            const response = await fetch('/api/clicks', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({player_id: this.playerId, windows: this.clickBatch(windows)})
+            });
+            if (this.isThrottled(response)) {
+                this.restoreClickWindows(windows);
+                this.scheduleSync(this.retryDelay(response));
+                return;
+            }
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            this.applyBalance((await response.json()).balance);
+        } catch (error) {
+            console.error(error);
+            this.restoreClickWindows(windows);
+        } finally {
+            this.saveInFlight = false;
+            if (this.savePending) {
+                this.savePending = false;
+                this.syncToServer();
+            }
+        }
+    }
+    
+    // Сервер ограничил частоту (429) или сбросил нагрузку (503) — повтор после Retry-After
+    isThrottled(response) {
+        return response.status === 429 || response.status === 503;
+    }
+    
+    retryDelay(response) {
+        const seconds = Number(response.headers.get('Retry-After'));
+        return (seconds > 0 ? seconds : 1) * 1000;
+    }
+    
+    scheduleSync(delay) {
+        if (this.syncRetryTimer) return;
+        this.syncRetryTimer = setTimeout(() => {
+            this.syncRetryTimer = null;
+            this.syncToServer();
+        }, delay);
+    }
+    
     addGradeProgress(gain) {
         const currentGradeData = this.grades[this.currentGrade];
         const nextGradeData = this.grades[Math.min(this.currentGrade + 1, this.grades.length - 1)];
         
-        const progressPerCoin = 100 / (Math.pow(2, this.currentGrade) * 10000);
+        const gradeProgress = this.config.grade_progress;
+        const gradeReward = this.config.grade_reward;
+        const progressPerCoin = 100 / (Math.pow(gradeProgress.growth, this.currentGrade) * gradeProgress.base_coins);
         this.gradeProgress += gain * progressPerCoin;
         
         if (this.gradeProgress >= 100 && this.currentGrade < this.grades.length - 1) {
             this.currentGrade++;
             this.gradeProgress = 0;
-            this.coins += 1000 * Math.pow(2, this.currentGrade);
-            this.gems += this.currentGrade;
+            const rewardCoins = gradeReward.base_coins * Math.pow(gradeReward.coins_growth, this.currentGrade);
+            const rewardGems = gradeReward.gems_per_grade * this.currentGrade;
+            this.coins += rewardCoins;
+            this.gems += rewardGems;
             
-            this.showNotification(`🎉 Новый грейд: ${nextGradeData.name}! +${(1000 * Math.pow(2, this.currentGrade)).toFixed(0)} монет +${this.currentGrade} 💎`);
+            this.showNotification(`🎉 Новый грейд: ${nextGradeData.name}! +${rewardCoins.toFixed(0)} монет +${rewardGems} 💎`);
         }
     }
     
     async buyUpgrade(upgradeId) {
-        const upgradeCosts = {
-            'click_power': {coins: 50 * Math.pow(1.2, this.upgrades.click_power || 0)},
-            'multiplier': {coins: 200 * Math.pow(1.5, this.upgrades.multiplier || 0)},
-            'crit_chance': {coins: 500 * Math.pow(1.3, this.upgrades.crit_chance || 0)},
-            'crit_power': {coins: 1000 * Math.pow(1.4, this.upgrades.crit_power || 0)}
-        };
+        const upgrade = this.upgradeTypes.find(u => u.id === upgradeId);
+        if (!upgrade) return false;
         
-        const cost = upgradeCosts[upgradeId];
-        if (!cost) return false;
+        const cost = {coins: this.itemCost(upgrade, this.upgrades[upgradeId] || 0)};
         
         if (this.coins >= cost.coins) {
-            try {
-                const response = await fetch('/api/buy_upgrade', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({
-                        player_id: this.playerId,
-                        upgrade_id: upgradeId,
-                        cost_coins: cost.coins,
-                        type: 'click'
-                    })
-                });
-                
-                const result = await response.json();
-                if (result.success) {
-                    this.coins = result.new_balance.coins;
-                    this.upgrades[upgradeId] = (this.upgrades[upgradeId] || 0) + 1;
-                    
-                    this.calculateStats();
-                    this.showNotification('✅ Улучшение куплено!');
-                    this.updateUI();
-                    this.saveGame();
-                    return true;
-                }
-            } catch (error) {
-                console.error('Ошибка покупки:', error);
-            }
+            this.upgrades[upgradeId] = (this.upgrades[upgradeId] || 0) + 1;
+            this.queuePurchase('upgrade', upgradeId, cost.coins);
+            
+            this.calculateStats();
+            this.showNotification('✅ Улучшение куплено!');
+            this.updateUI();
+            return true;
         } else {
             this.showNotification(`❌ Необходимо ${cost.coins.toFixed(2)} монет!`);
         }
@@ -326,41 +689,21 @@ class CoinClickerGame {
         if (!clicker) return false;
         
         const owned = this.autoclickers[clickerId]?.quantity || 0;
-        const cost = clicker.baseCost * Math.pow(1.15, owned);
+        const cost = this.itemCost(clicker, owned);
         
         if (this.coins >= cost) {
-            try {
-                const response = await fetch('/api/buy_upgrade', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({
-                        player_id: this.playerId,
-                        upgrade_id: clickerId,
-                        cost_coins: cost,
-                        type: 'autoclicker'
-                    })
-                });
-                
-                const result = await response.json();
-                if (result.success) {
-                    this.coins = result.new_balance.coins;
-                    
-                    if (!this.autoclickers[clickerId]) {
-                        this.autoclickers[clickerId] = {quantity: 1, level: 1};
-                    } else {
-                        this.autoclickers[clickerId].quantity++;
-                    }
-                    
-                    this.calculateStats();
-                    this.showNotification(`✅ ${clicker.name} куплен!`);
-                    this.updateUI();
-                    this.saveGame();
-                    this.loadAutoclickers();
-                    return true;
-                }
-            } catch (error) {
-                console.error('Ошибка покупки:', error);
+            if (!this.autoclickers[clickerId]) {
+                this.autoclickers[clickerId] = {quantity: 1, level: 1};
+            } else {
+                this.autoclickers[clickerId].quantity++;
             }
+            this.queuePurchase('autoclicker', clickerId, cost);
+            
+            this.calculateStats();
+            this.showNotification(`✅ ${clicker.name} куплен!`);
+            this.updateUI();
+            this.loadAutoclickers();
+            return true;
         } else {
             this.showNotification(`❌ Необходимо ${cost.toFixed(2)} монет!`);
         }
@@ -372,56 +715,104 @@ class CoinClickerGame {
         if (!building) return false;
         
         const owned = this.buildings[buildingId]?.quantity || 0;
-        const cost = building.baseCost * Math.pow(1.12, owned);
+        const cost = this.itemCost(building, owned);
         
         if (this.coins >= cost) {
-            try {
-                const response = await fetch('/api/buy_upgrade', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({
-                        player_id: this.playerId,
-                        upgrade_id: buildingId,
-                        cost_coins: cost,
-                        type: 'building'
-                    })
-                });
-                
-                const result = await response.json();
-                if (result.success) {
-                    this.coins = result.new_balance.coins;
-                    
-                    if (!this.buildings[buildingId]) {
-                        this.buildings[buildingId] = {quantity: 1, level: 1};
-                    } else {
-                        this.buildings[buildingId].quantity++;
-                    }
-                    
-                    this.calculateStats();
-                    this.showNotification(`✅ ${building.name} построено!`);
-                    this.updateUI();
-                    this.saveGame();
-                    this.loadBuildings();
-                    return true;
-                }
-            } catch (error) {
-                console.error('Ошибка покупки:', error);
+            if (!this.buildings[buildingId]) {
+                this.buildings[buildingId] = {quantity: 1, level: 1};
+            } else {
+                this.buildings[buildingId].quantity++;
             }
+            this.queuePurchase('building', buildingId, cost);
+            
+            this.calculateStats();
+            this.showNotification(`✅ ${building.name} построено!`);
+            this.updateUI();
+            this.loadBuildings();
+            return true;
         } else {
             this.showNotification(`❌ Необходимо ${cost.toFixed(2)} монет!`);
         }
         return false;
     }
     
-    async buyBoost(boostId) {
-        const boosts = {
-            'x2_1h': {gems: 5, multiplier: 2, duration: 3600},
-            'x3_30m': {gems: 10, multiplier: 3, duration: 1800},
-            'x5_15m': {gems: 20, multiplier: 5, duration: 900}
-        };
+    // Покупки применяются сразу локально и уходят на сервер одной пачкой
+    queuePurchase(type, id, cost) {
+        this.coins -= cost;
+        this.unconfirmedCost += cost;
+        this.purchaseQueue.push({type, id, cost});
+        
+        clearTimeout(this.purchaseTimer);
+        this.purchaseTimer = setTimeout(() => this.flushPurchases(), 300);
+    }
+    
+    async flushPurchases() {
+        if (this.purchaseQueue.length === 0) return;
+        
+        const queued = this.purchaseQueue;
+        const counts = {};
+        queued.forEach(({type, id}) => {
+            const key = `${type}:${id}`;
+            counts[key] = (counts[key] || 0) + 1;
+        });
+        this.purchaseQueue = [];
+        
+        const purchases = Object.entries(counts).map(([key, quantity]) => {
+            const [type, id] = key.split(':');
+            return {type, id, quantity};
+        });
+        const cost = queued.reduce((sum, purchase) => sum + purchase.cost, 0);
+        let held = true;
         
-        const boost = boosts[boostId];
-        if (!boost || this.gems < boost.gems) {
+        try {
+            const response = await fetch('/api/buy_batch', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({player_id: this.playerId, client_id: this.clientId, purchases: purchases})
+            });
+            
+            // Отклоненная по лимиту пачка уходит повторно вместе с новыми покупками
+            if (this.isThrottled(response)) {
+                this.purchaseQueue = queued.concat(this.purchaseQueue);
+                clearTimeout(this.purchaseTimer);
+                this.purchaseTimer = setTimeout(() => this.flushPurchases(), this.retryDelay(response));
+                return;
+            }
+            
+            const result = await response.json();
+            this.unconfirmedCost -= cost;
+            held = false;
+            
+            // Сервер возвращает итоговый баланс и уровни — и при успехе, и при отказе
+            if (result.new_balance) {
+                this.applyBalance(result.new_balance);
+            }
+            if (result.levels) {
+                this.upgrades = result.levels.upgrades;
+                this.autoclickers = result.levels.autoclickers;
+                this.buildings = result.levels.buildings;
+            }
+            if (!result.success) {
+                this.showNotification(`❌ ${result.error}`);
+            }
+            
+            this.calculateStats();
+            this.updateUI();
+            this.saveGame();
+            this.loadUpgrades();
+            this.loadAutoclickers();
+            this.loadBuildings();
+        } catch (error) {
+            console.error('Ошибка покупки:', error);
+            // Ответа нет — сервер пачку не списал или ее итог придет с балансом следующей синхронизации
+            if (held) this.unconfirmedCost -= cost;
+        }
+    }
+    
+    async buyBoost(boostId) {
+        const boost = this.boostTypes.find(b => b.id === boostId);
+        if (!boost) return false;
+        if (this.gems < boost.gems) {
             this.showNotification(`❌ Необходимо ${boost.gems} 💎`);
             return false;
         }
@@ -432,29 +823,27 @@ class CoinClickerGame {
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({
                     player_id: this.playerId,
-                    boost_id: boostId,
-                    cost_gems: boost.gems,
-                    multiplier: boost.multiplier,
-                    duration: boost.duration
+                    client_id: this.clientId,
+                    boost_id: boostId
                 })
             });
             
             const result = await response.json();
             if (result.success) {
-                this.gems -= boost.gems;
+                this.applyBalance(result.new_balance);
                 this.activeBoosts[boostId] = boost.multiplier;
+                this.boostEnds[boostId] = result.ends_at;
                 
                 this.calculateStats();
                 this.showNotification(`⚡ Буст x${boost.multiplier} активирован!`);
                 this.updateUI();
                 this.saveGame();
                 
-                setTimeout(() => {
-                    delete this.activeBoosts[boostId];
-                    this.calculateStats();
-                    this.updateUI();
-                    this.saveGame();
-                }, boost.duration * 1000);
+                // Окончание буста приходит событием из /api/events; таймер — только без push-канала
+                if (!this.pushConnected) {
+                    setTimeout(() => this.onPushBoost({boost_id: boostId, ends_at: result.ends_at, active: false}),
+                        boost.duration * 1000);
+                }
                 
                 return true;
             }
@@ -469,14 +858,13 @@ class CoinClickerGame {
             const response = await fetch('/api/claim_daily', {
                 method: 'POST',
                 headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({player_id: this.playerId})
+                body: JSON.stringify({player_id: this.playerId, client_id: this.clientId})
             });
             
             const result = await response.json();
             if (result.success) {
-                this.coins += result.reward.coins;
-                this.gems += result.reward.gems || 0;
-                this.tokens += result.reward.tokens || 0;
+                this.setDailyAvailable({available: false, next_at: result.next_at}, false);
+                this.applyBalance(result.new_balance);
                 
                 this.showNotification(`🎁 Дневная награда: +${result.reward.coins} 🪙 +${result.reward.gems || 0} 💎`);
                 this.updateUI();
@@ -611,10 +999,14 @@ class CoinClickerGame {
         if (claimBtn) {
             claimBtn.addEventListener('click', () => this.claimDailyReward());
         }
+        
+        // Сохраняем при уходе со страницы, чтобы офлайн-доход считался с актуального момента
+        window.addEventListener('pagehide', () => this.saveGame(true));
     }
     
     startGameLoop() {
-        // Пассивный доход
+        // Пассивный доход — для отображения между синхронизациями: сервер
+        // досчитывает его сам при каждом сохранении, кликах и покупке
         setInterval(() => {
             if (this.coinsPerSecond > 0) {
                 const passiveGain = this.coinsPerSecond;
@@ -622,7 +1014,7 @@ class CoinClickerGame {
                 this.totalEarned += passiveGain;
                 this.addGradeProgress(passiveGain);
                 this.updateUI();
-                this.saveGame();
+                this.saveLocal();
             }
         }, 1000);
         
@@ -637,30 +1029,12 @@ class CoinClickerGame {
     }
     
     loadUpgrades() {
-        const clickUpgrades = [
-            {id: 'click_power', name: 'Усилитель клика', desc: '+10% к силе клика', icon: '💪'},
-            {id: 'multiplier', name: 'Глобальный множитель', desc: '+20% ко всему доходу', icon: '🌀'},
-            {id: 'crit_chance', name: 'Критический шанс', desc: '+1% шанс крита', icon: '🎯'},
-            {id: 'crit_power', name: 'Мощность крита', desc: '+0.2 к множителю крита', icon: '💥'}
-        ];
-        
-        const multiplierUpgrades = [
-            {id: 'x2_1h', name: 'x2 на 1 час', desc: 'Удваивает доход на 1 час', icon: '⚡', gems: 5},
-            {id: 'x3_30m', name: 'x3 на 30 минут', desc: 'Утраивает доход на 30 минут', icon: '⚡⚡', gems: 10},
-            {id: 'x5_15m', name: 'x5 на 15 минут', desc: 'x5 доход на 15 минут', icon: '⚡⚡⚡', gems: 20}
-        ];
-        
         // Загружаем улучшения клика
         const clickGrid = document.getElementById('clickUpgrades');
         if (clickGrid) {
-            clickGrid.innerHTML = clickUpgrades.map(upgrade => {
+            clickGrid.innerHTML = this.upgradeTypes.map(upgrade => {
                 const level = this.upgrades[upgrade.id] || 0;
-                const baseCost = upgrade.id === 'click_power' ? 50 : 
-                                upgrade.id === 'multiplier' ? 200 : 
-                                upgrade.id === 'crit_chance' ? 500 : 1000;
-                const cost = baseCost * Math.pow(upgrade.id === 'click_power' ? 1.2 : 
-                                               upgrade.id === 'multiplier' ? 1.5 : 
-                                               upgrade.id === 'crit_chance' ? 1.3 : 1.4, level);
+                const cost = this.itemCost(upgrade, level);
                 
                 return `
                     <div class="upgrade-card" onclick="game.buyUpgrade('${upgrade.id}')">
@@ -681,7 +1055,7 @@ class CoinClickerGame {
         // Загружаем множители
         const multiGrid = document.getElementById('multiplierUpgrades');
         if (multiGrid) {
-            multiGrid.innerHTML = multiplierUpgrades.map(boost => `
+            multiGrid.innerHTML = this.boostTypes.map(boost => `
                 <div class="upgrade-card" onclick="game.buyBoost('${boost.id}')">
                     <div class="upgrade-header">
                         <div class="upgrade-icon">${boost.icon}</div>
@@ -701,7 +1075,7 @@ class CoinClickerGame {
         grid.innerHTML = this.autoclickerTypes.map(clicker => {
             const data = this.autoclickers[clicker.id] || {quantity: 0, level: 1};
             const owned = data.quantity;
-            const cost = clicker.baseCost * Math.pow(1.15, owned);
+            const cost = this.itemCost(clicker, owned);
             
             return `
                 <div class="upgrade-card" onclick="game.buyAutoclicker('${clicker.id}')">
@@ -726,7 +1100,7 @@ class CoinClickerGame {
         grid.innerHTML = this.buildingTypes.map(building => {
             const data = this.buildings[building.id] || {quantity: 0, level: 1};
             const owned = data.quantity;
-            const cost = building.baseCost * Math.pow(1.12, owned);
+            const cost = this.itemCost(building, owned);
             
             return `
                 <div class="building-card" onclick="game.buyBuilding('${building.id}')">
@@ -745,21 +1119,10 @@ class CoinClickerGame {
     }
     
     loadAchievements() {
-        const achievements = [
-            {id: 'first_click', name: 'Первый шаг', desc: 'Сделать 10 кликов', target: 10, reward: 100},
-            {id: 'first_100_coins', name: 'Богач', desc: 'Заработать 100 монет', target: 100, reward: 500},
-            {id: 'first_upgrade', name: 'Улучшатель', desc: 'Купить первое улучшение', target: 1, reward: 1000},
-            {id: 'first_autoclicker', name: 'Автоматизатор', desc: 'Купить первый автокликер', target: 1, reward: 2000},
-            {id: 'grade_1', name: 'Серебряный', desc: 'Достигнуть серебряного грейда', target: 1, reward: 5000},
-            {id: 'daily_streak_3', name: 'Постоянный', desc: '3 дня подряд заходить в игру', target: 3, reward: 10000},
-            {id: 'millionaire', name: 'Миллионер', desc: 'Заработать 1,000,000 монет', target: 1000000, reward: 50000},
-            {id: 'click_master', name: 'Мастер клика', desc: '1000 кликов', target: 1000, reward: 5000}
-        ];
-        
         const grid = document.getElementById('achievementsGrid');
         if (!grid) return;
         
-        grid.innerHTML = achievements.map(ach => {
+        grid.innerHTML = this.achievementTypes.map(ach => {
             const data = this.achievements[ach.id] || {progress: 0, completed: false};
             const progress = Math.min(data.progress || 0, ach.target);
             const percent = (progress / ach.target) * 100;
@@ -791,44 +1154,59 @@ class CoinClickerGame {
         }).join('');
     }
     
+    // Те же статистики, что STATS в achievements.py; серия дней известна только серверу
+    achievementStats() {
+        return {
+            total_clicks: this.totalClicks,
+            total_earned: this.totalEarned,
+            current_grade: this.currentGrade,
+            upgrades: Object.values(this.upgrades).reduce((a, b) => a + b, 0),
+            autoclickers: Object.values(this.autoclickers).reduce((a, b) => a + b.quantity, 0)
+        };
+    }
+    
+    // Локальная проверка — для мгновенного уведомления; разблокировки записывает сервер
     updateAchievements() {
-        const achievementsToUpdate = [
-            {id: 'first_click', progress: this.totalClicks, target: 10},
-            {id: 'first_100_coins', progress: this.totalEarned, target: 100},
-            {id: 'first_upgrade', progress: Object.values(this.upgrades).reduce((a, b) => a + b, 0), target: 1},
-            {id: 'first_autoclicker', progress: Object.values(this.autoclickers).reduce((a, b) => a + b.quantity, 0), target: 1},
-            {id: 'grade_1', progress: this.currentGrade >= 1 ? 1 : 0, target: 1},
-            {id: 'click_master', progress: this.totalClicks, target: 1000}
-        ];
-        
-        achievementsToUpdate.forEach(({id, progress, target}) => {
-            if (!this.achievements[id]) {
-                this.achievements[id] = {progress: 0, completed: false};
+        const stats = this.achievementStats();
+        
+        this.achievementTypes.forEach(ach => {
+            if (stats[ach.stat] === undefined) return;
+            if (!this.achievements[ach.id]) {
+                this.achievements[ach.id] = {progress: 0, completed: false};
             }
             
-            this.achievements[id].progress = Math.max(this.achievements[id].progress, progress);
+            const data = this.achievements[ach.id];
+            data.progress = Math.max(data.progress, Math.min(stats[ach.stat], ach.target));
             
-            if (!this.achievements[id].completed && this.achievements[id].progress >= target) {
-                this.achievements[id].completed = true;
-                this.coins += achievementsToUpdate.find(a => a.id === id)?.reward || 1000;
-                this.showNotification(`🏆 Достижение разблокировано! +${(achievementsToUpdate.find(a => a.id === id)?.reward || 1000)} 🪙`);
+            if (!data.completed && data.progress >= ach.target) {
+                this.completeAchievement(ach);
+            }
+        });
+    }
+    
+    // Награда начисляется один раз: при локальной разблокировке или по событию сервера
+    completeAchievement(ach) {
+        this.achievements[ach.id] = {progress: ach.target, completed: true};
+        this.coins += ach.reward;
+        this.showNotification(`🏆 Достижение разблокировано! +${this.formatNumber(ach.reward)} 🪙`);
+    }
+    
+    onPushAchievement(data) {
+        data.unlocked.forEach(id => {
+            const ach = this.achievementTypes.find(a => a.id === id);
+            if (ach && !this.achievements[id]?.completed) {
+                this.completeAchievement(ach);
             }
         });
+        this.loadAchievements();
+        this.updateUI();
     }
     
     loadDailyRewards() {
         const track = document.getElementById('rewardsTrack');
         if (!track) return;
         
-        const rewards = [
-            {day: 1, coins: 100, gems: 1},
-            {day: 2, coins: 250, gems: 2},
-            {day: 3, coins: 500, gems: 3},
-            {day: 4, coins: 1000, gems: 5},
-            {day: 5, coins: 2500, gems: 8},
-            {day: 6, coins: 5000, gems: 13},
-            {day: 7, coins: 10000, gems: 21, tokens: 1}
-        ];
+        const rewards = this.config.daily.rewards.map((reward, index) => ({day: index + 1, ...reward}));
         
         track.innerHTML = rewards.map(reward => `
             <div class="reward-day">
@@ -873,31 +1251,65 @@ class CoinClickerGame {
     }
     
     async updateLeaderboard(category) {
+        this.leaderboardCategory = category;
+        
+        // Пока открыт push-канал, кэш топа актуален — повторно не скачиваем
+        const cached = this.leaderboards[category];
+        if (cached && this.pushConnected) {
+            this.renderLeaderboard(category, cached.players);
+            return;
+        }
+        
         try {
+            // player_id — ключ ограничения частоты запросов на сервере
             const response = await fetch(`/api/leaderboard/${category}`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
             const players = await response.json();
             
-            const content = document.getElementById('leaderboardContent');
-            if (!content) return;
-            
-            content.innerHTML = players.map((player, index) => `
-                <div class="leaderboard-item ${player.player_id === this.playerId ? 'highlight' : ''}">
-                    <div class="leaderboard-rank ${index < 3 ? `rank-${index + 1}` : ''}">
-                        ${index + 1}
+            const version = response.headers.get('X-Leaderboard-Version');
+            if (version && this.pushConnected) {
+                this.leaderboards[category] = {version: Number(version), players: players};
+            }
+            if (this.leaderboardCategory === category) {
+                this.renderLeaderboard(category, players);
+            }
+        } catch (error) {
+            console.error('Ошибка лидерборда:', error);
+        }
+    }
+    
+    renderLeaderboard(category, players) {
+        const content = document.getElementById('leaderboardContent');
+        if (!content) return;
+        
+        content.innerHTML = players.map((player, index) => `
+            <div class="leaderboard-item ${player.player_id === this.playerId ? 'highlight' : ''}">
+                <div class="leaderboard-rank ${index < 3 ? `rank-${index + 1}` : ''}">
+                    ${index + 1}
+                </div>
+                <div class="leaderboard-player">
+                    <div class="player-name">${player.username} ${player.player_id === this.playerId ? '(Вы)' : ''}</div>
+                    <div class="player-stats">
+                        ${category === 'total' ? `💎 ${this.formatNumber(player.total_score)}` : ''}
+                        ${category === 'coins' ? `💰 ${this.formatNumber(player.coins_score)}` : ''}
+                        ${category === 'grade' ? `🏆 ${player.grade_score} грейд` : ''}
+                        ${category === 'clicks' ? `👆 ${this.formatNumber(player.total_clicks || 0)}` : ''}
                     </div>
+                </div>
+            </div>
+        `).join('');
+        
+        const rank = this.playerRank;
+        if (rank && rank.category === category && rank.rank && !players.some(p => p.player_id === this.playerId)) {
+            content.innerHTML += `
+                <div class="leaderboard-item highlight">
+                    <div class="leaderboard-rank">${rank.rank}</div>
                     <div class="leaderboard-player">
-                        <div class="player-name">${player.username} ${player.player_id === this.playerId ? '(Вы)' : ''}</div>
-                        <div class="player-stats">
-                            ${category === 'total' ? `💎 ${this.formatNumber(player.total_score)}` : ''}
-                            ${category === 'coins' ? `💰 ${this.formatNumber(player.coins_score)}` : ''}
-                            ${category === 'grade' ? `🏆 ${player.grade_score} грейд` : ''}
-                            ${category === 'clicks' ? `👆 ${this.formatNumber(player.total_clicks || 0)}` : ''}
-                        </div>
+                        <div class="player-name">${this.username} (Вы)</div>
+                        <div class="player-stats">из ${rank.total}</div>
                     </div>
                 </div>
-            `).join('');
-        } catch (error) {
-            console.error('Ошибка лидерборда:', error);
+            `;
         }
     }
     
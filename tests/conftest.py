@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# app.py читает настройки при импорте: отдельная база и без фоновых снимков/лимитов
+os.environ['DB_FILE'] = os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ['BACKUP_INTERVAL'] = '0'
+os.environ['RATE_LIMIT_ENABLED'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
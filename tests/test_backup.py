@@ -0,0 +1,133 @@
+import os
+import shutil
+import sqlite3
+import threading
+
+import pytest
+
+import backup
+import migrations
+
+
+def make_db(path, players=200):
+    migrations.migrate(path)
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO players (player_id, username, coins) VALUES (?, ?, ?)',
+                     [(f'p{n}', 'x' * 200, n) for n in range(players)])
+    conn.commit()
+    conn.close()
+
+
+def player_count(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM players').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_snapshot_is_complete_single_file(tmp_path):
+    db = str(tmp_path / 'game.db')
+    make_db(db)
+    info = backup.BackupScheduler(db, str(tmp_path / 'backups')).snapshot()
+
+    assert os.path.basename(info['path']).startswith('game-')
+    assert backup.latest(str(tmp_path / 'backups'), db) == info['path']
+    assert player_count(info['path']) == 200
+    # Снимок в обычном журнале: без -wal рядом
+    assert not os.path.exists(info['path'] + '-wal')
+    conn = sqlite3.connect(info['path'])
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    conn.close()
+
+
+# Запись с другого соединения во время пошагового копирования не перезапускает его
+def test_snapshot_does_not_restart_under_concurrent_writes(tmp_path):
+    db = str(tmp_path / 'game.db')
+    make_db(db, players=2000)
+    scheduler = backup.BackupScheduler(db, str(tmp_path / 'backups'), step_pages=4, step_sleep=0.002)
+
+    stop = threading.Event()
+    writes = []
+
+    def writer():
+        conn = sqlite3.connect(db, isolation_level=None)
+        conn.execute('PRAGMA journal_mode = WAL')
+        while not stop.is_set():
+            conn.execute('UPDATE players SET coins = coins + 1 WHERE player_id = ?', (f'p{len(writes) % 2000}',))
+            writes.append(1)
+        conn.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        info = scheduler.snapshot()
+    finally:
+        stop.set()
+        thread.join()
+
+    assert writes
+    assert info['restarts'] == 0
+    assert player_count(info['path']) == 2000
+
+
+def test_prune_keeps_latest_snapshots(tmp_path):
+    db = str(tmp_path / 'game.db')
+    directory = str(tmp_path / 'backups')
+    make_db(db)
+    scheduler = backup.BackupScheduler(db, directory, keep=2)
+    info = scheduler.snapshot()
+    # Более старые снимки и остаток прерванной копии
+    for stamp in ('20200101-000000', '20200102-000000', '20200103-000000'):
+        shutil.copy(info['path'], os.path.join(directory, f'game-{stamp}.db'))
+    open(os.path.join(directory, 'game-20200104-000000.db.tmp'), 'w').close()
+
+    assert scheduler.prune() == 3
+    assert backup.snapshots(directory, db) == [os.path.join(directory, 'game-20200103-000000.db'), info['path']]
+    assert not os.path.exists(os.path.join(directory, 'game-20200104-000000.db.tmp'))
+
+
+def test_restore_at_startup_restores_missing_database(tmp_path):
+    db = str(tmp_path / 'game.db')
+    directory = str(tmp_path / 'backups')
+    make_db(db)
+    info = backup.BackupScheduler(db, directory).snapshot()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db + suffix):
+            os.remove(db + suffix)
+    # Осиротевший -wal от прежней базы не должен смешаться с восстановленной
+    open(db + '-wal', 'wb').close()
+
+    assert backup.restore_at_startup(db, 'latest', directory) == info['path']
+    assert player_count(db) == 200
+    assert not os.path.exists(db + '-wal') or os.path.getsize(db + '-wal') == 0
+
+
+def test_restore_at_startup_keeps_existing_database(tmp_path):
+    db = str(tmp_path / 'game.db')
+    directory = str(tmp_path / 'backups')
+    make_db(db, players=10)
+    backup.BackupScheduler(db, directory).snapshot()
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO players (player_id) VALUES ('new')")
+    conn.commit()
+    conn.close()
+
+    assert backup.restore_at_startup(db, 'latest', directory) is None
+    assert player_count(db) == 11
+
+
+def test_restore_at_startup_without_snapshots(tmp_path):
+    db = str(tmp_path / 'game.db')
+
+    assert backup.restore_at_startup(db, 'latest', str(tmp_path / 'backups')) is None
+    assert not os.path.exists(db)
+
+
+def test_restore_rejects_damaged_snapshot(tmp_path):
+    damaged = str(tmp_path / 'game-20200101-000000.db')
+    with open(damaged, 'wb') as f:
+        f.write(b'not a database' * 100)
+
+    with pytest.raises(sqlite3.DatabaseError):
+        backup.restore(damaged, str(tmp_path / 'game.db'))
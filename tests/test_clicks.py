@@ -0,0 +1,79 @@
+import pytest
+
+import app
+import clicks
+
+NOW_MS = 1_800_000_000_000
+
+
+def validate(windows, clicks_until=0, crit_chance=0.05, max_rate=25):
+    return clicks.validate_windows(windows, clicks_until, NOW_MS, crit_chance, max_rate)
+
+
+def test_validate_windows_accepts_consecutive_windows():
+    windows = [[NOW_MS - 2000, 1000, 10, 0], [NOW_MS - 1000, 1000, 12, 1]]
+    accepted, rejected, cursor = validate(windows)
+
+    assert accepted == [tuple(window) for window in windows]
+    assert rejected == 0
+    assert cursor == NOW_MS
+
+
+def test_validate_windows_rejects_replayed_and_overlapping_windows():
+    windows = [[NOW_MS - 2000, 1000, 5, 0], [NOW_MS - 1500, 1000, 5, 0]]
+    accepted, rejected, cursor = validate(windows, clicks_until=NOW_MS - 3000)
+    assert len(accepted) == 1 and rejected == 1
+
+    # Та же пачка повторно: все окна раньше clicks_until
+    accepted, rejected, _ = validate(windows, clicks_until=cursor)
+    assert accepted == [] and rejected == 2
+
+
+@pytest.mark.parametrize('window', [
+    [NOW_MS - 1000, 1000, 26, 0],            # быстрее max_rate
+    [NOW_MS - 1000, 1000, 20, 20],           # критов больше допустимого
+    [NOW_MS - 1000, 1000, 5, 6],             # критов больше кликов
+    [NOW_MS - 1000, 0, 1, 0],                # пустая длительность
+    [NOW_MS - 1000, clicks.MAX_WINDOW_MS + 1, 1, 0],
+    [NOW_MS + clicks.CLOCK_SKEW_MS, 1000, 1, 0],   # из будущего
+])
+def test_validate_windows_rejects_implausible_window(window):
+    accepted, rejected, cursor = validate([window])
+
+    assert accepted == [] and rejected == 1
+    assert cursor == 0
+
+
+def test_validate_windows_counts_windows_over_limit_as_rejected():
+    start = NOW_MS - (clicks.MAX_WINDOWS + 10) * 1000
+    windows = [[start + i * 1000, 1000, 1, 0] for i in range(clicks.MAX_WINDOWS + 10)]
+    accepted, rejected, _ = validate(windows)
+
+    assert len(accepted) == clicks.MAX_WINDOWS
+    assert rejected == 10
+
+
+@pytest.mark.parametrize('windows', [
+    {'start': 0},
+    'windows',
+    [[NOW_MS, 1000, 1]],
+    [[NOW_MS, 1000, 1, 0.5]],
+    [[NOW_MS, 1000, True, 0]],
+    [None],
+    ['1234'],
+])
+def test_validate_windows_rejects_malformed_batch(windows):
+    with pytest.raises(ValueError):
+        validate(windows)
+
+
+def test_clicks_route_answers_400_to_malformed_batch():
+    client = app.app.test_client()
+    client.get('/api/player/bad_clicks')
+
+    response = client.post('/api/clicks', json={'player_id': 'bad_clicks', 'windows': {'0': [1, 2, 3, 4]}})
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+    response = client.post('/api/save', json={'player_id': 'bad_clicks', 'clicks': [['a', 1000, 1, 0]]})
+    assert response.status_code == 400
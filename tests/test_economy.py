@@ -0,0 +1,45 @@
+import pytest
+
+import economy
+
+
+# На последнем грейде повышений нет: доход — cps * бонус грейда * множители
+def top_grade_state():
+    return {'coins': 0, 'gems': 0, 'total_earned': 0, 'current_grade': economy.MAX_GRADE, 'grade_progress': 0}
+
+
+def test_settle_income_applies_boost_only_while_active():
+    bonus = economy.GRADE_BONUSES[economy.MAX_GRADE]
+    settled = economy.settle_income(top_grade_state(), 1.0, [(2.0, 50, 80)], 0, 100)
+
+    assert settled['earned'] == pytest.approx(bonus * (100 + 30))
+    assert settled['coins'] == pytest.approx(settled['earned'])
+
+
+def test_settle_income_ignores_boosts_outside_interval():
+    bonus = economy.GRADE_BONUSES[economy.MAX_GRADE]
+    boosts = [(2.0, 0, 100), (3.0, 300, 400)]
+    settled = economy.settle_income(top_grade_state(), 1.0, boosts, 100, 200)
+
+    assert settled['earned'] == pytest.approx(bonus * 100)
+
+
+def test_settle_income_boost_without_start_counts_from_since():
+    bonus = economy.GRADE_BONUSES[economy.MAX_GRADE]
+    settled = economy.settle_income(top_grade_state(), 1.0, [(2.0, None, 150)], 100, 200)
+
+    assert settled['earned'] == pytest.approx(bonus * (100 + 50))
+
+
+def test_settle_income_grade_up_matches_stepwise_earnings():
+    state = {'coins': 0, 'gems': 0, 'total_earned': 0, 'current_grade': 0, 'grade_progress': 0}
+    settled = economy.settle_income(state, 50.0, [], 0, 600)
+
+    # Как поштучное начисление по секундам (add_earnings), с точностью до шага
+    stepwise = dict(state)
+    for _ in range(600):
+        rate = 50.0 * economy.GRADE_BONUSES[stepwise['current_grade']]
+        stepwise = economy.add_earnings(stepwise, rate)
+
+    assert settled['current_grade'] == stepwise['current_grade'] > 0
+    assert settled['gems'] == stepwise['gems']
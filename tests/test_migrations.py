@@ -0,0 +1,15 @@
+import os
+
+import migrations
+
+
+def test_clicks_category_uses_index(tmp_path):
+    path = os.path.join(tmp_path, 'schema.db')
+    migrations.migrate(path)
+    conn = migrations.connect(path)
+    sql = migrations.report_queries(migrations.LATEST_VERSION)['leaderboard_clicks']
+    plan = ' '.join(row['detail'] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}'))
+    conn.close()
+
+    assert 'idx_players_clicks' in plan
+    assert 'TEMP B-TREE' not in plan
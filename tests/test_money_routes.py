@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+import app
+
+
+# Игрок с автокликером, давно не заходивший: загрузка досчитает офлайн-доход
+# и положит coins/gems из снимка в буфер сохранений
+def offline_player(player_id, gems, idle=60, coins=0):
+    client = app.app.test_client()
+    client.get(f'/api/player/{player_id}')
+    app.save_buffer.flush()
+
+    def setup(conn):
+        conn.execute('UPDATE players SET coins = ?, gems = ?, last_active = ? WHERE player_id = ?',
+                     (coins, gems, int(time.time()) - idle, player_id))
+        conn.execute('INSERT OR REPLACE INTO autoclickers (player_id, clicker_id, quantity, level) VALUES (?, ?, 1, 1)',
+                     (player_id, 'basic'))
+    app.run_write(setup)
+    app.player_cache.invalidate(player_id)
+
+
+def read_balance(player_id):
+    app.save_buffer.flush()
+    with app.db_pool.connection() as conn:
+        return conn.execute('SELECT coins, gems FROM players WHERE player_id = ?', (player_id,)).fetchone()
+
+
+# Маршрут в потоке route_thread; пока он стоит сразу после сброса буфера,
+# другой поток загружает игрока (офлайн-досчет пишет coins/gems в буфер)
+def race_with_settle(monkeypatch, player_id, route):
+    flush = app.save_buffer.flush
+    flushed = threading.Event()
+
+    def slow_flush(*args, **kwargs):
+        result = flush(*args, **kwargs)
+        if threading.current_thread().name == 'route_thread':
+            flushed.set()
+            time.sleep(0.3)
+        return result
+    monkeypatch.setattr(app.save_buffer, 'flush', slow_flush)
+
+    results = {}
+    thread = threading.Thread(target=lambda: results.update(route=route()), name='route_thread')
+    thread.start()
+    assert flushed.wait(5)
+    settled = app.app.test_client().get(f'/api/player/{player_id}').get_json()
+    thread.join()
+    monkeypatch.setattr(app.save_buffer, 'flush', flush)
+    return results['route'], settled
+
+
+def test_activate_boost_with_concurrent_settle_keeps_gems_spent(monkeypatch):
+    offline_player('boost_race', gems=50)
+    boost = app.game_registry.boosts['x2_1h']
+
+    result, settled = race_with_settle(monkeypatch, 'boost_race', lambda: app.app.test_client().post(
+        '/api/activate_boost', json={'player_id': 'boost_race', 'boost_id': 'x2_1h'}).get_json())
+
+    assert result['success']
+    assert settled['coins'] > 0
+    assert read_balance('boost_race')['gems'] == pytest.approx(50 - boost['gems'])
+
+
+def test_claim_daily_with_concurrent_settle_keeps_reward(monkeypatch):
+    offline_player('daily_race', gems=0)
+
+    result, settled = race_with_settle(monkeypatch, 'daily_race', lambda: app.app.test_client().post(
+        '/api/claim_daily', json={'player_id': 'daily_race'}).get_json())
+
+    assert result['success']
+    assert settled['coins'] >= result['new_balance']['coins']
+    assert read_balance('daily_race')['coins'] >= result['reward']['coins']
+
+
+# Доход автокликера с последнего сохранения еще не в базе: покупка должна его учесть
+def test_buy_batch_counts_income_since_last_save():
+    # 40 монет в базе + 20 дохода за 200 с: хватает на улучшение за 50
+    offline_player('buy_idle', gems=0, idle=200, coins=40)
+
+    result = app.app.test_client().post('/api/buy_batch', json={
+        'player_id': 'buy_idle', 'purchases': [{'type': 'click', 'id': 'click_power'}]
+    }).get_json()
+
+    assert result['success']
+    assert result['new_balance']['coins'] == pytest.approx(40 + 200 * 0.1 - 50, abs=0.2)
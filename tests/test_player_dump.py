@@ -0,0 +1,85 @@
+import sqlite3
+
+import pytest
+
+import migrations
+import player_dump
+
+
+def connect(path):
+    migrations.migrate(path)
+    return sqlite3.connect(path, isolation_level=None)
+
+
+def seed(conn):
+    for n in range(5):
+        player_id = f'p{n}'
+        conn.execute('INSERT INTO players (player_id, username, coins, total_clicks) VALUES (?, ?, ?, ?)',
+                     (player_id, f'Игрок {n}', n * 10.5, n))
+        conn.execute('INSERT INTO upgrades (player_id, upgrade_id, level) VALUES (?, ?, ?)', (player_id, 'click_power', n))
+        conn.execute('INSERT INTO autoclickers (player_id, clicker_id, quantity, level) VALUES (?, ?, ?, 1)',
+                     (player_id, 'basic', n + 1))
+        conn.execute('INSERT INTO active_boosts (player_id, boost_id, multiplier, started_at, ends_at) VALUES (?, ?, 2.0, ?, ?)',
+                     (player_id, 'x2_1h', 1000, 4600))
+        conn.execute('INSERT INTO leaderboard (player_id, username, total_score) VALUES (?, ?, ?)',
+                     (player_id, f'Игрок {n}', n * 100.0))
+    # Игрок без дочерних строк
+    conn.execute("INSERT INTO players (player_id, username) VALUES ('solo', 'Один')")
+
+
+def contents(conn):
+    return {
+        table: sorted(tuple(row) for row in conn.execute(f'SELECT * FROM {table}'))
+        for table in player_dump.TABLES
+    }
+
+
+def target_columns(conn):
+    return {table: set(player_dump.table_columns(conn, table)) for table in player_dump.TABLES}
+
+
+@pytest.mark.parametrize('fmt', player_dump.FORMATS)
+def test_export_import_round_trip(tmp_path, fmt):
+    source = connect(str(tmp_path / 'source.db'))
+    seed(source)
+    lines = list(player_dump.export_lines(source, fmt, chunk=2))
+
+    target = connect(str(tmp_path / 'target.db'))
+    committed = []
+    stats = player_dump.import_lines(lines, player_dump.local_writer(target), target_columns(target),
+                                     batch=4, on_commit=lambda ids: committed.append(set(ids)))
+
+    assert contents(target) == contents(source)
+    assert stats['players'] == 6
+    assert stats['batches'] > 1
+    assert set().union(*committed) == {f'p{n}' for n in range(5)} | {'solo'}
+
+
+# Колонки выгрузки, которых нет в целевой схеме, отбрасываются
+def test_import_skips_columns_missing_in_target(tmp_path):
+    source = connect(str(tmp_path / 'source.db'))
+    seed(source)
+    lines = list(player_dump.export_lines(source, 'players'))
+
+    target = connect(str(tmp_path / 'target.db'))
+    columns = target_columns(target)
+    columns['active_boosts'].discard('started_at')
+    player_dump.import_lines(lines, player_dump.local_writer(target), columns)
+
+    rows = target.execute('SELECT started_at, ends_at FROM active_boosts').fetchall()
+    assert len(rows) == 5
+    assert all(started_at is None and ends_at == 4600 for started_at, ends_at in rows)
+
+
+def test_import_rejects_foreign_file(tmp_path):
+    target = connect(str(tmp_path / 'target.db'))
+
+    with pytest.raises(ValueError):
+        player_dump.import_lines(['{"format": "other"}\n'], player_dump.local_writer(target), target_columns(target))
+
+
+def test_export_rejects_unknown_format(tmp_path):
+    source = connect(str(tmp_path / 'source.db'))
+
+    with pytest.raises(ValueError):
+        list(player_dump.export_lines(source, 'csv'))
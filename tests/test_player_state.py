@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+import app
+
+
+# Сброс буфера между чтением базы и save_buffer.get: снимок из базы уже старый,
+# а в буфере сохранения больше нет — оно должно быть взято до чтения базы
+def test_load_player_keeps_save_flushed_during_load(monkeypatch):
+    client = app.app.test_client()
+    client.get('/api/player/load_race')
+    app.save_buffer.flush()
+    client.post('/api/save', json={'player_id': 'load_race', 'username': 'Хомяк'})
+
+    read = app.load_snapshot
+
+    def read_then_flush(conn, player_id):
+        snapshot = read(conn, player_id)
+        app.save_buffer.flush()
+        return snapshot
+    monkeypatch.setattr(app, 'load_snapshot', read_then_flush)
+
+    assert app.load_player('load_race')['username'] == 'Хомяк'
+
+
+def new_player(player_id):
+    client = app.app.test_client()
+    client.get(f'/api/player/{player_id}')
+    app.save_buffer.flush()
+    return client
+
+
+def finished_window(clicks, seconds_ago=3):
+    start = (int(time.time()) - seconds_ago) * 1000
+    return [start, 1000, clicks, 0]
+
+
+# Баланс и счетчик кликов из сохранения не принимаются: их ведет сервер
+def test_save_ignores_client_balance_and_clicks():
+    client = new_player('save_cheat')
+
+    result = client.post('/api/save', json={
+        'player_id': 'save_cheat', 'username': 'Хомяк', 'coins': 1e12, 'gems': 1e6, 'total_clicks': 10 ** 6
+    }).get_json()
+
+    assert result['success']
+    assert result['balance']['coins'] == 0
+    assert result['balance']['gems'] == 10
+    assert result['balance']['total_clicks'] == 0
+    assert app.load_player('save_cheat')['username'] == 'Хомяк'
+
+
+def test_clicks_are_the_only_source_of_click_income():
+    client = new_player('click_income')
+
+    result = client.post('/api/clicks', json={'player_id': 'click_income', 'windows': [finished_window(10)]}).get_json()
+    assert result['accepted'] == 1
+    assert result['balance']['total_clicks'] == 10
+
+    # Награда за достижение first_click (10 кликов) — тоже на сервере, в той же записи
+    reward = app.achievement_index.definitions['first_click']['reward']
+    assert result['balance']['coins'] == pytest.approx(result['gain'] + reward)
+
+    client.post('/api/save', json={'player_id': 'click_income', 'total_clicks': 1000})
+    assert app.load_player('click_income')['total_clicks'] == 10
+
+
+def test_save_credits_passive_income_since_last_active():
+    client = new_player('save_idle')
+
+    def setup(conn):
+        conn.execute('UPDATE players SET last_active = ? WHERE player_id = ?', (int(time.time()) - 100, 'save_idle'))
+        conn.execute("INSERT INTO autoclickers (player_id, clicker_id, quantity, level) VALUES ('save_idle', 'basic', 1, 1)")
+    app.run_write(setup)
+    app.player_cache.invalidate('save_idle')
+
+    result = client.post('/api/save', json={'player_id': 'save_idle', 'username': 'Игрок'}).get_json()
+    assert result['balance']['coins'] == pytest.approx(100 * 0.1, abs=0.2)
+
+    # Повторное сохранение ничего не добавляет: доход уже досчитан до last_active
+    again = client.post('/api/save', json={'player_id': 'save_idle', 'username': 'Игрок'}).get_json()
+    assert again['balance']['coins'] == pytest.approx(result['balance']['coins'], abs=0.2)
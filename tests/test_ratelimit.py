@@ -0,0 +1,68 @@
+import pytest
+
+import app
+import launcher
+import ratelimit
+
+
+def test_token_buckets_allow_burst_then_refill_at_rate():
+    buckets = ratelimit.TokenBuckets({'save': (2, 3)})
+
+    assert [buckets.take('save', 'p1', now=0) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('save', 'p1', now=0) == pytest.approx(0.5)
+    # Через 0.5 с — один новый токен
+    assert buckets.take('save', 'p1', now=0.5) == 0
+    assert buckets.take('save', 'p1', now=0.5) > 0
+
+
+def test_token_buckets_keep_groups_and_keys_apart():
+    buckets = ratelimit.TokenBuckets({'save': (1, 1), 'clicks': (1, 1)})
+
+    assert buckets.take('save', 'p1', now=0) == 0
+    assert buckets.take('save', 'p2', now=0) == 0
+    assert buckets.take('clicks', 'p1', now=0) == 0
+    assert buckets.take('save', 'p1', now=0) > 0
+
+    metrics = buckets.metrics()
+    assert metrics['allowed'] == 3 and metrics['rejected_save'] == 1
+
+
+def test_token_buckets_evict_least_recent_keys():
+    buckets = ratelimit.TokenBuckets({'save': (1, 1)}, max_keys=2)
+    for key in ('p1', 'p2', 'p3'):
+        buckets.take('save', key, now=0)
+
+    metrics = buckets.metrics()
+    assert metrics['keys'] == 2 and metrics['evictions'] == 1
+    # Корзина p1 вытеснена: снова полная
+    assert buckets.take('save', 'p1', now=0) == 0
+
+
+def test_parse_limits_overrides_known_groups():
+    limits = ratelimit.parse_limits('save=4:40, clicks=3')
+
+    assert limits['save'] == (4.0, 40.0)
+    assert limits['clicks'] == (3.0, 3.0)
+    assert limits['session'] == ratelimit.LIMITS['session']
+    with pytest.raises(ValueError):
+        ratelimit.parse_limits('unknown=1:1')
+
+
+# Смена player_id в запросе не дает новую корзину лидерборда
+def test_app_leaderboard_limit_ignores_player_id(monkeypatch):
+    monkeypatch.setattr(app, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setattr(app, 'rate_limiter', ratelimit.TokenBuckets(dict(ratelimit.LIMITS, leaderboard=(0.001, 2))))
+    client = app.app.test_client()
+
+    statuses = [client.get(f'/api/leaderboard/total?player_id=spoof{n}').status_code for n in range(3)]
+    assert statuses == [200, 200, 429]
+
+
+def test_launcher_leaderboard_limit_ignores_player_id(monkeypatch):
+    monkeypatch.setattr(launcher, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setattr(launcher, 'rate_limiter', ratelimit.TokenBuckets(dict(ratelimit.LIMITS, leaderboard=(0.001, 2))))
+    monkeypatch.setattr(launcher, 'merged_top', lambda category: {'category': category, 'players': []})
+    client = launcher.router.test_client()
+
+    statuses = [client.get(f'/api/leaderboard/total?player_id=spoof{n}').status_code for n in range(3)]
+    assert statuses == [200, 200, 429]